@@ -0,0 +1,368 @@
+"""End-to-end load benchmark for the model service and the execution gateway.
+
+By default this starts local stand-ins, so it runs on any Linux box (CI
+included) without a GPU, model downloads or docker:
+
+* the model service (src/models) serving a tiny seeded model (tiny_model.py),
+* a runner on a fake docker client (fake_docker.py) behind the real gateway.
+
+It then drives /generate_code/, /generate_code_stream, /execute_code/ and
+/execute_code_stream/ at each requested concurrency. Latency is reported as
+p50/p95/p99, along with time to first token (first stream chunk or first output
+frame), decode tokens/sec and completed requests (jobs) per second. Pass
+--model-url/--gateway-url to load running services instead.
+
+Save a run with --out and compare a later one against it with --baseline:
+
+    python scripts/bench_e2e.py --concurrency 1,8 --requests 64 --out before.json
+    python scripts/bench_e2e.py --concurrency 1,8 --requests 64 --baseline before.json
+
+Generation uses temperature 0 and a unique prompt per request (so response
+caches never hit). Stream tokens are counted as chunks: the model service
+sends one chunk per decoded token, except when a multi-byte character
+spans tokens.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SCENARIOS = ("generate", "generate_stream", "execute", "execute_stream")
+# Metrics compared against a baseline, and whether higher is better
+COMPARED = {
+    "jobs_per_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "ttft_p50_ms": False,
+    "ttft_p95_ms": False,
+    "tokens_per_s": True,
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn(args: list[str], cwd: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        args, cwd=cwd, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited during startup:\n{proc.stderr.read()}")
+        try:
+            if httpx.get(url + "/readyz", timeout=1).json().get("ready"):
+                return
+        except (httpx.HTTPError, ValueError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def start_stand_ins(args, workdir: str) -> tuple[str, str, list[subprocess.Popen]]:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import tiny_model
+
+    model_dir = tiny_model.build(os.path.join(workdir, "tiny-model"), hidden_size=args.hidden_size, layers=args.layers)
+    uvicorn = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--log-level", "warning"]
+    model_port, runner_port, gateway_port = free_port(), free_port(), free_port()
+    procs = []
+    try:
+        procs.append(spawn(
+            uvicorn + ["--port", str(model_port)],
+            os.path.join(BACKEND, "src", "models"),
+            {
+                "MODEL_NAMES": model_dir,
+                "MODEL_PRECONVERT": "0",
+                "MODEL_RESPONSE_CACHE_SIZE": "0",
+                "HF_HUB_OFFLINE": "1",
+                "PYTHONPATH": os.path.join(BACKEND, "src", "common"),
+            },
+        ))
+        procs.append(spawn(
+            [
+                sys.executable,
+                os.path.join(BACKEND, "scripts", "fake_docker.py"),
+                "--port", str(runner_port),
+                "--run-ms", str(args.run_ms),
+            ],
+            BACKEND,
+            # Fake sandboxes use no CPU, so capacity is set by worker count instead of the host's cores
+            {
+                "RUNNER_CPU_CAPACITY_MILLIS": str(500 * args.runner_workers),
+                "RUNNER_MEMORY_CAPACITY_MB": str(2048 * args.runner_workers),
+                "RUNNER_MAX_WORKERS": str(args.runner_workers),
+            },
+        ))
+        procs.append(spawn(
+            uvicorn + ["--port", str(gateway_port)],
+            os.path.join(BACKEND, "src", "execution"),
+            {
+                "RUNNER_BASE_URLS": f"http://127.0.0.1:{runner_port}",
+                "PYTHONPATH": os.path.join(BACKEND, "src", "common"),
+            },
+        ))
+        model_url, gateway_url = f"http://127.0.0.1:{model_port}", f"http://127.0.0.1:{gateway_port}"
+        wait_ready(model_url, procs[0], args.startup_timeout)
+        wait_ready(f"http://127.0.0.1:{runner_port}", procs[1], args.startup_timeout)
+        wait_ready(gateway_url, procs[2], args.startup_timeout)
+    except Exception:
+        stop(procs)
+        raise
+    return model_url, gateway_url, procs
+
+
+def stop(procs: list[subprocess.Popen]) -> None:
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+class Sample:
+    def __init__(self) -> None:
+        self.latency = 0.0
+        self.ttft: Optional[float] = None
+        self.tokens = 0
+        # Seconds from the first to the last token
+        self.decode = 0.0
+
+
+async def timed_stream(
+    client: httpx.AsyncClient, url: str, payload: dict, is_token: Optional[Callable[[str], bool]] = None
+) -> Sample:
+    """POST and read the body as it arrives: every chunk is a token, or every line ``is_token`` accepts."""
+    sample = Sample()
+    start = time.perf_counter()
+    last = start
+    async with client.stream("POST", url, json=payload) as resp:
+        resp.raise_for_status()
+        async for chunk in resp.aiter_bytes() if is_token is None else resp.aiter_lines():
+            if is_token is not None and not is_token(chunk):
+                continue
+            last = time.perf_counter()
+            if sample.ttft is None:
+                sample.ttft = last - start
+            sample.tokens += 1
+    sample.latency = time.perf_counter() - start
+    if sample.ttft is not None:
+        sample.decode = last - start - sample.ttft
+    return sample
+
+
+def is_output_frame(line: str) -> bool:
+    return bool(line) and json.loads(line)["type"] in ("stdout", "stderr", "output")
+
+
+def scenario_call(name: str, client: httpx.AsyncClient, args, model_url: str, gateway_url: str):
+    counter = iter(range(10**9))
+    # Fences in the random output must not end a request early: every one decodes max_new_tokens
+    generation = {
+        "max_new_tokens": args.max_new_tokens,
+        "temperature": 0,
+        "top_p": 1.0,
+        "stop_after_code_block": False,
+    }
+
+    async def generate() -> Sample:
+        payload = {"prompt": f"{args.prompt} #{next(counter)}", **generation}
+        start = time.perf_counter()
+        resp = await client.post(model_url + "/generate_code/", json=payload)
+        resp.raise_for_status()
+        sample = Sample()
+        sample.latency = time.perf_counter() - start
+        return sample
+
+    async def generate_stream() -> Sample:
+        payload = {"prompt": f"{args.prompt} #{next(counter)}", **generation}
+        return await timed_stream(client, model_url + "/generate_code_stream", payload)
+
+    async def execute() -> Sample:
+        start = time.perf_counter()
+        resp = await client.post(gateway_url + "/execute_code/", json={"code": args.code})
+        resp.raise_for_status()
+        if resp.json().get("exit_code") != 0:
+            raise RuntimeError(f"exit code {resp.json().get('exit_code')}")
+        sample = Sample()
+        sample.latency = time.perf_counter() - start
+        return sample
+
+    async def execute_stream() -> Sample:
+        return await timed_stream(client, gateway_url + "/execute_code_stream/", {"code": args.code}, is_output_frame)
+
+    return {
+        "generate": generate,
+        "generate_stream": generate_stream,
+        "execute": execute,
+        "execute_stream": execute_stream,
+    }[name]
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def load(call: Callable[[], Awaitable[Sample]], requests: int, concurrency: int) -> dict:
+    samples: list[Sample] = []
+    errors: list[str] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            try:
+                samples.append(await call())
+            except (httpx.HTTPError, RuntimeError, ValueError) as exc:
+                errors.append(str(exc) or type(exc).__name__)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = [s.latency * 1000 for s in samples]
+    result = {
+        "requests": requests,
+        "errors": len(errors),
+        "jobs_per_s": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+    }
+    ttfts = [s.ttft * 1000 for s in samples if s.ttft is not None]
+    if ttfts:
+        rates = [(s.tokens - 1) / s.decode for s in samples if s.tokens > 1 and s.decode > 0]
+        result.update({
+            "ttft_p50_ms": round(percentile(ttfts, 0.50), 2),
+            "ttft_p95_ms": round(percentile(ttfts, 0.95), 2),
+            "ttft_p99_ms": round(percentile(ttfts, 0.99), 2),
+            # Per-request decode rate after the first token, and tokens delivered across all requests
+            "tokens_per_s": round(statistics.median(rates), 1) if rates else 0.0,
+            "output_tokens_per_s": round(sum(s.tokens for s in samples) / elapsed, 1),
+        })
+    if errors:
+        result["first_error"] = errors[0][:200]
+    return result
+
+
+async def run_all(args, model_url: str, gateway_url: str) -> dict:
+    results = {}
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        for name in args.scenarios:
+            call = scenario_call(name, client, args, model_url, gateway_url)
+            # Warm connections, kernels and the sandbox pool before measuring
+            await load(call, args.warmup, args.warmup or 1)
+            for concurrency in args.concurrency:
+                key = f"{name}@{concurrency}"
+                results[key] = await load(call, args.requests, concurrency)
+                print(f"{key}: {json.dumps(results[key])}", file=sys.stderr)
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    lines = [f"baseline {baseline['meta'].get('commit')} -> current {current['meta'].get('commit')}"]
+    for key, result in current["results"].items():
+        old = baseline["results"].get(key)
+        if old is None:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            if metric not in result or not old.get(metric):
+                continue
+            change = (result[metric] - old[metric]) / old[metric] * 100
+            worse = change < 0 if higher_is_better else change > 0
+            flag = "  worse" if worse and abs(change) >= 5 else ""
+            lines.append(f"{key:<24} {metric:<14} {old[metric]:>10} -> {result[metric]:>10} ({change:+.1f}%){flag}")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-url", help="Running model service; starts the tiny stand-in when omitted")
+    parser.add_argument("--gateway-url", help="Running execution gateway; starts the fake-docker stack when omitted")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="Requests per scenario and concurrency level")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--prompt", default="Write a function that reverses a string")
+    parser.add_argument("--code", default="print('ok')")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--hidden-size", type=int, default=256, help="Stand-in model width")
+    parser.add_argument("--layers", type=int, default=4, help="Stand-in model depth")
+    parser.add_argument("--run-ms", type=float, default=50.0, help="Fake sandbox run time per program")
+    parser.add_argument("--runner-workers", type=int, default=16, help="Concurrent jobs on the fake runner")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--out", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="Earlier --out file to compare against")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+
+    procs: list[subprocess.Popen] = []
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        model_url, gateway_url = args.model_url, args.gateway_url
+        if not (model_url and gateway_url):
+            local_model, local_gateway, procs = start_stand_ins(args, workdir)
+            model_url, gateway_url = model_url or local_model, gateway_url or local_gateway
+        try:
+            results = asyncio.run(run_all(args, model_url.rstrip("/"), gateway_url.rstrip("/")))
+        finally:
+            stop(procs)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "stand_ins": not (args.model_url and args.gateway_url),
+            "requests": args.requests,
+            "max_new_tokens": args.max_new_tokens,
+            "model": {"hidden_size": args.hidden_size, "layers": args.layers} if not args.model_url else args.model_url,
+            "run_ms": args.run_ms if not args.gateway_url else None,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print("\n".join(compare(json.load(f), report)))
+
+
+if __name__ == "__main__":
+    main()
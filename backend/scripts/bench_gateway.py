@@ -0,0 +1,133 @@
+"""Load benchmark for gateway -> runner HTTP calls.
+
+Without --url, starts a stub runner on localhost and compares the old
+strategy (a new httpx.AsyncClient per request) with the shared, pooled
+UpstreamClient the gateway now uses. With --url, loads a running gateway's
+/execute_code/ endpoint instead.
+
+    python scripts/bench_gateway.py --requests 2000 --concurrency 64
+    python scripts/bench_gateway.py --url http://localhost:5000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "execution"))
+
+from upstream import UpstreamClient  # noqa: E402
+
+
+class StubRunner(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.delay:
+            time.sleep(self.delay)
+        body = json.dumps({"exit_code": 0, "logs": "ok\n", "duration_ms": int(self.delay * 1000)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(delay: float) -> ThreadingHTTPServer:
+    StubRunner.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubRunner)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def load(call, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal errors
+        async with sem:
+            start = time.perf_counter()
+            try:
+                await call()
+            except httpx.HTTPError:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0  # noqa: E731
+    return {
+        "req_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(pick(0.50), 2),
+        "p95_ms": round(pick(0.95), 2),
+        "p99_ms": round(pick(0.99), 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "errors": errors,
+    }
+
+
+async def compare(args) -> None:
+    server = start_stub(args.delay_ms / 1000)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    payload = {"code": "print('ok')"}
+
+    async def per_request():
+        async with httpx.AsyncClient(timeout=10) as client:
+            (await client.post(base + "/run", json=payload)).raise_for_status()
+
+    upstream = UpstreamClient(base, max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    upstream.start()
+
+    async def pooled():
+        (await upstream.post("/run", payload, timeout=10)).raise_for_status()
+
+    # Warm both paths so the first-connection cost doesn't skew either side
+    await load(per_request, args.concurrency, args.concurrency)
+    await load(pooled, args.concurrency, args.concurrency)
+    results = {
+        "per_request_client": await load(per_request, args.requests, args.concurrency),
+        "pooled_client": await load(pooled, args.requests, args.concurrency),
+    }
+    await upstream.aclose()
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+async def against_gateway(args) -> None:
+    async with httpx.AsyncClient(timeout=60, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+        async def call():
+            resp = await client.post(args.url.rstrip("/") + "/execute_code/", json={"code": "print('ok')"})
+            resp.raise_for_status()
+
+        print(json.dumps({"gateway": await load(call, args.requests, args.concurrency)}, indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Gateway base URL to load instead of the local comparison")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated runner time per request")
+    args = parser.parse_args()
+    asyncio.run(against_gateway(args) if args.url else compare(args))
+
+
+if __name__ == "__main__":
+    main()
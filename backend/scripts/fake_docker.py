@@ -0,0 +1,160 @@
+"""An in-memory stand-in for the docker SDK client, and a runner served on top of it.
+
+FakeDocker implements the calls RunnerService makes (containers, execs,
+archives, images) with fixed, configurable delays instead of real
+sandboxes. Every program "runs" for --run-ms and prints --output-lines lines
+spread over that time. The whole runner (queue, pool, watchdog, output
+framing, usage accounting) can then be benchmarked on a box without docker.
+
+    python scripts/fake_docker.py --port 5100 --run-ms 50
+"""
+import argparse
+import itertools
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+
+
+class FakeContainer:
+    def __init__(self, client: "FakeDocker", labels: dict) -> None:
+        self.client = client
+        self.id = uuid.uuid4().hex
+        self.short_id = self.id[:12]
+        self.labels = labels
+        self.attrs = {"State": {"OOMKilled": False, "Running": True}}
+        self.cpu_usec = 0
+
+    def put_archive(self, path: str, data: bytes) -> bool:
+        return True
+
+    def start(self) -> None:
+        pass
+
+    def wait(self, timeout=None) -> dict:
+        return {"StatusCode": 0}
+
+    def kill(self) -> None:
+        self.attrs["State"]["Running"] = False
+
+    def remove(self, force=False, v=False) -> None:
+        self.client.removed(self)
+
+    def reload(self) -> None:
+        pass
+
+    def exec_run(self, cmd, user=None):
+        # Resets and cgroup reads: report counters that grow by each job's run time
+        output = f"usage_usec {self.cpu_usec}\nnr_throttled 0\nthrottled_usec 0\noom_kill 0\n"
+        return types.SimpleNamespace(exit_code=0, output=output.encode())
+
+
+class FakeContainers:
+    def __init__(self, client: "FakeDocker") -> None:
+        self.client = client
+
+    def run(self, image=None, command=None, labels=None, **kwargs) -> FakeContainer:
+        return self.client.created(labels or {})
+
+    def create(self, image=None, command=None, labels=None, **kwargs) -> FakeContainer:
+        return self.client.created(labels or {})
+
+    def list(self, all=False, filters=None) -> list:
+        with self.client.lock:
+            return list(self.client.containers_by_id.values())
+
+
+class FakeImages:
+    def get(self, name: str):
+        return types.SimpleNamespace(id="sha256:" + uuid.uuid5(uuid.NAMESPACE_URL, name).hex, attrs={})
+
+    def pull(self, name: str):
+        return self.get(name)
+
+
+class FakeAPI:
+    def __init__(self, client: "FakeDocker") -> None:
+        self.client = client
+        self.execs: dict = {}
+        self._ids = itertools.count()
+
+    def exec_create(self, container_id: str, cmd, **kwargs) -> dict:
+        exec_id = f"exec-{next(self._ids)}"
+        self.execs[exec_id] = {"container": container_id, "Running": True, "ExitCode": None}
+        return {"Id": exec_id}
+
+    def exec_start(self, exec_id: str, stream=False, demux=False):
+        state = self.execs[exec_id]
+        yield from self.client.program_output()
+        container = self.client.containers_by_id.get(state["container"])
+        if container is not None:
+            container.cpu_usec += int(self.client.run_seconds * 1_000_000)
+        state.update(Running=False, ExitCode=0)
+
+    def exec_inspect(self, exec_id: str) -> dict:
+        state = self.execs.get(exec_id, {"Running": False, "ExitCode": 0})
+        if not state["Running"]:
+            self.execs.pop(exec_id, None)
+        return state
+
+    def attach(self, container_id: str, stream=False, logs=False, demux=False):
+        yield from self.client.program_output()
+
+
+class FakeDocker:
+    def __init__(self, *, run_ms: float = 50.0, create_ms: float = 100.0, output_lines: int = 5) -> None:
+        self.run_seconds = run_ms / 1000
+        self.create_seconds = create_ms / 1000
+        self.output_lines = max(1, output_lines)
+        self.lock = threading.Lock()
+        self.containers_by_id: dict = {}
+        self.containers = FakeContainers(self)
+        self.images = FakeImages()
+        self.api = FakeAPI(self)
+
+    def ping(self) -> bool:
+        return True
+
+    def created(self, labels: dict) -> FakeContainer:
+        time.sleep(self.create_seconds)
+        container = FakeContainer(self, labels)
+        with self.lock:
+            self.containers_by_id[container.id] = container
+        return container
+
+    def removed(self, container: FakeContainer) -> None:
+        with self.lock:
+            self.containers_by_id.pop(container.id, None)
+
+    def program_output(self):
+        pause = self.run_seconds / self.output_lines
+        for line in range(self.output_lines):
+            time.sleep(pause)
+            yield (f"line {line}\n".encode(), None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5100)
+    parser.add_argument("--run-ms", type=float, default=50.0, help="How long every program runs")
+    parser.add_argument("--create-ms", type=float, default=100.0, help="Container create time")
+    parser.add_argument("--output-lines", type=int, default=5)
+    args = parser.parse_args()
+
+    import docker
+    import uvicorn
+
+    client = FakeDocker(run_ms=args.run_ms, create_ms=args.create_ms, output_lines=args.output_lines)
+    docker.from_env = lambda: client
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "common"))
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "execution"))
+    import runner_app
+
+    uvicorn.run(runner_app.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
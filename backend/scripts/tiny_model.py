@@ -0,0 +1,81 @@
+"""Write a tiny, deterministic stand-in for the served model to a directory.
+
+The checkpoint is a randomly initialised Qwen2 (seeded, so every run and every
+commit gets the same weights) with a byte-level tokenizer and a Qwen-style chat
+template. ModelService loads it like any hub model when MODEL_NAMES points at
+the directory, so benchmarks exercise the real tokenizer, scheduler and decode
+loop without downloading anything.
+
+End-of-sequence logits are pinned to zero, so greedy decoding (temperature 0)
+never stops early and every request produces exactly max_new_tokens tokens.
+
+    python scripts/tiny_model.py /tmp/tiny-model --hidden-size 256 --layers 4
+"""
+import argparse
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast, Qwen2Config, Qwen2ForCausalLM
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+
+SPECIAL_TOKENS = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<|im_start|>{{ message['role'] }}\n{{ message['content'] }}<|im_end|>\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+
+def build_tokenizer() -> PreTrainedTokenizerFast:
+    byte_chars = bytes_to_unicode()
+    # One token per byte, no merges: ids 0-255 are the bytes, specials follow
+    vocab = {byte_chars[b]: b for b in range(256)}
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False, use_regex=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.add_special_tokens(SPECIAL_TOKENS)
+    fast = PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|im_end|>", pad_token="<|endoftext|>")
+    fast.chat_template = CHAT_TEMPLATE
+    return fast
+
+
+def build(path: str, *, hidden_size: int = 256, layers: int = 4, seed: int = 0) -> str:
+    tokenizer = build_tokenizer()
+    eos_id = tokenizer.convert_tokens_to_ids("<|im_end|>")
+    config = Qwen2Config(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=layers,
+        num_attention_heads=max(1, hidden_size // 64),
+        num_key_value_heads=max(1, hidden_size // 128),
+        max_position_embeddings=4096,
+        tie_word_embeddings=False,
+        bos_token_id=None,
+        eos_token_id=eos_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    torch.manual_seed(seed)
+    model = Qwen2ForCausalLM(config).eval()
+    with torch.no_grad():
+        # Random logits over the 256 byte tokens always include a positive one, so zero never wins
+        model.lm_head.weight[256:] = 0.0
+    model.save_pretrained(path, safe_serialization=True)
+    tokenizer.save_pretrained(path)
+    return path
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(build(args.path, hidden_size=args.hidden_size, layers=args.layers, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
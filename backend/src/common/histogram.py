@@ -0,0 +1,38 @@
+import bisect
+import math
+from typing import Optional, Sequence
+
+from exposition import format_labels, format_value
+
+
+# Seconds; spans a cached reply or a pooled hello-world (~ms) up to a full two-minute run
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Histogram:
+    """One histogram series; not locked, so callers sharing it across threads serialise access."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Non-cumulative; the last slot is +Inf
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def lines(self, name: str, labels: Optional[dict] = None) -> list[str]:
+        labels = labels or {}
+        out = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            out.append(f"{name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {cumulative}")
+        out.append(f"{name}_sum{format_labels(labels)} {format_value(round(self.total, 6))}")
+        out.append(f"{name}_count{format_labels(labels)} {cumulative}")
+        return out
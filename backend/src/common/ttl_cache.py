@@ -0,0 +1,173 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """TTL + LRU cache of JSON-serialisable values, with an optional on-disk tier.
+
+    Memory holds at most ``max_entries`` values. With ``disk_dir`` every
+    stored value is also written to its own file, so entries survive restarts
+    and memory evictions. The disk tier is bounded by ``max_disk_bytes``
+    (0 = unlimited): a write past it removes the least recently used files.
+    Expired files are removed when read and when the directory is scanned at
+    startup.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        disk_dir: Optional[str] = None,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.disk_bytes = 0
+        self.disk_evictions = 0
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        # Files on disk, least recently used first: key -> size in bytes
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if now - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store(key, entry)
+        return entry[1]
+
+    def put(self, key: str, value: Any) -> None:
+        entry = (time.time(), value)
+        with self._lock:
+            self.stores += 1
+            self._store(key, entry)
+        self._write_disk(key, entry)
+
+    def _store(self, key: str, entry: tuple[float, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _scan(self) -> None:
+        """Index files left by a previous process, dropping expired ones and trimming to the budget."""
+        now = time.time()
+        found = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    _remove(path)
+                    continue
+                found.append((stat.st_mtime, os.path.splitext(name)[0], stat.st_size))
+        with self._lock:
+            for _, key, size in sorted(found):
+                self._files[key] = size
+                self.disk_bytes += size
+            victims = self._over_budget()
+        self._remove_files(victims)
+
+    def _read_disk(self, key: str, now: float) -> Optional[tuple[float, Any]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            created, value = data["created"], data["value"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if now - created > self.ttl_seconds:
+            with self._lock:
+                self.disk_bytes -= self._files.pop(key, 0)
+            _remove(path)
+            return None
+        with self._lock:
+            if key in self._files:
+                self._files.move_to_end(key)
+        return created, value
+
+    def _write_disk(self, key: str, entry: tuple[float, Any]) -> None:
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        data = json.dumps({"created": entry[0], "value": entry[1]}, ensure_ascii=False).encode("utf-8")
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as exc:
+            logger.warning("Failed to persist cache entry: %s", exc)
+            return
+        with self._lock:
+            self.disk_bytes += len(data) - self._files.pop(key, 0)
+            self._files[key] = len(data)
+            victims = self._over_budget()
+        self._remove_files(victims)
+
+    def _over_budget(self) -> list[str]:
+        """Pop least recently used files until the tier fits; call with the lock held."""
+        victims = []
+        while self.max_disk_bytes and self.disk_bytes > self.max_disk_bytes and self._files:
+            key, size = self._files.popitem(last=False)
+            self.disk_bytes -= size
+            self.disk_evictions += 1
+            victims.append(key)
+        return victims
+
+    def _remove_files(self, keys: list[str]) -> None:
+        for key in keys:
+            _remove(self._disk_path(key))
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
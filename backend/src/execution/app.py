@@ -1,18 +1,35 @@
+import json
 import logging
 import os
-from typing import Optional
+from typing import AsyncIterator, Optional
 
 import httpx
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from schemas import CodeRequest
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from exposition import PROMETHEUS_CONTENT_TYPE, render_family
+from schemas import BatchRequest, CodeRequest
+from upstream import UpstreamClient
 
 
 logger = logging.getLogger("execution-service")
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
 RUNNER_BASE_URL = os.environ.get("RUNNER_BASE_URL", "http://runner:5100")
+# Comma-separated runner endpoints to balance across; defaults to RUNNER_BASE_URL alone
+RUNNER_BASE_URLS = [
+    url.strip() for url in os.environ.get("RUNNER_BASE_URLS", RUNNER_BASE_URL).split(",") if url.strip()
+]
+RUNNER_HEALTH_INTERVAL = float(os.environ.get("RUNNER_HEALTH_INTERVAL", "5"))
+# Attempts per submission, each on a different runner, when one refuses or is unreachable
+RUNNER_RETRY_ATTEMPTS = int(os.environ.get("RUNNER_RETRY_ATTEMPTS", "2"))
+RUNNER_HTTP_MAX_CONNECTIONS = int(os.environ.get("RUNNER_HTTP_MAX_CONNECTIONS", "100"))
+RUNNER_HTTP_MAX_KEEPALIVE = int(os.environ.get("RUNNER_HTTP_MAX_KEEPALIVE", "20"))
+# Keep below the runner's keep-alive timeout (uvicorn default 5s) so idle connections aren't reused after it closes them
+RUNNER_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("RUNNER_HTTP_KEEPALIVE_EXPIRY", "4"))
+RUNNER_HTTP_CONNECT_TIMEOUT = float(os.environ.get("RUNNER_HTTP_CONNECT_TIMEOUT", "2"))
+# How long a request may wait for a free pooled connection before failing with 502
+RUNNER_HTTP_POOL_TIMEOUT = float(os.environ.get("RUNNER_HTTP_POOL_TIMEOUT", "5"))
 
 app = FastAPI(title="Execution API")
 
@@ -34,6 +51,27 @@ app.add_middleware(
 Request/response models are defined in schemas.py to keep this file small.
 """
 
+upstream = UpstreamClient(
+    RUNNER_BASE_URLS,
+    max_connections=RUNNER_HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=RUNNER_HTTP_MAX_KEEPALIVE,
+    keepalive_expiry=RUNNER_HTTP_KEEPALIVE_EXPIRY,
+    connect_timeout=RUNNER_HTTP_CONNECT_TIMEOUT,
+    pool_timeout=RUNNER_HTTP_POOL_TIMEOUT,
+    max_attempts=RUNNER_RETRY_ATTEMPTS,
+    health_interval=RUNNER_HEALTH_INTERVAL,
+)
+
+
+@app.on_event("startup")
+async def start_upstream():
+    upstream.start_health_checks()
+
+
+@app.on_event("shutdown")
+async def close_upstream():
+    await upstream.aclose()
+
 
 @app.get("/")
 async def root():
@@ -48,50 +86,84 @@ async def healthz():
 @app.get("/readyz")
 async def readyz():
     # This service is stateless and ready if process is up
-    return {"ready": True}
+    return {"ready": True, "runners_healthy": upstream.healthy_count, "runners_total": len(upstream.runners)}
 
 
 @app.get("/metrics")
 async def metrics():
-    lines = [
-        "# HELP execution_gateway_up 1 if service is up",
-        "# TYPE execution_gateway_up gauge",
-        "execution_gateway_up {} 1",
-    ]
-    return "\n".join(lines) + "\n"
+    lines = render_family("execution_gateway_up", "gauge", "1 if service is up", [({}, 1)])
+    lines += upstream.metrics_lines()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def _upstream_error(resp: httpx.Response) -> HTTPException:
+    headers = {"Retry-After": resp.headers["Retry-After"]} if "Retry-After" in resp.headers else None
+    return HTTPException(status_code=resp.status_code, detail=resp.text, headers=headers)
 
 
 @app.post("/execute_code/")
 async def execute_code(request: CodeRequest):
     # Forward to runner synchronously and capture full output
-    url = f"{RUNNER_BASE_URL}/run"
     try:
-        async with httpx.AsyncClient(timeout=request.timeout_seconds + 5) as client:
-            resp = await client.post(url, json=request.model_dump())
-            if resp.status_code != 200:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
-            return resp.json()
+        resp = await upstream.post("/run", request.model_dump(), timeout=request.timeout_seconds + 5)
     except httpx.RequestError as exc:
         logger.exception("Runner request failed: %s", exc)
         raise HTTPException(status_code=502, detail="runner unavailable")
+    if resp.status_code != 200:
+        raise _upstream_error(resp)
+    return resp.json()
+
+
+async def _open_stream(endpoint: str, body: dict) -> httpx.Response:
+    """Open a streamed runner request, raising the runner's status (and Retry-After) before anything is sent."""
+    try:
+        resp = await upstream.open_stream(endpoint, body)
+    except httpx.RequestError as exc:
+        logger.exception("Runner stream failed: %s", exc)
+        raise HTTPException(status_code=502, detail="runner unavailable")
+    if resp.status_code != 200:
+        try:
+            await resp.aread()
+        finally:
+            await resp.aclose()
+        raise _upstream_error(resp)
+    return resp
+
+
+async def _relay(resp: httpx.Response, error_frame: dict) -> AsyncIterator[bytes]:
+    # Runner frames are passed through chunk by chunk, never re-buffered
+    try:
+        async for chunk in resp.aiter_bytes():
+            yield chunk
+    except httpx.RequestError as exc:
+        # Headers are already out; a runner lost mid-stream can only be reported in-band
+        logger.exception("Runner stream failed: %s", exc)
+        yield (json.dumps(error_frame) + "\n").encode()
+    finally:
+        await resp.aclose()
 
 
 @app.post("/execute_code_stream/")
 async def execute_code_stream(request: CodeRequest):
-    url = f"{RUNNER_BASE_URL}/run_stream"
+    resp = await _open_stream("/run_stream", request.model_dump())
+    return StreamingResponse(
+        _relay(resp, {"type": "error", "detail": "runner unavailable"}), media_type="application/x-ndjson"
+    )
 
-    async def stream():
-        try:
-            async with httpx.AsyncClient(timeout=None) as client:
-                async with client.stream("POST", url, json=request.model_dump()) as resp:
-                    if resp.status_code != 200:
-                        text = await resp.aread()
-                        raise HTTPException(status_code=resp.status_code, detail=text.decode("utf-8"))
-                    async for chunk in resp.aiter_bytes():
-                        yield chunk
-        except httpx.RequestError as exc:
-            logger.exception("Runner stream failed: %s", exc)
-            yield b"ERROR: runner unavailable\n"
-
-    return StreamingResponse(stream(), media_type="text/plain")
 
+@app.post("/execute_batch/")
+async def execute_batch(request: BatchRequest):
+    if request.stream:
+        resp = await _open_stream("/run_batch", request.model_dump())
+        return StreamingResponse(_relay(resp, {"error": "runner unavailable"}), media_type="application/x-ndjson")
+
+    # Worst case every case times out and they run one lane at a time
+    rounds = -(-len(request.cases) // request.max_parallel)
+    try:
+        resp = await upstream.post("/run_batch", request.model_dump(), timeout=request.timeout_seconds * rounds + 10)
+    except httpx.RequestError as exc:
+        logger.exception("Runner batch request failed: %s", exc)
+        raise HTTPException(status_code=502, detail="runner unavailable")
+    if resp.status_code != 200:
+        raise _upstream_error(resp)
+    return resp.json()
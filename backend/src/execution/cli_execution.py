@@ -1,4 +1,5 @@
 import argparse
+import json
 import os
 import sys
 import requests
@@ -9,10 +10,23 @@ def execute_code_cli(base_url: str, code: str, stream: bool) -> None:
         url = base_url.rstrip("/") + "/execute_code_stream/"
         resp = requests.post(url, json={"code": code}, stream=True)
         resp.raise_for_status()
-        for chunk in resp.iter_content(chunk_size=None):
-            if chunk:
-                sys.stdout.write(chunk.decode("utf-8", errors="ignore"))
+        for line in resp.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            kind = event.get("type")
+            if kind in ("stdout", "output"):
+                sys.stdout.write(event["data"])
                 sys.stdout.flush()
+            elif kind == "stderr":
+                sys.stderr.write(event["data"])
+                sys.stderr.flush()
+            elif kind == "truncated":
+                print(f"\n[output truncated after {event['limit_bytes']} bytes]", file=sys.stderr)
+            elif kind == "exit":
+                print(f"\nExit code: {event['exit_code']}")
+            elif kind == "error":
+                print(f"Error: {event.get('detail')}")
         return
 
     url = base_url.rstrip("/") + "/execute_code/"
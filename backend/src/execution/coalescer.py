@@ -0,0 +1,91 @@
+import asyncio
+from typing import Any, AsyncIterator, Callable, Optional
+
+
+class Flight:
+    """One running job whose items are kept so every subscriber sees all of them."""
+
+    def __init__(self, job) -> None:
+        self.job = job
+        self.items: list = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def _publish(self) -> None:
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+
+class Coalescer:
+    """Single-flight for runs: identical requests in flight at the same time share one job.
+
+    The first request for a key submits the job; its output is pumped into the
+    flight by a task of its own, so followers keep receiving it even if the
+    request that started the job goes away. The job is cancelled only when
+    its last subscriber leaves. Runs on the event loop, so nothing here locks.
+    """
+
+    def __init__(self) -> None:
+        self.leaders = 0
+        self.followers = 0
+        self._flights: dict[str, Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: str, start: Callable[[], tuple[Any, AsyncIterator]]) -> tuple[Flight, bool]:
+        """Attach to the flight for ``key``; ``start()`` -> (job, items) submits one if there is none.
+
+        Errors from ``start`` (e.g. the queue is full) propagate before anything is registered.
+        """
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            job, items = start()
+            flight = self._flights[key] = Flight(job)
+            flight.task = asyncio.create_task(self._pump(key, flight, items))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        flight.subscribers += 1
+        return flight, leader
+
+    async def _pump(self, key: str, flight: Flight, items: AsyncIterator) -> None:
+        try:
+            async for item in items:
+                flight.items.append(item)
+                flight._publish()
+        except asyncio.CancelledError:
+            flight.error = RuntimeError("run was cancelled")
+        except Exception as exc:  # noqa: BLE001
+            flight.error = exc
+        finally:
+            flight.done = True
+            flight._publish()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    async def follow(self, key: str, flight: Flight) -> AsyncIterator:
+        """Every item of the flight from the first one; leaving early detaches this subscriber."""
+        index = 0
+        try:
+            while True:
+                while index >= len(flight.items) and not flight.done:
+                    await flight._changed.wait()
+                if index < len(flight.items):
+                    index += 1
+                    yield flight.items[index - 1]
+                elif flight.error is not None:
+                    raise flight.error
+                else:
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                # Cancelling the pump closes the job's stream, which stops the worker
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+
+logger = logging.getLogger("runner")
+
+
+class PoolKey(NamedTuple):
+    """Containers are only interchangeable when image and resource limits match."""
+
+    image: str
+    memory_mb: int
+    cpu_millis: int
+
+
+class PooledContainer:
+    def __init__(self, key: PoolKey, container: Any, *, pooled: bool = True) -> None:
+        self.key = key
+        self.container = container
+        # Overflow containers (pool at max size) are destroyed after a single job
+        self.pooled = pooled
+        self.uses = 0
+        self.created_at = time.time()
+        # cgroup counters as of the end of the last job, the baseline for the next one
+        self.cgroup: dict = {}
+
+
+class ContainerPool:
+    """Pre-started sandbox containers, one idle list per ``PoolKey``.
+
+    ``acquire`` hands out an idle container when one exists (a pool hit) and
+    otherwise creates one inline (a cold start). Containers go back to the
+    idle list after a clean job and are destroyed after ``max_uses`` jobs or
+    as soon as the caller reports dirty state. A background thread keeps at
+    least ``min_idle`` containers ready for every key seen so far and does the
+    slow removals off the request path.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[PoolKey], Any],
+        destroy: Callable[[Any], None],
+        *,
+        min_idle: int = 1,
+        max_size: int = 4,
+        max_uses: int = 20,
+        refill_interval: float = 1.0,
+    ) -> None:
+        self.create = create
+        self.destroy = destroy
+        self.min_idle = max(0, min_idle)
+        self.max_size = max(1, max_size)
+        self.max_uses = max(1, max_uses)
+        self.refill_interval = refill_interval
+        self.hits = 0
+        self.cold_starts = 0
+        self.create_failures = 0
+        self.recycled: dict[str, int] = {"max_uses": 0, "dirty": 0, "overflow": 0}
+        self._idle: dict[PoolKey, deque[PooledContainer]] = {}
+        # Pooled containers per key, idle or busy
+        self._size: dict[PoolKey, int] = {}
+        self._graveyard: deque[Any] = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._maintain, name="container-pool", daemon=True)
+            self._thread.start()
+
+    def prewarm(self, key: PoolKey) -> None:
+        """Track ``key`` so the background thread keeps ``min_idle`` containers ready for it."""
+        with self._cond:
+            self._idle.setdefault(key, deque())
+            self._size.setdefault(key, 0)
+            self._cond.notify()
+
+    def idle_count(self, key: PoolKey) -> int:
+        return len(self._idle.get(key, ()))
+
+    def size(self, key: PoolKey) -> int:
+        return self._size.get(key, 0)
+
+    def keys(self) -> list[PoolKey]:
+        return list(self._size)
+
+    def acquire(self, key: PoolKey) -> PooledContainer:
+        with self._cond:
+            idle = self._idle.setdefault(key, deque())
+            self._size.setdefault(key, 0)
+            if idle:
+                self.hits += 1
+                entry = idle.popleft()
+                self._cond.notify()
+                return entry
+            self.cold_starts += 1
+            pooled = self._size[key] < self.max_size
+            if pooled:
+                self._size[key] += 1
+        try:
+            return PooledContainer(key, self.create(key), pooled=pooled)
+        except Exception:
+            if pooled:
+                with self._cond:
+                    self._size[key] -= 1
+            raise
+
+    def release(self, entry: PooledContainer, *, dirty: bool = False) -> None:
+        entry.uses += 1
+        reason = None
+        if not entry.pooled:
+            reason = "overflow"
+        elif dirty:
+            reason = "dirty"
+        elif entry.uses >= self.max_uses:
+            reason = "max_uses"
+        with self._cond:
+            if reason is None and not self._stopped:
+                self._idle.setdefault(entry.key, deque()).append(entry)
+                return
+            if reason is not None:
+                self.recycled[reason] += 1
+            if entry.pooled:
+                self._size[entry.key] -= 1
+            stopped = self._stopped
+            if not stopped:
+                self._graveyard.append(entry.container)
+                self._cond.notify()
+        if stopped:
+            self._destroy(entry.container)
+
+    def _maintain(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                doomed = list(self._graveyard)
+                self._graveyard.clear()
+                wanted = [
+                    key
+                    for key, idle in self._idle.items()
+                    if len(idle) < self.min_idle and self._size[key] < self.max_size
+                ]
+                for key in wanted:
+                    self._size[key] += 1
+            for container in doomed:
+                self._destroy(container)
+            for key in wanted:
+                self._refill(key)
+            with self._cond:
+                if not self._stopped and not self._graveyard and not any(
+                    len(idle) < self.min_idle and self._size[key] < self.max_size
+                    for key, idle in self._idle.items()
+                ):
+                    self._cond.wait(self.refill_interval)
+
+    def _refill(self, key: PoolKey) -> None:
+        try:
+            container = self.create(key)
+        except Exception as exc:  # noqa: BLE001
+            self.create_failures += 1
+            logger.warning("Could not pre-start container for %s: %s", key, exc)
+            with self._cond:
+                self._size[key] -= 1
+                # Back off instead of spinning on a broken image or daemon
+                self._cond.wait(self.refill_interval)
+            return
+        with self._cond:
+            if self._stopped:
+                self._size[key] -= 1
+                self._graveyard.append(container)
+            else:
+                self._idle[key].append(PooledContainer(key, container))
+
+    def _destroy(self, container: Any) -> None:
+        try:
+            self.destroy(container)
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Could not remove container: %s", exc)
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            doomed = list(self._graveyard)
+            self._graveyard.clear()
+            for key, idle in self._idle.items():
+                doomed.extend(entry.container for entry in idle)
+                self._size[key] -= len(idle)
+                idle.clear()
+            self._cond.notify_all()
+        for container in doomed:
+            self._destroy(container)
@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import docker
+
+from exposition import render_family
+
+
+logger = logging.getLogger("runner")
+
+# "missing": pull only images that are not local; "always": also pull on every check to follow the tag; "never"
+PULL_POLICIES = ("missing", "always", "never")
+
+
+class ImageNotReady(RuntimeError):
+    pass
+
+
+class ImageState:
+    def __init__(self) -> None:
+        # Local image ID jobs are started from; None until the image is present
+        self.pinned: Optional[str] = None
+        self.digest: Optional[str] = None
+        self.checked_at = 0.0
+        self.error: Optional[str] = None
+        self.pulls = 0
+        self.pull_failures = 0
+        self.updates = 0
+
+
+class ImageManager:
+    """Pulls the sandbox images before any job needs them and pins each one to an image ID.
+
+    Jobs and pooled sandboxes start from the pinned ID rather than the tag, so
+    a tag moving under a running runner changes nothing until the next check
+    re-pins it. Nothing on the request path pulls: until an image is present
+    it is reported as not ready.
+    """
+
+    def __init__(self, client, *, pull_policy: str = "missing") -> None:
+        if pull_policy not in PULL_POLICIES:
+            raise ValueError(f"pull_policy must be one of {', '.join(PULL_POLICIES)}")
+        self.client = client
+        self.pull_policy = pull_policy
+        self.images: Dict[str, ImageState] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, *images: str) -> None:
+        with self._lock:
+            for image in images:
+                self.images.setdefault(image, ImageState())
+
+    @property
+    def ready(self) -> bool:
+        return all(state.pinned is not None for state in self.images.values())
+
+    def missing(self) -> list[str]:
+        return [image for image, state in self.images.items() if state.pinned is None]
+
+    def pinned(self, image: str) -> str:
+        state = self.images.get(image)
+        if state is None or state.pinned is None:
+            raise ImageNotReady(f"image {image} is not available on this runner yet")
+        return state.pinned
+
+    def start(self, interval: float, on_ready: Optional[Callable[[], None]] = None) -> None:
+        """Check every tracked image now and then every ``interval`` seconds (0 = only once)."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._loop, args=(interval, on_ready), name="runner-images", daemon=True
+            )
+            self._thread.start()
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+
+    def _loop(self, interval: float, on_ready: Optional[Callable[[], None]]) -> None:
+        while True:
+            self.check()
+            if on_ready is not None and self.ready:
+                on_ready()
+                on_ready = None
+            # Keep retrying quickly while something is still missing
+            wait = interval if self.ready else min(interval or 10.0, 10.0)
+            if (self.ready and interval <= 0) or self._stopped.wait(wait):
+                return
+
+    def check(self) -> None:
+        with self._lock:
+            images = list(self.images)
+        for image in images:
+            self._check(image, self.images[image])
+
+    def _check(self, image: str, state: ImageState) -> None:
+        local = self._local(image)
+        if self.pull_policy == "always" or (local is None and self.pull_policy == "missing"):
+            local = self._pull(image, state) or local
+        state.checked_at = time.time()
+        if local is None:
+            if state.error is None:
+                state.error = "not present locally" if self.pull_policy == "never" else "pull failed"
+            return
+        if state.pinned is not None and state.pinned != local.id:
+            state.updates += 1
+            logger.info("Image %s moved to %s", image, local.id)
+        state.pinned = local.id
+        state.digest = (local.attrs.get("RepoDigests") or [None])[0]
+        state.error = None
+
+    def _local(self, image: str):
+        try:
+            return self.client.images.get(image)
+        except docker.errors.ImageNotFound:
+            return None
+        except docker.errors.DockerException as exc:
+            logger.warning("Could not inspect image %s: %s", image, exc)
+            return None
+
+    def _pull(self, image: str, state: ImageState):
+        logger.info("Pulling image %s", image)
+        state.pulls += 1
+        try:
+            return self.client.images.pull(image)
+        except docker.errors.DockerException as exc:
+            state.pull_failures += 1
+            state.error = str(exc)
+            logger.warning("Pulling image %s failed: %s", image, exc)
+            return None
+
+    def metrics_lines(self) -> list[str]:
+        per_image = [
+            ("runner_image_ready", "gauge", "1 once the image is present and pinned", lambda s: int(s.pinned is not None)),
+            ("runner_image_pulls", "counter", "Pulls attempted", lambda s: s.pulls),
+            ("runner_image_pull_failures", "counter", "Pulls that failed", lambda s: s.pull_failures),
+            ("runner_image_updates", "counter", "Times a check re-pinned the image to a new ID", lambda s: s.updates),
+        ]
+        lines = []
+        for name, kind, help_text, value in per_image:
+            lines += render_family(
+                name, kind, help_text, [({"image": image}, value(state)) for image, state in self.images.items()]
+            )
+        return lines
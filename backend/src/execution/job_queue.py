@@ -0,0 +1,266 @@
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Optional
+
+
+_DONE = object()
+# Streamed chunks a job may produce ahead of its consumer before the worker blocks
+STREAM_BUFFER = 64
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("job queue is full")
+        self.retry_after = retry_after
+
+
+def host_capacity() -> tuple[int, int]:
+    """(cpu millis, memory MB) available to jobs on this host."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    memory_mb = 0
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    memory_mb = int(line.split()[1]) // 1024
+                    break
+    except OSError:
+        pass
+    # Leave headroom for the daemon, the runner itself and idle pooled containers
+    return cpus * 1000, int(memory_mb * 0.75) or 4096
+
+
+class Job:
+    def __init__(
+        self,
+        fn: Callable[[threading.Event], Any],
+        *,
+        priority: int,
+        seq: int,
+        cpu_millis: int,
+        memory_mb: int,
+        streaming: bool,
+        loop: asyncio.AbstractEventLoop,
+    ) -> None:
+        self.fn = fn
+        self.priority = priority
+        self.seq = seq
+        self.cpu_millis = cpu_millis
+        self.memory_mb = memory_mb
+        self.streaming = streaming
+        self.cancelled = threading.Event()
+        # Jobs ahead of this one when it was admitted (0 = next to start)
+        self.position = 0
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self._loop = loop
+        self._items: "asyncio.Queue" = asyncio.Queue()
+        # Backpressure: a slow client stalls the worker (and the program's pipe) instead of growing memory
+        self._slots = threading.Semaphore(STREAM_BUFFER)
+
+    def __lt__(self, other: "Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    @property
+    def wait_ms(self) -> int:
+        end = self.started_at if self.started_at is not None else time.time()
+        return int((end - self.submitted_at) * 1000)
+
+    def _put(self, item: Any) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._items.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed (shutdown); nobody is left to read it
+            pass
+
+    def _execute(self, finished: Callable[[], None]) -> None:
+        """Run the job; ``finished`` is called before its outcome is delivered, so a caller never sees it early."""
+        outcome = []
+        try:
+            if self.cancelled.is_set():
+                return
+            if not self.streaming:
+                outcome.append(self.fn(self.cancelled))
+                return
+            iterator = self.fn(self.cancelled)
+            try:
+                for item in iterator:
+                    while not self._slots.acquire(timeout=0.1):
+                        if self.cancelled.is_set():
+                            break
+                    if self.cancelled.is_set():
+                        break
+                    self._put(item)
+            finally:
+                close = getattr(iterator, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as exc:  # noqa: BLE001
+            outcome.append(exc)
+        finally:
+            finished()
+            for item in outcome + [_DONE]:
+                self._put(item)
+
+    async def result(self) -> Any:
+        try:
+            item = await self._items.get()
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+        if item is _DONE:
+            raise RuntimeError("job was cancelled before it started")
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    async def iter(self) -> AsyncIterator[Any]:
+        done = False
+        try:
+            while True:
+                item = await self._items.get()
+                if item is _DONE:
+                    done = True
+                    return
+                if isinstance(item, BaseException):
+                    done = True
+                    raise item
+                self._slots.release()
+                yield item
+        finally:
+            # Client went away: drop the job if still queued, stop it if running
+            if not done:
+                self.cancelled.set()
+
+
+class JobQueue:
+    """Bounded, priority-ordered execution of blocking runner jobs.
+
+    Jobs reserve the CPU and memory they ask for and only start when a worker
+    is free and the reservation fits within the host capacity, so concurrency
+    follows the hardware rather than a fixed thread count. Lower ``priority``
+    runs first, FIFO within a priority. Beyond ``max_queue`` jobs waiting on busy workers,
+    ``submit`` raises ``Overloaded`` so the HTTP layer can answer 429.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_workers: int,
+        max_queue: int,
+        cpu_capacity_millis: int,
+        memory_capacity_mb: int,
+        retry_after_seconds: int = 1,
+    ) -> None:
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.cpu_capacity_millis = cpu_capacity_millis
+        self.memory_capacity_mb = memory_capacity_mb
+        self.retry_after_seconds = retry_after_seconds
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.wait_seconds_total = 0.0
+        self.cpu_reserved = 0
+        self.memory_reserved = 0
+        self._heap: list[Job] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"runner-job-{i}", daemon=True) for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queued(self) -> int:
+        return len(self._heap)
+
+    def submit(
+        self,
+        fn: Callable[[threading.Event], Any],
+        *,
+        priority: int = 0,
+        cpu_millis: int = 0,
+        memory_mb: int = 0,
+        streaming: bool = False,
+    ) -> Job:
+        """Queue ``fn(cancelled)``; must be called from the event loop."""
+        job = Job(
+            fn,
+            priority=priority,
+            seq=next(self._seq),
+            cpu_millis=cpu_millis,
+            memory_mb=memory_mb,
+            streaming=streaming,
+            loop=asyncio.get_running_loop(),
+        )
+        with self._cond:
+            if self.running + len(self._heap) >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.retry_after_seconds)
+            job.position = sum(1 for queued in self._heap if queued.priority <= priority)
+            heapq.heappush(self._heap, job)
+            self._cond.notify_all()
+        return job
+
+    def _fits(self, job: Job) -> bool:
+        # A job larger than the whole host still runs, just on its own
+        if self.running == 0:
+            return True
+        return (
+            self.cpu_reserved + job.cpu_millis <= self.cpu_capacity_millis
+            and self.memory_reserved + job.memory_mb <= self.memory_capacity_mb
+        )
+
+    def _next(self) -> Optional[Job]:
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0].cancelled.is_set():
+                    heapq.heappop(self._heap)
+                    self.cancelled += 1
+                if self._stopped:
+                    return None
+                # Strict priority order: a big job at the head is not overtaken by smaller ones
+                if self._heap and self._fits(self._heap[0]):
+                    job = heapq.heappop(self._heap)
+                    self.running += 1
+                    self.cpu_reserved += job.cpu_millis
+                    self.memory_reserved += job.memory_mb
+                    job.started_at = time.time()
+                    self.wait_seconds_total += job.started_at - job.submitted_at
+                    return job
+                self._cond.wait(0.5)
+
+    def _work(self) -> None:
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            job._execute(lambda: self._release(job))
+
+    def _release(self, job: Job) -> None:
+        with self._cond:
+            self.running -= 1
+            self.completed += 1
+            self.cpu_reserved -= job.cpu_millis
+            self.memory_reserved -= job.memory_mb
+            self._cond.notify_all()
+
+    def shutdown(self) -> None:
+        with self._cond:
+            self._stopped = True
+            for job in self._heap:
+                job.cancelled.set()
+                job._put(_DONE)
+            self._heap.clear()
+            self._cond.notify_all()
@@ -0,0 +1,57 @@
+import json
+import os
+from typing import Dict
+
+
+class Language:
+    """How to run one language: the sandbox image, the file the code goes in and the command.
+
+    ``command`` items may use ``{source}`` (path of the program file) and
+    ``{workdir}`` (the job's directory inside the sandbox).
+    """
+
+    def __init__(self, name: str, *, image: str, source_file: str, command: list[str]) -> None:
+        self.name = name
+        self.image = image
+        self.source_file = source_file
+        self.command = list(command)
+
+    def command_for(self, workdir: str) -> list[str]:
+        source = f"{workdir}/{self.source_file}"
+        return [part.format(source=source, workdir=workdir) for part in self.command]
+
+
+LANGUAGES: Dict[str, Language] = {}
+
+
+def register(language: Language) -> None:
+    LANGUAGES[language.name] = language
+
+
+def get(name: str) -> Language:
+    try:
+        return LANGUAGES[name]
+    except KeyError:
+        raise ValueError(f"Unsupported language: {name}") from None
+
+
+def images() -> list[str]:
+    return sorted({language.image for language in LANGUAGES.values()})
+
+
+def load(path: str) -> None:
+    """Register languages from a JSON file: ``{"name": {"image": ..., "source_file": ..., "command": [...]}}``."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    for name, spec in entries.items():
+        register(Language(name, image=spec["image"], source_file=spec["source_file"], command=spec["command"]))
+
+
+register(
+    Language(
+        "python",
+        image=os.environ.get("RUNNER_IMAGE_PYTHON", "python:3.11-slim"),
+        source_file="main.py",
+        command=["python", "{source}"],
+    )
+)
@@ -0,0 +1,64 @@
+import codecs
+import json
+from typing import Iterable, Iterator
+
+
+def frame(event: dict) -> bytes:
+    """One NDJSON line of the run stream protocol."""
+    return (json.dumps(event) + "\n").encode("utf-8")
+
+
+class OutputCap:
+    """Counts program output against a byte limit; anything past it is dropped. 0 = unlimited."""
+
+    def __init__(self, limit_bytes: int) -> None:
+        self.limit_bytes = max(0, limit_bytes)
+        self.total_bytes = 0
+        self.truncated = False
+
+    def take(self, data: bytes) -> bytes:
+        room = self.limit_bytes - self.total_bytes
+        self.total_bytes += len(data)
+        if not self.limit_bytes or len(data) <= room:
+            return data
+        self.truncated = True
+        return data[: max(0, room)]
+
+    def marker(self) -> str:
+        return f"\n[output truncated after {self.limit_bytes} bytes]\n"
+
+
+def collect(output: Iterable[tuple[str, bytes]], cap: OutputCap) -> str:
+    """Interleaved stdout and stderr as one string, bounded by ``cap``."""
+    parts = []
+    for _, data in output:
+        kept = cap.take(data)
+        if kept:
+            parts.append(kept)
+    logs = b"".join(parts).decode("utf-8", errors="ignore")
+    return logs + cap.marker() if cap.truncated else logs
+
+
+def output_frames(output: Iterable[tuple[str, bytes]], cap: OutputCap) -> Iterator[bytes]:
+    """``stdout``/``stderr`` frames for raw output chunks, and a ``truncated`` frame once ``cap`` is hit.
+
+    Output past the cap is still read, so the program is not blocked on a
+    full pipe, but it is not forwarded.
+    """
+    decoders: dict = {}
+    marked = False
+    for stream, data in output:
+        kept = cap.take(data)
+        if kept:
+            # Incremental so a multi-byte character split across chunks survives
+            decoder = decoders.setdefault(stream, codecs.getincrementaldecoder("utf-8")(errors="replace"))
+            text = decoder.decode(kept)
+            if text:
+                yield frame({"type": stream, "data": text})
+        if cap.truncated and not marked:
+            marked = True
+            yield frame({"type": "truncated", "limit_bytes": cap.limit_bytes})
+    for stream, decoder in decoders.items():
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield frame({"type": stream, "data": text})
@@ -0,0 +1,132 @@
+import threading
+import time
+from typing import Optional
+
+from exposition import render_family
+from histogram import LATENCY_BUCKETS, Histogram
+
+
+# Prints "key value" lines from the sandbox's own cgroup (v2); nothing on hosts without it
+CGROUP_STATS_SH = (
+    "cat /sys/fs/cgroup/cpu.stat /sys/fs/cgroup/memory.events 2>/dev/null; "
+    "echo memory_peak $(cat /sys/fs/cgroup/memory.peak 2>/dev/null || echo -1)"
+)
+PHASES = ("create", "start", "run", "teardown")
+CPU_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+MEMORY_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048)
+RATIO_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+
+def parse_cgroup_stats(text: str) -> dict[str, int]:
+    counters = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].lstrip("-").isdigit():
+            counters[parts[0]] = int(parts[1])
+    if counters.get("memory_peak", -1) < 0:
+        counters.pop("memory_peak", None)
+    return counters
+
+
+def cgroup_usage(before: dict[str, int], after: dict[str, int]) -> dict:
+    """Per-job usage from cgroup counters read before and after it ran in the same sandbox.
+
+    ``memory.peak`` covers the sandbox's whole life, so a job only gets a peak
+    when it set a new high; otherwise an earlier job's peak would be reported.
+    """
+    if "usage_usec" not in after:
+        return {}
+
+    def delta(name: str) -> int:
+        return max(0, after.get(name, 0) - before.get(name, 0))
+
+    peak = after.get("memory_peak")
+    return {
+        "cpu_ms": delta("usage_usec") // 1000,
+        "throttled_periods": delta("nr_throttled"),
+        "throttled_ms": delta("throttled_usec") // 1000,
+        "peak_memory_mb": round(peak / 2**20, 1) if peak is not None and peak > before.get("memory_peak", -1) else None,
+        "oom_killed": delta("oom_kill") > 0,
+    }
+
+
+class PhaseTimer:
+    """Wall time of consecutive job phases, as ``<phase>_ms`` entries of a usage dict."""
+
+    def __init__(self) -> None:
+        self.phases: dict[str, int] = {}
+        self._mark = time.perf_counter()
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.phases[f"{phase}_ms"] = int((now - self._mark) * 1000)
+        self._mark = now
+
+
+class UsageStats:
+    """Aggregates per-job usage into histograms for right-sizing the default limits."""
+
+    def __init__(self) -> None:
+        self.cpu_seconds = Histogram(CPU_BUCKETS)
+        self.peak_memory_mb = Histogram(MEMORY_BUCKETS)
+        # Share of the granted CPU and memory a job actually used
+        self.cpu_utilization = Histogram(RATIO_BUCKETS)
+        self.memory_utilization = Histogram(RATIO_BUCKETS)
+        self.phase_seconds = {phase: Histogram(LATENCY_BUCKETS) for phase in PHASES}
+        self.throttled_jobs = 0
+        self.oom_kills = 0
+        self._lock = threading.Lock()
+
+    def observe(self, usage: dict, *, memory_mb: int, cpu_millis: int) -> None:
+        with self._lock:
+            for phase in PHASES:
+                if usage.get(f"{phase}_ms") is not None:
+                    self.phase_seconds[phase].observe(usage[f"{phase}_ms"] / 1000)
+            if usage.get("oom_killed"):
+                self.oom_kills += 1
+            if usage.get("throttled_periods"):
+                self.throttled_jobs += 1
+            cpu_ms: Optional[int] = usage.get("cpu_ms")
+            if cpu_ms is not None:
+                self.cpu_seconds.observe(cpu_ms / 1000)
+                run_ms = usage.get("run_ms") or 0
+                if run_ms > 0:
+                    self.cpu_utilization.observe(cpu_ms / (run_ms * cpu_millis / 1000))
+            peak: Optional[float] = usage.get("peak_memory_mb")
+            if peak is not None:
+                self.peak_memory_mb.observe(peak)
+                self.memory_utilization.observe(peak / memory_mb)
+
+    def metrics_lines(self) -> list[str]:
+        with self._lock:
+            lines = [
+                "# HELP runner_job_cpu_seconds CPU time used per job",
+                "# TYPE runner_job_cpu_seconds histogram",
+                *self.cpu_seconds.lines("runner_job_cpu_seconds"),
+                "# HELP runner_job_cpu_utilization CPU time over run time times granted CPUs",
+                "# TYPE runner_job_cpu_utilization histogram",
+                *self.cpu_utilization.lines("runner_job_cpu_utilization"),
+                "# HELP runner_job_peak_memory_mb Peak memory per job (when attributable)",
+                "# TYPE runner_job_peak_memory_mb histogram",
+                *self.peak_memory_mb.lines("runner_job_peak_memory_mb"),
+                "# HELP runner_job_memory_utilization Peak memory over memory_mb",
+                "# TYPE runner_job_memory_utilization histogram",
+                *self.memory_utilization.lines("runner_job_memory_utilization"),
+                "# HELP runner_job_phase_seconds Time per job phase: create, start, run, teardown",
+                "# TYPE runner_job_phase_seconds histogram",
+            ]
+            for phase, histogram in self.phase_seconds.items():
+                lines += histogram.lines("runner_job_phase_seconds", {"phase": phase})
+            lines += render_family(
+                "runner_job_throttled",
+                "counter",
+                "Jobs that were CPU-throttled at least once",
+                [({}, self.throttled_jobs)],
+            )
+            lines += render_family(
+                "runner_job_oom_kills",
+                "counter",
+                "Jobs in which the kernel OOM-killed a process",
+                [({}, self.oom_kills)],
+            )
+        return lines
@@ -0,0 +1,43 @@
+import hashlib
+import json
+from typing import Optional
+
+from ttl_cache import TTLCache
+
+
+REPLAY_FIELDS = ("exit_code", "logs", "duration_ms", "truncated")
+
+
+class ResultCache(TTLCache):
+    """TTL + LRU cache of finished runs, with an optional size-bounded on-disk tier.
+
+    Entries hold what a replay needs (exit code, logs, original duration).
+    The key covers the program and its files, its input, the resolved image
+    and the limits, so a hit is only possible for a byte-identical job.
+    """
+
+    @staticmethod
+    def make_key(
+        code: str,
+        *,
+        language: str,
+        image_id: str,
+        stdin: Optional[str],
+        files: Optional[dict] = None,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+    ) -> str:
+        payload = json.dumps(
+            [code, language, image_id, stdin, files or {}, timeout_seconds, memory_mb, cpu_millis],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        result = super().get(key)
+        return dict(result) if result is not None else None
+
+    def put(self, key: str, result: dict) -> None:
+        super().put(key, {name: result[name] for name in REPLAY_FIELDS if name in result})
@@ -1,11 +1,25 @@
+import asyncio
+import json
 import logging
+import os
+import queue
+import time
+from typing import Optional
 from docker.errors import DockerException
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from runner_service import RunnerService
-from schemas import RunRequest
+from starlette.concurrency import run_in_threadpool
+import languages
+from coalescer import Coalescer
+from exposition import PROMETHEUS_CONTENT_TYPE, render_family
+from image_manager import ImageNotReady
+from job_queue import JobQueue, Overloaded, host_capacity
+from output_frames import OutputCap, frame
+from result_cache import ResultCache
+from runner_service import KILLED_EXIT_CODES, UNKNOWN_EXIT_CODE, RunnerService
+from schemas import RunBatchRequest, RunRequest
 
 
 logger = logging.getLogger("runner")
@@ -26,13 +40,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-service = RunnerService()
+# Pre-started sandboxes per (image, memory, cpu) profile; RUNNER_POOL_MAX_SIZE=0 disables pooling
+POOL_MIN_IDLE = int(os.environ.get("RUNNER_POOL_MIN_IDLE", "2"))
+POOL_MAX_SIZE = int(os.environ.get("RUNNER_POOL_MAX_SIZE", "8"))
+# Destroy a pooled container after this many jobs even when it looks clean
+POOL_MAX_USES = int(os.environ.get("RUNNER_POOL_MAX_USES", "50"))
+
+# stdout+stderr kept per run; the rest is dropped and the result marked truncated (0 = unlimited)
+MAX_OUTPUT_BYTES = int(os.environ.get("RUNNER_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+# Past timeout_seconds plus this grace the watchdog kills the sandbox itself
+WATCHDOG_GRACE_SECONDS = float(os.environ.get("RUNNER_WATCHDOG_GRACE_SECONDS", "2"))
+# Seconds between sweeps for orphaned sandboxes; 0 disables
+REAP_INTERVAL = float(os.environ.get("RUNNER_REAP_INTERVAL", "60"))
+# Also remove sandboxes made by other runner processes, e.g. a crashed predecessor's. Only safe when this is
+# the daemon's sole runner: with several, it would destroy the others' running jobs and idle pools
+REAP_FOREIGN = os.environ.get("RUNNER_REAP_FOREIGN", "0") == "1"
+
+# Extra languages as JSON: {"name": {"image": ..., "source_file": ..., "command": [..., "{source}"]}}
+LANGUAGES_FILE = os.environ.get("RUNNER_LANGUAGES_FILE") or None
+# missing | always | never; "always" pulls on every check to follow moving tags
+IMAGE_PULL_POLICY = os.environ.get("RUNNER_IMAGE_PULL_POLICY", "missing")
+# Seconds between image checks that re-pin tags to their current image ID; 0 = only at startup
+IMAGE_CHECK_INTERVAL = float(os.environ.get("RUNNER_IMAGE_CHECK_INTERVAL", "300"))
+
+if LANGUAGES_FILE:
+    languages.load(LANGUAGES_FILE)
+
+service = RunnerService(
+    pool_min_idle=POOL_MIN_IDLE,
+    pool_max_size=POOL_MAX_SIZE,
+    pool_max_uses=POOL_MAX_USES,
+    max_output_bytes=MAX_OUTPUT_BYTES,
+    watchdog_grace_seconds=WATCHDOG_GRACE_SECONDS,
+    reap_foreign=REAP_FOREIGN,
+    image_pull_policy=IMAGE_PULL_POLICY,
+)
+
+# Jobs reserve their cpu_millis/memory_mb against host capacity; 0 = detect from the host
+HOST_CPU_MILLIS, HOST_MEMORY_MB = host_capacity()
+CPU_CAPACITY_MILLIS = int(os.environ.get("RUNNER_CPU_CAPACITY_MILLIS", "0")) or HOST_CPU_MILLIS
+MEMORY_CAPACITY_MB = int(os.environ.get("RUNNER_MEMORY_CAPACITY_MB", "0")) or HOST_MEMORY_MB
+# Upper bound on concurrent jobs; capacity usually binds first (default 2 per core)
+MAX_WORKERS = int(os.environ.get("RUNNER_MAX_WORKERS", "0")) or max(1, CPU_CAPACITY_MILLIS // 500)
+MAX_QUEUE = int(os.environ.get("RUNNER_MAX_QUEUE", "64"))
+RETRY_AFTER_SECONDS = int(os.environ.get("RUNNER_RETRY_AFTER_SECONDS", "2"))
+
+# Results of requests that opt in with cache=true; RUNNER_RESULT_CACHE_SIZE=0 disables
+RESULT_CACHE_SIZE = int(os.environ.get("RUNNER_RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL = float(os.environ.get("RUNNER_RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_DIR = os.environ.get("RUNNER_RESULT_CACHE_DIR") or None
+# Size cap of the on-disk tier; least recently used results are removed past it (0 = unlimited)
+RESULT_CACHE_DISK_MB = int(os.environ.get("RUNNER_RESULT_CACHE_DISK_MB", "256"))
+# Which identical concurrent runs share one job: "cache" (those that opted in with cache=true,
+# vouching the program is deterministic), "all" or "off"
+COALESCE = os.environ.get("RUNNER_COALESCE", "cache")
+
+result_cache = (
+    ResultCache(
+        RESULT_CACHE_SIZE,
+        RESULT_CACHE_TTL,
+        disk_dir=RESULT_CACHE_DIR,
+        max_disk_bytes=RESULT_CACHE_DISK_MB * 1024 * 1024,
+    )
+    if RESULT_CACHE_SIZE > 0
+    else None
+)
+
+coalescer = Coalescer()
+
+jobs = JobQueue(
+    max_workers=MAX_WORKERS,
+    max_queue=MAX_QUEUE,
+    cpu_capacity_millis=CPU_CAPACITY_MILLIS,
+    memory_capacity_mb=MEMORY_CAPACITY_MB,
+    retry_after_seconds=RETRY_AFTER_SECONDS,
+)
+
+
+@app.on_event("startup")
+async def prewarm_pool():
+    # Requests with the default limits are the common case; other profiles warm up on first use
+    defaults = RunRequest.model_fields
+
+    def prewarm():
+        service.prewarm(
+            language=defaults["language"].default,
+            memory_mb=defaults["memory_mb"].default,
+            cpu_millis=defaults["cpu_millis"].default,
+        )
+
+    # Sandboxes start once their images are pulled, never by pulling on demand
+    service.images.start(IMAGE_CHECK_INTERVAL, on_ready=prewarm)
+    service.start_reaper(REAP_INTERVAL)
+
+
+@app.on_event("shutdown")
+async def shutdown_pool():
+    jobs.shutdown()
+    service.shutdown()
 
 
 @app.get("/healthz")
 async def healthz():
     try:
-        service.client.ping()
+        await run_in_threadpool(service.client.ping)
         return {"ok": True}
     except DockerException:
         raise HTTPException(status_code=503, detail="docker unavailable")
@@ -40,85 +151,415 @@ async def healthz():
 
 @app.get("/readyz")
 async def readyz():
-    # Ready when docker socket is reachable
+    # Ready when docker socket is reachable; load figures let the gateway balance across runners
     try:
-        service.client.ping()
-        return {"ready": True}
+        await run_in_threadpool(service.client.ping)
     except DockerException:
         return {"ready": False}
+    if not service.images.ready:
+        return {"ready": False, "images_missing": service.images.missing()}
+    return {
+        "ready": True,
+        "running": jobs.running,
+        "queued": jobs.queued,
+        "free_cpu_millis": jobs.cpu_capacity_millis - jobs.cpu_reserved,
+        "free_memory_mb": jobs.memory_capacity_mb - jobs.memory_reserved,
+    }
 
 
 @app.get("/metrics")
 async def metrics():
     try:
-        service.client.ping()
+        await run_in_threadpool(service.client.ping)
         up = 1
     except DockerException:
         up = 0
-    lines = [
-        "# HELP runner_docker_up 1 if docker is reachable",
-        "# TYPE runner_docker_up gauge",
-        f"runner_docker_up {{}} {up}",
+    families = [
+        ("runner_docker_up", "gauge", "1 if docker is reachable", up),
+        ("runner_jobs_running", "gauge", "Jobs currently executing", jobs.running),
+        ("runner_jobs_queued", "gauge", "Jobs waiting for a worker and capacity", jobs.queued),
+        ("runner_jobs_completed", "counter", "Jobs that finished (successfully or not)", jobs.completed),
+        ("runner_jobs_rejected", "counter", "Jobs turned away because the queue was full", jobs.rejected),
+        ("runner_jobs_cancelled", "counter", "Queued jobs dropped because the client went away", jobs.cancelled),
+        (
+            "runner_job_queue_wait_seconds_total",
+            "counter",
+            "Time started jobs spent queued",
+            round(jobs.wait_seconds_total, 3),
+        ),
+        ("runner_cpu_reserved_millis", "gauge", "CPU reserved by running jobs", jobs.cpu_reserved),
+        ("runner_memory_reserved_mb", "gauge", "Memory reserved by running jobs", jobs.memory_reserved),
+        ("runner_timeouts", "counter", "Runs that hit their timeout_seconds", service.timeouts),
     ]
-    return "\n".join(lines) + "\n"
+    lines = []
+    for name, kind, help_text, value in families:
+        lines += render_family(name, kind, help_text, [({}, value)])
+    lines += render_family(
+        "runner_watchdog_kills",
+        "counter",
+        "Sandboxes killed by the watchdog, by reason",
+        [({"reason": reason}, count) for reason, count in service.watchdog.kills.items()],
+    )
+    lines += render_family(
+        "runner_reaped",
+        "counter",
+        "Orphaned sandboxes removed by the reaper",
+        [({"kind": kind}, count) for kind, count in service.reaped.items()],
+    )
+    lines += render_family(
+        "runner_coalesce_leaders",
+        "counter",
+        "Coalescable runs that started a job of their own",
+        [({}, coalescer.leaders)],
+    )
+    lines += render_family(
+        "runner_coalesced_requests",
+        "counter",
+        "Runs that attached to an identical job already in flight",
+        [({}, coalescer.followers)],
+    )
+    lines += render_family(
+        "runner_coalesce_in_flight", "gauge", "Shared jobs currently in flight", [({}, len(coalescer))]
+    )
+    lines += service.usage.metrics_lines()
+    lines += service.images.metrics_lines()
+    if result_cache is not None:
+        cache_families = [
+            ("runner_result_cache_hits", "counter", "Cached runs replayed instead of executed", result_cache.hits),
+            (
+                "runner_result_cache_disk_hits",
+                "counter",
+                "Cache hits served from the on-disk tier",
+                result_cache.disk_hits,
+            ),
+            ("runner_result_cache_misses", "counter", "Cacheable runs that had to execute", result_cache.misses),
+            ("runner_result_cache_entries", "gauge", "Results held in memory", len(result_cache)),
+            ("runner_result_cache_disk_bytes", "gauge", "Size of the on-disk tier", result_cache.disk_bytes),
+            (
+                "runner_result_cache_disk_evictions",
+                "counter",
+                "Results removed from disk to stay under RUNNER_RESULT_CACHE_DISK_MB",
+                result_cache.disk_evictions,
+            ),
+        ]
+        for name, kind, help_text, value in cache_families:
+            lines += render_family(name, kind, help_text, [({}, value)])
+    pool = service.pool
+    if pool is not None:
+        pool_families = [
+            ("runner_pool_hits", "counter", "Jobs dispatched into an idle pre-started container", pool.hits),
+            ("runner_pool_cold_starts", "counter", "Jobs that had to create a container first", pool.cold_starts),
+            ("runner_pool_create_failures", "counter", "Background container starts that failed", pool.create_failures),
+        ]
+        for name, kind, help_text, value in pool_families:
+            lines += render_family(name, kind, help_text, [({}, value)])
+        lines += render_family(
+            "runner_pool_recycled",
+            "counter",
+            "Containers destroyed after use, by reason",
+            [({"reason": reason}, count) for reason, count in pool.recycled.items()],
+        )
+        profiles = [
+            ({"image": key.image, "memory_mb": key.memory_mb, "cpu_millis": key.cpu_millis}, key) for key in pool.keys()
+        ]
+        lines += render_family(
+            "runner_pool_idle",
+            "gauge",
+            "Idle pre-started containers per profile",
+            [(labels, pool.idle_count(key)) for labels, key in profiles],
+        )
+        lines += render_family(
+            "runner_pool_size",
+            "gauge",
+            "Pooled containers per profile, idle or busy",
+            [(labels, pool.size(key)) for labels, key in profiles],
+        )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
 
 
-def _image_for_language(language: str) -> str:
-    if language == "python":
-        return os.environ.get("RUNNER_IMAGE_PYTHON", "python:3.11-slim")
-    raise ValueError(f"Unsupported language: {language}")
+def _check_image(language: str) -> None:
+    try:
+        service.images.pinned(languages.get(language).image)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"{exc}; this runner has {', '.join(sorted(languages.LANGUAGES))}")
+    except ImageNotReady as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
 
 
-def _write_temp_program(language: str, code: str) -> tuple[str, str]:
-    job_id = str(uuid.uuid4())
-    temp_dir = os.path.join(tempfile.gettempdir(), "runner_jobs", job_id)
-    os.makedirs(temp_dir, exist_ok=True)
-    if language == "python":
-        program_path = os.path.join(temp_dir, "main.py")
-    else:
-        raise ValueError(f"Unsupported language: {language}")
-    with open(program_path, "w", encoding="utf-8") as f:
-        f.write(code)
-    return temp_dir, program_path
+def _submit(req: RunRequest, fn, *, streaming: bool = False):
+    try:
+        return jobs.submit(
+            fn,
+            priority=req.priority,
+            cpu_millis=req.cpu_millis,
+            memory_mb=req.memory_mb,
+            streaming=streaming,
+        )
+    except Overloaded as exc:
+        raise HTTPException(
+            status_code=429,
+            detail="runner queue full",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
 
+def _coalescable(req: RunRequest) -> bool:
+    return COALESCE == "all" or (COALESCE == "cache" and req.cache)
 
-def _container_command(language: str, program_mount_path: str) -> list[str]:
-    if language == "python":
-        return ["python", program_mount_path]
-    raise ValueError(f"Unsupported language: {language}")
 
+async def _run_key(req: RunRequest) -> Optional[str]:
+    """Key over everything that decides a run's result; None when neither caching nor coalescing applies."""
+    if not (req.cache and result_cache is not None) and not _coalescable(req):
+        return None
+    image_id = await run_in_threadpool(service.image_id, req.language)
+    return ResultCache.make_key(
+        req.code,
+        language=req.language,
+        image_id=image_id,
+        stdin=req.stdin,
+        files=req.files,
+        timeout_seconds=req.timeout_seconds,
+        memory_mb=req.memory_mb,
+        cpu_millis=req.cpu_millis,
+    )
 
-def _nano_cpus(cpu_millis: int) -> int:
-    # 1000 millis = 1 CPU = 1e9 nano_cpus
-    return int(cpu_millis * 1_000_000)
+
+async def _first(items) -> dict:
+    try:
+        async for item in items:
+            return item
+        raise RuntimeError("run was cancelled")
+    finally:
+        await items.aclose()
+
+
+async def _as_follower(frames):
+    """A shared run's frames, with the meta frame marked as coalesced."""
+    try:
+        async for chunk in frames:
+            event = json.loads(chunk)
+            if event["type"] == "meta":
+                chunk = frame({**event, "coalesced": True})
+            yield chunk
+    finally:
+        await frames.aclose()
+
+
+def _cacheable(result: dict) -> bool:
+    # Timeouts and OOM kills depend on host load, not just the program; an unknown status is no result
+    return (
+        result["exit_code"] not in KILLED_EXIT_CODES
+        and result["exit_code"] != UNKNOWN_EXIT_CODE
+        and not result.get("timed_out")
+    )
 
 
 @app.post("/run")
 async def run_once(req: RunRequest):
-    try:
-        return service.run_once(
+    _check_image(req.language)
+    key = await _run_key(req)
+    cache_key = key if req.cache and result_cache is not None else None
+    if cache_key is not None:
+        cached = await run_in_threadpool(result_cache.get, cache_key)
+        if cached is not None:
+            return {**cached, "cached": True, "queue_position": 0, "queue_wait_ms": 0}
+
+    def run(cancelled):
+        result = service.run_once(
             code=req.code,
             language=req.language,
             timeout_seconds=req.timeout_seconds,
             memory_mb=req.memory_mb,
             cpu_millis=req.cpu_millis,
+            stdin=req.stdin,
+            files=req.files,
+            cancelled=cancelled,
         )
+        if cache_key is not None and _cacheable(result):
+            result_cache.put(cache_key, result)
+        return result
+
+    def start():
+        job = _submit(req, run)
+
+        async def result():
+            yield await job.result()
+
+        return job, result()
+
+    extra = {}
+    if key is not None and _coalescable(req):
+        flight, leader = coalescer.join("run:" + key, start)
+        job, outcome = flight.job, _first(coalescer.follow("run:" + key, flight))
+        if not leader:
+            extra["coalesced"] = True
+    else:
+        job = _submit(req, run)
+        outcome = job.result()
+    try:
+        result = await outcome
     except Exception as e:  # noqa: BLE001
         raise HTTPException(status_code=500, detail=str(e))
+    return {**result, **extra, "queue_position": job.position, "queue_wait_ms": job.wait_ms}
 
 
 @app.post("/run_stream")
 async def run_stream(req: RunRequest):
-    def generate():
-        for chunk in service.stream(
+    """NDJSON frames: meta, then stdout/stderr (and truncated) as output arrives, then exit."""
+    _check_image(req.language)
+    key = await _run_key(req)
+    cache_key = key if req.cache and result_cache is not None else None
+    if cache_key is not None:
+        cached = await run_in_threadpool(result_cache.get, cache_key)
+        if cached is not None:
+            async def replay():
+                yield frame({"type": "meta", "queue_position": 0, "queue_wait_ms": 0, "cached": True})
+                # stdout and stderr are not kept apart in the cache
+                yield frame({"type": "output", "data": cached["logs"]})
+                yield frame({
+                    "type": "exit",
+                    "exit_code": cached["exit_code"],
+                    "duration_ms": cached["duration_ms"],
+                    "timed_out": False,
+                    "truncated": cached.get("truncated", False),
+                    "cached": True,
+                })
+
+            return StreamingResponse(
+                replay(), media_type="application/x-ndjson", headers={"X-Queue-Position": "0", "X-Cache": "hit"}
+            )
+
+    def generate(cancelled):
+        yield frame({"type": "meta", "queue_position": job.position, "queue_wait_ms": job.wait_ms})
+        frames = service.stream(
             code=req.code,
             language=req.language,
             timeout_seconds=req.timeout_seconds,
             memory_mb=req.memory_mb,
             cpu_millis=req.cpu_millis,
-        ):
-            yield chunk
+            stdin=req.stdin,
+            files=req.files,
+            cancelled=cancelled,
+        )
+        yield from (frames if cache_key is None else _recording(frames, cache_key))
+
+    def start():
+        nonlocal job
+        job = _submit(req, generate, streaming=True)
+        return job, job.iter()
+
+    job = None
+    if key is not None and _coalescable(req):
+        # Every subscriber gets the whole stream from the meta frame on, however late it joined
+        flight, leader = coalescer.join("stream:" + key, start)
+        job, body = flight.job, coalescer.follow("stream:" + key, flight)
+        if not leader:
+            body = _as_follower(body)
+    else:
+        _, body = start()
+    return StreamingResponse(
+        body,
+        media_type="application/x-ndjson",
+        headers={"X-Queue-Position": str(job.position)},
+    )
+
+
+def _recording(frames, key: str):
+    """Pass a run's frames through, caching the result once the exit frame arrives."""
+    logs = []
+    for chunk in frames:
+        yield chunk
+        event = json.loads(chunk)
+        if event["type"] in ("stdout", "stderr"):
+            logs.append(event["data"])
+        elif event["type"] == "truncated":
+            logs.append(OutputCap(event["limit_bytes"]).marker())
+        elif event["type"] == "exit":
+            result = {
+                "exit_code": event["exit_code"],
+                "logs": "".join(logs),
+                "duration_ms": event["duration_ms"],
+                "timed_out": event["timed_out"],
+                "truncated": event["truncated"],
+            }
+            if _cacheable(result):
+                result_cache.put(key, result)
+
+
+_LANE_DONE = object()
+
+
+async def _merge(iterators):
+    """Interleave several async iterators, yielding items as soon as any lane produces one."""
+    items: "asyncio.Queue" = asyncio.Queue()
+
+    async def pump(iterator):
+        try:
+            async for item in iterator:
+                await items.put(item)
+        except Exception as exc:  # noqa: BLE001
+            await items.put(exc)
+        finally:
+            await items.put(_LANE_DONE)
+
+    tasks = [asyncio.create_task(pump(iterator)) for iterator in iterators]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            item = await items.get()
+            if item is _LANE_DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield item
+    finally:
+        # Cancelling a pump closes its lane's job, which stops the worker
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/run_batch")
+async def run_batch(req: RunBatchRequest):
+    _check_image(req.language)
+    start = time.time()
+    cases: "queue.Queue" = queue.Queue()
+    for index, case in enumerate(req.cases):
+        cases.put((index, case.code if case.code is not None else req.code, case.stdin))
+
+    def lane(cancelled):
+        return service.run_lane(
+            cases,
+            language=req.language,
+            timeout_seconds=req.timeout_seconds,
+            memory_mb=req.memory_mb,
+            cpu_millis=req.cpu_millis,
+            cancelled=cancelled,
+            files=req.files,
+        )
+
+    # Each lane is one queued job with its own resource reservation; take as many as the queue admits
+    lanes = [_submit(req, lane, streaming=True)]
+    for _ in range(min(req.max_parallel, len(req.cases)) - 1):
+        try:
+            lanes.append(jobs.submit(
+                lane,
+                priority=req.priority,
+                cpu_millis=req.cpu_millis,
+                memory_mb=req.memory_mb,
+                streaming=True,
+            ))
+        except Overloaded:
+            break
+    results = _merge([job.iter() for job in lanes])
 
-    return StreamingResponse(generate(), media_type="text/plain")
+    if req.stream:
+        async def ndjson():
+            async for result in results:
+                yield json.dumps(result) + "\n"
 
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
+    collected = [result async for result in results]
+    collected.sort(key=lambda result: result["index"])
+    return {"results": collected, "duration_ms": int((time.time() - start) * 1000)}
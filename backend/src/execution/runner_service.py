@@ -1,107 +1,684 @@
-import json
-import os
-import shutil
-import tempfile
+import io
+import logging
+import queue
+import shlex
+import tarfile
+import threading
 import time
 import uuid
-from typing import Dict
+from typing import Dict, Iterator, Optional
 
 import docker
+from docker.types import Mount
+
+import languages
+from container_pool import ContainerPool, PoolKey, PooledContainer
+from image_manager import ImageManager, ImageNotReady
+from output_frames import OutputCap, collect, frame, output_frames
+from resource_usage import CGROUP_STATS_SH, PhaseTimer, UsageStats, cgroup_usage, parse_cgroup_stats
+from watchdog import Watch, Watchdog
+
+
+logger = logging.getLogger("runner")
+
+
+WORKSPACE = "/workspace"
+SANDBOX_USER = "65534:65534"
+# Every sandbox carries both labels: "1"/"0" for pooled/one-off, and the id of the runner process that made it
+POOL_LABEL = "runner.pool"
+INSTANCE_LABEL = "runner.instance"
+# timeout(1) exit status and SIGKILL (OOM or timeout): the sandbox may hold stray state
+KILLED_EXIT_CODES = (124, 137)
+# PID 1 of a pooled sandbox. kill -1 in _reset spares PID 1 but kills its sleep, so it starts another;
+# a plain sleep under docker-init would die with it and take the container down. wait also reaps orphans
+KEEPALIVE_COMMAND = ["sh", "-c", "while :; do sleep 3600 & wait; done"]
+# Reported when the daemon never recorded an exec's exit status; not a timeout, but not a clean exit either
+UNKNOWN_EXIT_CODE = -1
 
 
 class RunnerService:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        *,
+        pool_min_idle: int = 0,
+        pool_max_size: int = 0,
+        pool_max_uses: int = 20,
+        max_output_bytes: int = 0,
+        watchdog_grace_seconds: float = 2.0,
+        reap_foreign: bool = False,
+        image_pull_policy: str = "missing",
+    ) -> None:
         self.client = docker.from_env()
+        self.images = ImageManager(self.client, pull_policy=image_pull_policy)
+        self.images.track(*languages.images())
+        # Per-run cap on stdout+stderr kept or forwarded; 0 = unlimited
+        self.max_output_bytes = max_output_bytes
+        self.instance_id = uuid.uuid4().hex
+        self.watchdog = Watchdog(grace_seconds=watchdog_grace_seconds)
+        # Remove sandboxes left by other runner processes (a crashed predecessor); only for a daemon's sole runner
+        self.reap_foreign = reap_foreign
+        self.timeouts = 0
+        self.usage = UsageStats()
+        self.reaped: Dict[str, int] = {"container": 0}
+        self.pool: Optional[ContainerPool] = None
+        # IDs of sandboxes this process created and has not removed yet
+        self._live: set = set()
+        # Own containers found untracked by the last reap; removed if still untracked on the next one
+        self._suspects: set = set()
+        self._stopped = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+        if pool_max_size > 0:
+            self.pool = ContainerPool(
+                self._create_sandbox,
+                self._remove_container,
+                min_idle=pool_min_idle,
+                max_size=pool_max_size,
+                max_uses=pool_max_uses,
+            )
+            self.pool.start()
+
+    def pool_key(self, *, language: str, memory_mb: int, cpu_millis: int) -> PoolKey:
+        return PoolKey(self._image_for_language(language), memory_mb, cpu_millis)
+
+    def prewarm(self, *, language: str, memory_mb: int, cpu_millis: int) -> None:
+        if self.pool is not None:
+            self.pool.prewarm(self.pool_key(language=language, memory_mb=memory_mb, cpu_millis=cpu_millis))
+
+    def shutdown(self) -> None:
+        self._stopped.set()
+        self.watchdog.shutdown()
+        self.images.shutdown()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def start_reaper(self, interval: float) -> None:
+        if interval > 0 and self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, args=(interval,), name="runner-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self, interval: float) -> None:
+        while True:
+            self.reap()
+            if self._stopped.wait(interval):
+                return
+
+    def reap(self) -> None:
+        """Remove sandboxes that no job or pool owns any more."""
+        try:
+            containers = self.client.containers.list(all=True, filters={"label": POOL_LABEL})
+        except docker.errors.DockerException as exc:
+            logger.warning("Reaper could not list containers: %s", exc)
+            return
+        suspects = set()
+        for container in containers:
+            owner = container.labels.get(INSTANCE_LABEL)
+            if owner == self.instance_id:
+                if container.id in self._live:
+                    continue
+                # A container seen between create and tracking gets one more pass before it counts as leaked
+                if container.id not in self._suspects:
+                    suspects.add(container.id)
+                    continue
+            elif not self.reap_foreign:
+                continue
+            try:
+                container.remove(force=True, v=True)
+                self.reaped["container"] += 1
+                logger.info("Reaped orphaned sandbox %s (owner %s)", container.short_id, owner)
+            except docker.errors.DockerException as exc:
+                logger.warning("Could not reap sandbox %s: %s", container.short_id, exc)
+        self._suspects = suspects
+
+    def _labels(self, pooled: bool) -> Dict[str, str]:
+        return {POOL_LABEL: "1" if pooled else "0", INSTANCE_LABEL: self.instance_id}
+
+    def _outcome(self, exit_code: int, start: float, timeout_seconds: int, watch: Watch) -> tuple[int, bool]:
+        """(exit code, timed out) for a finished run, counting timeouts."""
+        if watch.fired == "timeout":
+            exit_code = 124
+        timed_out = exit_code in KILLED_EXIT_CODES and time.time() - start >= timeout_seconds
+        if timed_out:
+            self.timeouts += 1
+        return exit_code, timed_out
 
     def _image_for_language(self, language: str) -> str:
-        if language == "python":
-            return os.environ.get("RUNNER_IMAGE_PYTHON", "python:3.11-slim")
-        raise ValueError(f"Unsupported language: {language}")
-
-    def _write_temp_program(self, language: str, code: str) -> str:
-        job_id = str(uuid.uuid4())
-        temp_dir = os.path.join(tempfile.gettempdir(), "runner_jobs", job_id)
-        os.makedirs(temp_dir, exist_ok=True)
-        filename = "main.py" if language == "python" else "main.txt"
-        with open(os.path.join(temp_dir, filename), "w", encoding="utf-8") as f:
-            f.write(code)
-        return temp_dir
-
-    def _command(self, language: str) -> list[str]:
-        if language == "python":
-            return ["python", "/workspace/main.py"]
-        raise ValueError(f"Unsupported language: {language}")
+        return languages.get(language).image
+
+    def image_id(self, language: str) -> str:
+        """ID of the image a language is pinned to, falling back to its name."""
+        image = self._image_for_language(language)
+        try:
+            return self.images.pinned(image)
+        except ImageNotReady:
+            return image
+
+    @staticmethod
+    def _job_files(
+        language: str, code: Optional[str], stdin: Optional[str], files: Optional[Dict[str, str]] = None
+    ) -> Dict[str, str]:
+        job_files = dict(files or {})
+        if code is not None:
+            job_files[languages.get(language).source_file] = code
+        if stdin is not None:
+            job_files["stdin"] = stdin
+        return job_files
+
+    def _command(self, language: str, workdir: str = WORKSPACE) -> list[str]:
+        return languages.get(language).command_for(workdir)
+
+    def _timed_command(self, language: str, workdir: str, timeout_seconds: int) -> list[str]:
+        return ["timeout", "-s", "KILL", str(timeout_seconds)] + self._command(language, workdir)
+
+    @staticmethod
+    def _with_stdin(cmd: list[str], stdin_path: Optional[str]) -> list[str]:
+        if stdin_path is None:
+            return cmd
+        return ["sh", "-c", "exec " + " ".join(shlex.quote(c) for c in cmd) + " < " + shlex.quote(stdin_path)]
 
     @staticmethod
     def _nano_cpus(cpu_millis: int) -> int:
         return int(cpu_millis * 1_000_000)
 
-    def run_once(self, *, code: str, language: str, timeout_seconds: int, memory_mb: int, cpu_millis: int) -> Dict:
+    def _sandbox_kwargs(self, memory_mb: int, cpu_millis: int) -> Dict:
+        return {
+            "network_disabled": True,
+            "read_only": True,
+            "user": SANDBOX_USER,
+            "mem_limit": f"{memory_mb}m",
+            "nano_cpus": self._nano_cpus(cpu_millis),
+            "security_opt": ["no-new-privileges:true"],
+            "pids_limit": 128,
+        }
+
+    def _create_sandbox(self, key: PoolKey):
+        """An idle sandbox waiting for jobs; programs are copied into an anonymous /workspace volume."""
+        container = self.client.containers.run(
+            image=self.images.pinned(key.image),
+            command=KEEPALIVE_COMMAND,
+            detach=True,
+            labels=self._labels(pooled=True),
+            mounts=[Mount(WORKSPACE, None, type="volume")],
+            **self._sandbox_kwargs(key.memory_mb, key.cpu_millis),
+        )
+        self._live.add(container.id)
+        return container
+
+    def _remove_container(self, container) -> None:
+        try:
+            container.remove(force=True, v=True)
+        finally:
+            self._live.discard(container.id)
+
+    @staticmethod
+    def _program_archive(job_id: str, files: Dict[str, str]) -> bytes:
+        """Tar holding ``job_id/<name>`` for each file, root-owned and read-only for the sandbox user."""
+        directories = {job_id}
+        for name in files:
+            parts = name.split("/")[:-1]
+            directories.update(f"{job_id}/" + "/".join(parts[: i + 1]) for i in range(len(parts)))
+        buf = io.BytesIO()
+        mtime = int(time.time())
+        with tarfile.open(fileobj=buf, mode="w") as tar:
+            # Sorted so parents come before their subdirectories
+            for path in sorted(directories):
+                directory = tarfile.TarInfo(path)
+                directory.type = tarfile.DIRTYPE
+                directory.mode = 0o555
+                directory.mtime = mtime
+                tar.addfile(directory)
+            for name, content in files.items():
+                data = content.encode("utf-8")
+                info = tarfile.TarInfo(f"{job_id}/{name}")
+                info.size = len(data)
+                info.mode = 0o444
+                info.mtime = mtime
+                tar.addfile(info, io.BytesIO(data))
+        return buf.getvalue()
+
+    def _copy_job(self, entry: PooledContainer, files: Dict[str, str]) -> str:
+        """Copy files into a fresh directory of a pooled sandbox and return its path."""
+        job_id = uuid.uuid4().hex
+        entry.container.put_archive(WORKSPACE, self._program_archive(job_id, files))
+        return f"{WORKSPACE}/{job_id}"
+
+    def _create_exec(
+        self,
+        entry: PooledContainer,
+        language: str,
+        program_dir: str,
+        timeout_seconds: int,
+        stdin_path: Optional[str] = None,
+    ) -> str:
+        cmd = self._with_stdin(self._timed_command(language, program_dir, timeout_seconds), stdin_path)
+        return self.client.api.exec_create(entry.container.id, cmd, user=SANDBOX_USER, workdir=program_dir)["Id"]
+
+    def _start_pooled(
+        self,
+        entry: PooledContainer,
+        language: str,
+        code: str,
+        timeout_seconds: int,
+        stdin: Optional[str] = None,
+        files: Optional[Dict[str, str]] = None,
+    ) -> tuple[str, str]:
+        """Copy the program into a pooled sandbox and create (not start) its exec; returns (exec_id, workdir)."""
+        workdir = self._copy_job(entry, self._job_files(language, code, stdin, files))
+        stdin_path = f"{workdir}/stdin" if stdin is not None else None
+        return self._create_exec(entry, language, workdir, timeout_seconds, stdin_path), workdir
+
+    def _exec_exit_code(self, exec_id: str, deadline: float) -> int:
+        """Exit status of a finished exec, or UNKNOWN_EXIT_CODE if none is recorded by ``deadline``."""
+        # The output stream can close a moment before the daemon records the exit status. Past the
+        # run's own deadline the watchdog has killed the sandbox, so a status should exist by then
+        delay = 0.01
+        while True:
+            info = self.client.api.exec_inspect(exec_id)
+            if not info.get("Running") and info.get("ExitCode") is not None:
+                return info["ExitCode"]
+            if time.time() >= deadline:
+                logger.warning("No exit status recorded for exec %s", exec_id)
+                return UNKNOWN_EXIT_CODE
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def _exec_deadline(self, start: float, timeout_seconds: int) -> float:
+        return start + timeout_seconds + self.watchdog.grace_seconds
+
+    def _reset(self, entry: PooledContainer, *workdirs: str) -> bool:
+        """Kill leftover processes and delete job files; False means the container should not be reused.
+
+        The sandbox's cgroup counters are read in the same exec, before the
+        cleanup, and kept on ``entry`` for the job's usage report.
+        """
+        paths = " ".join(shlex.quote(w) for w in workdirs)
+        return self._sandbox_sh(
+            entry, f"{CGROUP_STATS_SH}; kill -9 -1 2>/dev/null; rm -rf {paths} /dev/shm/* /dev/shm/.[!.]*"
+        )
+
+    def _sandbox_sh(self, entry: PooledContainer, script: str) -> bool:
+        try:
+            result = entry.container.exec_run(["sh", "-c", script], user="0")
+        except docker.errors.DockerException:
+            entry.cgroup = {}
+            return False
+        entry.cgroup = parse_cgroup_stats(result.output.decode("utf-8", errors="replace"))
+        return result.exit_code == 0
+
+    def _settle(self, entry: PooledContainer, watch: Watch, exit_code: int, *workdirs: str) -> tuple[bool, Dict]:
+        """Reset the sandbox after a job; returns whether it is dirty, and the job's cgroup usage."""
+        before = entry.cgroup
+        if watch.fired is not None:
+            # The watchdog killed the whole container; there is nothing left to read
+            return True, {}
+        if exit_code in KILLED_EXIT_CODES or exit_code == UNKNOWN_EXIT_CODE:
+            # Not reused, but the counters still say whether it was the OOM killer
+            self._sandbox_sh(entry, CGROUP_STATS_SH)
+            dirty = True
+        else:
+            dirty = not self._reset(entry, *workdirs)
+        return dirty, cgroup_usage(before, entry.cgroup)
+
+    @staticmethod
+    def _oom_killed(container) -> Optional[bool]:
+        try:
+            container.reload()
+        except docker.errors.DockerException:
+            return None
+        return bool(container.attrs.get("State", {}).get("OOMKilled"))
+
+    def _observe(self, usage: Dict, memory_mb: int, cpu_millis: int) -> Dict:
+        self.usage.observe(usage, memory_mb=memory_mb, cpu_millis=cpu_millis)
+        return usage
+
+    def _start_cold(
+        self,
+        *,
+        code: str,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        stdin: Optional[str],
+        files: Optional[Dict[str, str]],
+        timer: PhaseTimer,
+    ):
+        """Create a one-off sandbox, copy the program into its /workspace volume and start it."""
+        job_id = uuid.uuid4().hex
+        program_dir = f"{WORKSPACE}/{job_id}"
+        cmd = self._with_stdin(
+            self._timed_command(language, program_dir, timeout_seconds),
+            f"{program_dir}/stdin" if stdin is not None else None,
+        )
+        container = self.client.containers.create(
+            image=self.images.pinned(self._image_for_language(language)),
+            command=cmd,
+            working_dir=program_dir,
+            labels=self._labels(pooled=False),
+            mounts=[Mount(WORKSPACE, None, type="volume")],
+            **self._sandbox_kwargs(memory_mb, cpu_millis),
+        )
+        self._live.add(container.id)
+        timer.lap("create")
+        try:
+            container.put_archive(WORKSPACE, self._program_archive(job_id, self._job_files(language, code, stdin, files)))
+            container.start()
+        except Exception:
+            self._remove_container(container)
+            raise
+        return container
+
+    def _exec_output(self, exec_id: str) -> Iterator[tuple[str, bytes]]:
+        """Start an exec and read its output as it arrives, as ("stdout" | "stderr", bytes)."""
+        for stdout, stderr in self.client.api.exec_start(exec_id, stream=True, demux=True):
+            if stdout:
+                yield "stdout", stdout
+            if stderr:
+                yield "stderr", stderr
+
+    def _container_output(self, container) -> Iterator[tuple[str, bytes]]:
+        for stdout, stderr in self.client.api.attach(container.id, stream=True, logs=True, demux=True):
+            if stdout:
+                yield "stdout", stdout
+            if stderr:
+                yield "stderr", stderr
+
+    @staticmethod
+    def _exit_frame(exit_code: int, start: float, cap: OutputCap, timed_out: bool, usage: Dict) -> bytes:
+        return frame({
+            "type": "exit",
+            "exit_code": exit_code,
+            "duration_ms": int((time.time() - start) * 1000),
+            "timed_out": timed_out,
+            "truncated": cap.truncated,
+            "output_bytes": cap.total_bytes,
+            "usage": usage,
+        })
+
+    def _run_pooled(
+        self,
+        *,
+        code: str,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        stdin: Optional[str] = None,
+        files: Optional[Dict[str, str]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Dict:
         start = time.time()
-        temp_dir = self._write_temp_program(language, code)
-        volumes = {temp_dir: {"bind": "/workspace", "mode": "ro"}}
-        image = self._image_for_language(language)
-        cmd = self._command(language)
-        container = None
+        timer = PhaseTimer()
+        entry = self.pool.acquire(self.pool_key(language=language, memory_mb=memory_mb, cpu_millis=cpu_millis))
+        timer.lap("create")
+        dirty = True
         try:
-            container = self.client.containers.run(
-                image=image,
-                command=cmd,
-                detach=True,
-                network_disabled=True,
-                read_only=True,
-                user="65534:65534",
-                volumes=volumes,
-                mem_limit=f"{memory_mb}m",
-                nano_cpus=self._nano_cpus(cpu_millis),
-                security_opt=["no-new-privileges:true"],
-                pids_limit=128,
-            )
-            result = container.wait(timeout=timeout_seconds)
-            code_ = result.get("StatusCode", 124)
-            logs = container.logs(stdout=True, stderr=True).decode("utf-8", errors="ignore")
-            return {"exit_code": code_, "logs": logs, "duration_ms": int((time.time() - start) * 1000)}
+            exec_id, workdir = self._start_pooled(entry, language, code, timeout_seconds, stdin, files)
+            timer.lap("start")
+            cap = OutputCap(self.max_output_bytes)
+            with self.watchdog.watch(entry.container.kill, timeout_seconds, cancelled) as watch:
+                logs = collect(self._exec_output(exec_id), cap)
+                code_ = self._exec_exit_code(exec_id, self._exec_deadline(start, timeout_seconds))
+            timer.lap("run")
+            code_, timed_out = self._outcome(code_, start, timeout_seconds, watch)
+            dirty, usage = self._settle(entry, watch, code_, workdir)
+            timer.lap("teardown")
+            usage = self._observe({**timer.phases, **usage}, memory_mb, cpu_millis)
+            return {
+                "exit_code": code_,
+                "logs": logs,
+                "duration_ms": int((time.time() - start) * 1000),
+                "timed_out": timed_out,
+                "truncated": cap.truncated,
+                "usage": usage,
+            }
         finally:
-            try:
-                if container is not None:
-                    container.remove(force=True)
-            finally:
-                shutil.rmtree(temp_dir, ignore_errors=True)
+            self.pool.release(entry, dirty=dirty)
 
-    def stream(self, *, code: str, language: str, timeout_seconds: int, memory_mb: int, cpu_millis: int):
+    def _stream_pooled(
+        self,
+        *,
+        code: str,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        stdin: Optional[str] = None,
+        files: Optional[Dict[str, str]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ):
         start = time.time()
-        temp_dir = self._write_temp_program(language, code)
-        volumes = {temp_dir: {"bind": "/workspace", "mode": "ro"}}
-        image = self._image_for_language(language)
-        cmd = self._command(language)
-        container = None
+        timer = PhaseTimer()
+        entry = self.pool.acquire(self.pool_key(language=language, memory_mb=memory_mb, cpu_millis=cpu_millis))
+        timer.lap("create")
+        dirty = True
         try:
-            container = self.client.containers.run(
-                image=image,
-                command=cmd,
-                detach=True,
-                network_disabled=True,
-                read_only=True,
-                user="65534:65534",
-                volumes=volumes,
-                mem_limit=f"{memory_mb}m",
-                nano_cpus=self._nano_cpus(cpu_millis),
-                security_opt=["no-new-privileges:true"],
-                pids_limit=128,
+            exec_id, workdir = self._start_pooled(entry, language, code, timeout_seconds, stdin, files)
+            timer.lap("start")
+            cap = OutputCap(self.max_output_bytes)
+            with self.watchdog.watch(entry.container.kill, timeout_seconds, cancelled) as watch:
+                yield from output_frames(self._exec_output(exec_id), cap)
+                code_ = self._exec_exit_code(exec_id, self._exec_deadline(start, timeout_seconds))
+            timer.lap("run")
+            code_, timed_out = self._outcome(code_, start, timeout_seconds, watch)
+            dirty, usage = self._settle(entry, watch, code_, workdir)
+            timer.lap("teardown")
+            usage = self._observe({**timer.phases, **usage}, memory_mb, cpu_millis)
+            yield self._exit_frame(code_, start, cap, timed_out, usage)
+        finally:
+            # Abandoned mid-run (client went away) leaves dirty=True, so the container is destroyed
+            self.pool.release(entry, dirty=dirty)
+
+    def run_once(
+        self,
+        *,
+        code: str,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        stdin: Optional[str] = None,
+        files: Optional[Dict[str, str]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ) -> Dict:
+        """Run to completion. Setting ``cancelled`` (client gone) kills the sandbox early."""
+        if self.pool is not None:
+            return self._run_pooled(
+                code=code,
+                language=language,
+                timeout_seconds=timeout_seconds,
+                memory_mb=memory_mb,
+                cpu_millis=cpu_millis,
+                stdin=stdin,
+                files=files,
+                cancelled=cancelled,
             )
-            for chunk in container.logs(stream=True, stdout=True, stderr=True, follow=True):
-                yield chunk
-            result = container.wait(timeout=timeout_seconds)
-            code_ = result.get("StatusCode", 124)
-            tail = json.dumps({"exit_code": code_, "duration_ms": int((time.time() - start) * 1000)})
-            yield ("\n" + tail + "\n").encode("utf-8")
+        start = time.time()
+        timer = PhaseTimer()
+        container = self._start_cold(
+            code=code,
+            language=language,
+            timeout_seconds=timeout_seconds,
+            memory_mb=memory_mb,
+            cpu_millis=cpu_millis,
+            stdin=stdin,
+            files=files,
+            timer=timer,
+        )
+        timer.lap("start")
+        try:
+            cap = OutputCap(self.max_output_bytes)
+            with self.watchdog.watch(container.kill, timeout_seconds, cancelled) as watch:
+                logs = collect(self._container_output(container), cap)
+                code_ = container.wait(timeout=timeout_seconds).get("StatusCode", UNKNOWN_EXIT_CODE)
+            timer.lap("run")
+            code_, timed_out = self._outcome(code_, start, timeout_seconds, watch)
+            # A one-off sandbox has exited by now, so its cgroup (CPU, memory) is gone; Docker still knows about OOM
+            oom_killed = self._oom_killed(container)
+        finally:
+            self._remove_container(container)
+        timer.lap("teardown")
+        return {
+            "exit_code": code_,
+            "logs": logs,
+            "duration_ms": int((time.time() - start) * 1000),
+            "timed_out": timed_out,
+            "truncated": cap.truncated,
+            "usage": self._observe({**timer.phases, "oom_killed": oom_killed}, memory_mb, cpu_millis),
+        }
+
+    def stream(
+        self,
+        *,
+        code: str,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        stdin: Optional[str] = None,
+        files: Optional[Dict[str, str]] = None,
+        cancelled: Optional[threading.Event] = None,
+    ):
+        if self.pool is not None:
+            yield from self._stream_pooled(
+                code=code,
+                language=language,
+                timeout_seconds=timeout_seconds,
+                memory_mb=memory_mb,
+                cpu_millis=cpu_millis,
+                stdin=stdin,
+                files=files,
+                cancelled=cancelled,
+            )
+            return
+        start = time.time()
+        timer = PhaseTimer()
+        container = self._start_cold(
+            code=code,
+            language=language,
+            timeout_seconds=timeout_seconds,
+            memory_mb=memory_mb,
+            cpu_millis=cpu_millis,
+            stdin=stdin,
+            files=files,
+            timer=timer,
+        )
+        timer.lap("start")
+        try:
+            cap = OutputCap(self.max_output_bytes)
+            with self.watchdog.watch(container.kill, timeout_seconds, cancelled) as watch:
+                yield from output_frames(self._container_output(container), cap)
+                code_ = container.wait(timeout=timeout_seconds).get("StatusCode", UNKNOWN_EXIT_CODE)
+            timer.lap("run")
+            code_, timed_out = self._outcome(code_, start, timeout_seconds, watch)
+            oom_killed = self._oom_killed(container)
         finally:
             try:
-                if container is not None:
-                    container.remove(force=True)  # type: ignore[arg-type]
+                self._remove_container(container)
             except Exception:
                 pass
-            finally:
-                shutil.rmtree(temp_dir, ignore_errors=True)
+        timer.lap("teardown")
+        usage = self._observe({**timer.phases, "oom_killed": oom_killed}, memory_mb, cpu_millis)
+        yield self._exit_frame(code_, start, cap, timed_out, usage)
+
+    def run_lane(
+        self,
+        cases: "queue.Queue[tuple[int, str, Optional[str]]]",
+        *,
+        language: str,
+        timeout_seconds: int,
+        memory_mb: int,
+        cpu_millis: int,
+        cancelled: threading.Event,
+        files: Optional[Dict[str, str]] = None,
+    ) -> Iterator[Dict]:
+        """Run batch cases ``(index, code, stdin)`` pulled from a shared queue, yielding one result per case.
 
+        Several lanes drain the same queue in parallel. With the pool enabled a
+        lane keeps one sandbox for all its cases: each distinct program is copied
+        in once, and only stray processes are killed between cases, which is safe
+        because every case belongs to the same caller. Files are removed when the
+        lane finishes.
+        """
+        if self.pool is None:
+            while not cancelled.is_set():
+                try:
+                    index, code, stdin = cases.get_nowait()
+                except queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    result = self.run_once(
+                        code=code,
+                        language=language,
+                        timeout_seconds=timeout_seconds,
+                        memory_mb=memory_mb,
+                        cpu_millis=cpu_millis,
+                        stdin=stdin,
+                        files=files,
+                        cancelled=cancelled,
+                    )
+                except Exception as exc:  # noqa: BLE001
+                    result = {"error": str(exc), "duration_ms": int((time.time() - start) * 1000)}
+                yield {"index": index, **result}
+            return
 
+        key = self.pool_key(language=language, memory_mb=memory_mb, cpu_millis=cpu_millis)
+        entry: Optional[PooledContainer] = None
+        program_dirs: Dict[str, str] = {}
+        workdirs: list[str] = []
+        dirty = False
+        try:
+            while not cancelled.is_set():
+                try:
+                    index, code, stdin = cases.get_nowait()
+                except queue.Empty:
+                    break
+                start = time.time()
+                timer = PhaseTimer()
+                try:
+                    if entry is None:
+                        entry = self.pool.acquire(key)
+                        program_dirs, workdirs, dirty = {}, [], False
+                    timer.lap("create")
+                    program_dir = program_dirs.get(code)
+                    if program_dir is None:
+                        program_dir = program_dirs[code] = self._copy_job(
+                            entry, self._job_files(language, code, None, files)
+                        )
+                        workdirs.append(program_dir)
+                    stdin_path = None
+                    if stdin is not None:
+                        stdin_dir = self._copy_job(entry, self._job_files(language, None, stdin))
+                        workdirs.append(stdin_dir)
+                        stdin_path = f"{stdin_dir}/stdin"
+                    exec_id = self._create_exec(entry, language, program_dir, timeout_seconds, stdin_path)
+                    timer.lap("start")
+                    cap = OutputCap(self.max_output_bytes)
+                    with self.watchdog.watch(entry.container.kill, timeout_seconds, cancelled) as watch:
+                        logs = collect(self._exec_output(exec_id), cap)
+                        code_ = self._exec_exit_code(exec_id, self._exec_deadline(start, timeout_seconds))
+                    timer.lap("run")
+                    code_, timed_out = self._outcome(code_, start, timeout_seconds, watch)
+                    # Between cases of one batch only processes are cleared; files stay for reuse
+                    dirty, usage = self._settle(entry, watch, code_)
+                    timer.lap("teardown")
+                    result = {
+                        "exit_code": code_,
+                        "logs": logs,
+                        "duration_ms": int((time.time() - start) * 1000),
+                        "timed_out": timed_out,
+                        "truncated": cap.truncated,
+                        "usage": self._observe({**timer.phases, **usage}, memory_mb, cpu_millis),
+                    }
+                except Exception as exc:  # noqa: BLE001
+                    result = {"error": str(exc), "duration_ms": int((time.time() - start) * 1000)}
+                    dirty = True
+                yield {"index": index, **result}
+                if dirty and entry is not None:
+                    self.pool.release(entry, dirty=True)
+                    entry = None
+            if entry is not None:
+                dirty = not self._reset(entry, *workdirs)
+        finally:
+            if entry is not None:
+                self.pool.release(entry, dirty=dirty or cancelled.is_set())
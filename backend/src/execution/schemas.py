@@ -1,20 +1,82 @@
-from typing import Literal
+from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
+
+import languages
+
+
+# Where the runner writes a job's stdin, next to the program
+STDIN_FILE = "stdin"
+
+
+def reserved_files(language: str) -> tuple[str, ...]:
+  """File names a job's ``files`` may not use: stdin and the language's source file."""
+  registered = languages.LANGUAGES.get(language)
+  # A language registered only on the runners is checked there
+  return (STDIN_FILE,) + ((registered.source_file,) if registered else ())
+
+
+def _check_files(files: Optional[dict[str, str]], language: str) -> Optional[dict[str, str]]:
+  reserved = reserved_files(language)
+  for name in files or {}:
+    parts = name.split("/")
+    if name.startswith("/") or "\\" in name or any(part in ("", ".", "..") for part in parts):
+      raise ValueError(f"file name must be a plain relative path: {name!r}")
+    if name in reserved:
+      raise ValueError(f"{name!r} is reserved; pass it as code or stdin")
+  return files
 
 
 class CodeRequest(BaseModel):
   code: str = Field(..., description="Source code to execute")
-  language: Literal["python"] = "python"
+  language: str = Field("python", max_length=32, description="A language registered on the runners")
   timeout_seconds: int = Field(10, ge=1, le=120)
   memory_mb: int = Field(256, ge=64, le=2048)
   cpu_millis: int = Field(500, ge=100, le=2000)
+  priority: int = Field(5, ge=0, le=9, description="Queue priority; lower runs first")
+  stdin: Optional[str] = Field(None, description="Text fed to the program's standard input")
+  files: Optional[dict[str, str]] = Field(
+    None, max_length=64, description="Extra source files next to the program, keyed by relative path"
+  )
+  cache: bool = Field(
+    False,
+    description=(
+      "Replay the result of an identical earlier run (same code, files, stdin, image and limits),"
+      " or share one already in progress"
+    ),
+  )
+
+  @model_validator(mode="after")
+  def _files_are_relative(self) -> "CodeRequest":
+    _check_files(self.files, self.language)
+    return self
+
+
+class ResourceUsage(BaseModel):
+  cpu_ms: Optional[int] = Field(None, description="CPU time used by the job (pooled sandboxes only)")
+  throttled_periods: Optional[int] = Field(None, description="CFS periods in which the job hit its CPU quota")
+  throttled_ms: Optional[int] = None
+  peak_memory_mb: Optional[float] = Field(
+    None, description="Sandbox memory high-water mark, when this job set it"
+  )
+  oom_killed: Optional[bool] = Field(None, description="The kernel OOM killer ended a process of this job")
+  create_ms: Optional[int] = Field(None, description="Getting a sandbox: pool checkout or container create")
+  start_ms: Optional[int] = Field(None, description="Copying the program in and starting it")
+  run_ms: Optional[int] = None
+  teardown_ms: Optional[int] = Field(None, description="Cleaning up or removing the sandbox")
 
 
 class ExecuteResponse(BaseModel):
   logs: str
   exit_code: int
   duration_ms: int
+  timed_out: bool = Field(False, description="Killed at timeout_seconds")
+  truncated: bool = Field(False, description="Output went past the runner's cap; logs end with a marker")
+  cached: bool = Field(False, description="Replayed from the result cache; duration_ms is the original run's")
+  coalesced: bool = Field(False, description="Shared an identical run that was already in progress")
+  usage: Optional[ResourceUsage] = Field(None, description="Resources the run used; absent on cache hits")
+  queue_position: Optional[int] = Field(None, description="Jobs ahead of this one when it was queued")
+  queue_wait_ms: Optional[int] = None
 
 
 class RunRequest(CodeRequest):
@@ -25,3 +87,52 @@ class RunnerResponse(ExecuteResponse):
   pass
 
 
+class BatchCase(BaseModel):
+  code: Optional[str] = Field(None, description="Program for this case; defaults to the batch code")
+  stdin: Optional[str] = Field(None, description="Text fed to the program's standard input")
+
+
+class BatchRequest(BaseModel):
+  code: Optional[str] = Field(None, description="Program shared by cases that don't set their own")
+  files: Optional[dict[str, str]] = Field(
+    None, max_length=64, description="Extra source files next to every case's program, keyed by relative path"
+  )
+  cases: list[BatchCase] = Field(..., min_length=1, max_length=100)
+  language: str = Field("python", max_length=32, description="A language registered on the runners")
+  timeout_seconds: int = Field(10, ge=1, le=120, description="Limit per case")
+  memory_mb: int = Field(256, ge=64, le=2048)
+  cpu_millis: int = Field(500, ge=100, le=2000)
+  priority: int = Field(5, ge=0, le=9, description="Queue priority; lower runs first")
+  max_parallel: int = Field(4, ge=1, le=16, description="Cases running at once, each lane in its own sandbox")
+  stream: bool = Field(False, description="Respond with NDJSON, one line per case as it finishes")
+
+  @model_validator(mode="after")
+  def _files_are_relative(self) -> "BatchRequest":
+    _check_files(self.files, self.language)
+    return self
+
+  @model_validator(mode="after")
+  def _every_case_has_code(self) -> "BatchRequest":
+    if self.code is None and any(case.code is None for case in self.cases):
+      raise ValueError("each case needs code when the batch has no shared code")
+    return self
+
+
+class BatchResult(BaseModel):
+  index: int
+  exit_code: Optional[int] = None
+  logs: str = ""
+  duration_ms: int
+  timed_out: bool = False
+  truncated: bool = False
+  usage: Optional[ResourceUsage] = None
+  error: Optional[str] = Field(None, description="Set when the case could not be run")
+
+
+class BatchResponse(BaseModel):
+  results: list[BatchResult]
+  duration_ms: int
+
+
+class RunBatchRequest(BatchRequest):
+  pass
@@ -0,0 +1,266 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Any, AsyncIterator, Optional, Union
+
+import httpx
+
+from exposition import render_family
+from histogram import Histogram
+
+
+logger = logging.getLogger("execution-service")
+
+
+# Responses meaning "not accepted here, try elsewhere": nothing ran, so resubmitting is safe
+RETRY_STATUSES = (429, 502, 503)
+
+
+class RunnerEndpoint:
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url.rstrip("/")
+        # Optimistic until the first probe says otherwise
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.ejections = 0
+        # Load reported by the runner's /readyz on the last probe
+        self.queued = 0
+        self.free_cpu_millis: Optional[int] = None
+        self.latency: dict[str, Histogram] = {}
+
+    def eject(self) -> None:
+        if self.healthy:
+            self.ejections += 1
+        self.healthy = False
+
+
+class UpstreamClient:
+    """One long-lived, keep-alive connection pool to a set of runners.
+
+    Created at startup and shared by every request, so requests reuse warm
+    connections instead of paying for a TCP handshake each time. Each request
+    goes to the healthy runner with the fewest outstanding requests from this
+    gateway (then the shortest reported queue, then the most free CPU). A
+    background probe of every runner's /readyz ejects and re-admits runners;
+    connection failures eject immediately. Submissions that were refused or
+    never reached a runner are retried on a different one.
+    """
+
+    def __init__(
+        self,
+        base_urls: Union[str, list[str]],
+        *,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 4.0,
+        connect_timeout: float = 2.0,
+        pool_timeout: float = 5.0,
+        max_attempts: int = 2,
+        health_interval: float = 5.0,
+    ) -> None:
+        if isinstance(base_urls, str):
+            base_urls = [base_urls]
+        if not base_urls:
+            raise ValueError("at least one runner URL is required")
+        self.runners = [RunnerEndpoint(url) for url in base_urls]
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.pool_timeout = pool_timeout
+        self.max_attempts = max(1, max_attempts)
+        self.health_interval = health_interval
+        self.client: Optional[httpx.AsyncClient] = None
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.pool_timeouts = 0
+        self.retries = 0
+        self._health_task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self.client is None:
+            self.client = httpx.AsyncClient(limits=self.limits, timeout=self.timeout(None))
+
+    def start_health_checks(self) -> None:
+        """Probe runners in the background; needs a running event loop."""
+        self.start()
+        if self._health_task is None and self.health_interval > 0:
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def timeout(self, read: Optional[float]) -> httpx.Timeout:
+        """Per-request timeout: bounded connect and pool wait, caller-chosen read/write."""
+        return httpx.Timeout(read, connect=self.connect_timeout, pool=self.pool_timeout)
+
+    @property
+    def max_connections(self) -> int:
+        return self.limits.max_connections or 0
+
+    @property
+    def healthy_count(self) -> int:
+        return sum(1 for runner in self.runners if runner.healthy)
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(self._probe(runner) for runner in self.runners))
+
+    async def _probe(self, runner: RunnerEndpoint) -> None:
+        try:
+            resp = await self.client.get(runner.base_url + "/readyz", timeout=self.timeout(self.connect_timeout))
+            body = resp.json() if resp.status_code == 200 else {}
+        except (httpx.HTTPError, ValueError):
+            body = {}
+        if not body.get("ready"):
+            if runner.healthy:
+                logger.warning("Ejecting runner %s: /readyz failed", runner.base_url)
+            runner.eject()
+            return
+        if not runner.healthy:
+            logger.info("Runner %s is ready again", runner.base_url)
+        runner.healthy = True
+        runner.queued = int(body.get("queued", 0))
+        runner.free_cpu_millis = body.get("free_cpu_millis")
+
+    def _pick(self, tried: set[str]) -> RunnerEndpoint:
+        candidates = [r for r in self.runners if r.base_url not in tried]
+        healthy = [r for r in candidates if r.healthy]
+        # With nothing healthy left, trying an ejected runner beats failing outright
+        pool = healthy or candidates or self.runners
+        return min(pool, key=lambda r: (r.outstanding, r.queued, -(r.free_cpu_millis or 0)))
+
+    @contextlib.contextmanager
+    def _track(self, runner: RunnerEndpoint, endpoint: str):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        runner.outstanding += 1
+        runner.requests += 1
+        start = time.perf_counter()
+        try:
+            yield
+        except httpx.PoolTimeout:
+            # Our own pool is exhausted; says nothing about the runner
+            self.pool_timeouts += 1
+            raise
+        except (httpx.ConnectError, httpx.ConnectTimeout):
+            runner.errors += 1
+            runner.eject()
+            raise
+        except httpx.RequestError:
+            runner.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            runner.outstanding -= 1
+            runner.latency.setdefault(endpoint, Histogram()).observe(time.perf_counter() - start)
+
+    async def _send(self, endpoint: str, json: Any, timeout: Optional[float], stream: bool) -> httpx.Response:
+        self.start()
+        tried: set[str] = set()
+        attempts = min(self.max_attempts, len(self.runners))
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            runner = self._pick(tried)
+            tried.add(runner.base_url)
+            if attempt:
+                self.retries += 1
+            try:
+                with self._track(runner, endpoint):
+                    request = self.client.build_request(
+                        "POST", runner.base_url + endpoint, json=json, timeout=self.timeout(timeout)
+                    )
+                    resp = await self.client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                logger.warning("Runner %s unreachable: %s", runner.base_url, exc)
+                if last:
+                    raise
+                continue
+            if resp.status_code in RETRY_STATUSES and not last:
+                await resp.aclose()
+                continue
+            return resp
+        raise RuntimeError("unreachable")
+
+    async def post(self, endpoint: str, json: Any, *, timeout: Optional[float]) -> httpx.Response:
+        return await self._send(endpoint, json, timeout, stream=False)
+
+    async def open_stream(self, endpoint: str, json: Any, *, timeout: Optional[float] = None) -> httpx.Response:
+        """Send a streamed POST and return once headers arrive; the caller must ``aclose()`` the response."""
+        return await self._send(endpoint, json, timeout, stream=True)
+
+    @contextlib.asynccontextmanager
+    async def stream(self, endpoint: str, json: Any, *, timeout: Optional[float] = None) -> AsyncIterator[httpx.Response]:
+        """Stream a POST; latency is recorded up to the response headers."""
+        response = await self.open_stream(endpoint, json, timeout=timeout)
+        try:
+            yield response
+        finally:
+            await response.aclose()
+
+    def metrics_lines(self) -> list[str]:
+        families = [
+            ("gateway_upstream_in_flight", "gauge", "Requests to runners currently open", self.in_flight),
+            (
+                "gateway_upstream_peak_in_flight",
+                "gauge",
+                "Highest concurrent runner requests since start",
+                self.peak_in_flight,
+            ),
+            (
+                "gateway_upstream_max_connections",
+                "gauge",
+                "Connection pool size; in_flight near this means saturation",
+                self.max_connections,
+            ),
+            (
+                "gateway_upstream_pool_timeouts",
+                "counter",
+                "Requests that gave up waiting for a pooled connection",
+                self.pool_timeouts,
+            ),
+            ("gateway_upstream_retries", "counter", "Submissions resent to a different runner", self.retries),
+        ]
+        lines = []
+        for name, kind, help_text, value in families:
+            lines += render_family(name, kind, help_text, [({}, value)])
+        per_runner = [
+            ("gateway_runner_healthy", "gauge", "1 if the runner is receiving traffic", lambda r: int(r.healthy)),
+            ("gateway_runner_outstanding", "gauge", "Requests from this gateway open on the runner", lambda r: r.outstanding),
+            ("gateway_runner_queued", "gauge", "Jobs queued on the runner at the last probe", lambda r: r.queued),
+            (
+                "gateway_runner_free_cpu_millis",
+                "gauge",
+                "Unreserved runner CPU at the last probe",
+                lambda r: r.free_cpu_millis or 0,
+            ),
+            ("gateway_runner_requests", "counter", "Requests sent to the runner", lambda r: r.requests),
+            ("gateway_runner_errors", "counter", "Transport failures talking to the runner", lambda r: r.errors),
+            ("gateway_runner_ejections", "counter", "Times the runner was taken out of rotation", lambda r: r.ejections),
+        ]
+        for name, kind, help_text, value in per_runner:
+            lines += render_family(name, kind, help_text, [({"runner": r.base_url}, value(r)) for r in self.runners])
+        lines += [
+            "# HELP gateway_upstream_latency_seconds Runner response time (to headers for streams)",
+            "# TYPE gateway_upstream_latency_seconds histogram",
+        ]
+        for runner in self.runners:
+            for endpoint, histogram in runner.latency.items():
+                lines += histogram.lines(
+                    "gateway_upstream_latency_seconds", {"runner": runner.base_url, "endpoint": endpoint}
+                )
+        return lines
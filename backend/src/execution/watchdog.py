@@ -0,0 +1,80 @@
+import contextlib
+import logging
+import threading
+import time
+from typing import Callable, Iterator, Optional
+
+
+logger = logging.getLogger("runner")
+
+
+class Watch:
+    def __init__(self, kill: Callable[[], None], deadline: float, cancelled: Optional[threading.Event]) -> None:
+        self.kill = kill
+        self.deadline = deadline
+        self.cancelled = cancelled
+        # "timeout" or "cancelled" once the watchdog has killed the run
+        self.fired: Optional[str] = None
+
+
+class Watchdog:
+    """Kills runs that outlive their deadline or whose client went away.
+
+    The in-sandbox timeout(1) normally ends a program on time; this is the
+    backstop for whatever keeps a run alive past it (a child holding the
+    output pipe open, a stuck daemon call) and for silent programs whose
+    caller has disconnected, which would otherwise hold a worker until they
+    exit on their own.
+    """
+
+    def __init__(self, *, grace_seconds: float = 2.0, interval: float = 0.1) -> None:
+        self.grace_seconds = grace_seconds
+        self.interval = interval
+        self.kills: dict[str, int] = {"timeout": 0, "cancelled": 0}
+        self._watches: set[Watch] = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextlib.contextmanager
+    def watch(
+        self, kill: Callable[[], None], timeout_seconds: float, cancelled: Optional[threading.Event] = None
+    ) -> Iterator[Watch]:
+        entry = Watch(kill, time.monotonic() + timeout_seconds + self.grace_seconds, cancelled)
+        with self._lock:
+            self._watches.add(entry)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="runner-watchdog", daemon=True)
+                self._thread.start()
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                self._watches.discard(entry)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.check()
+
+    def check(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            watches = list(self._watches)
+        for entry in watches:
+            if entry.fired is not None:
+                continue
+            if now >= entry.deadline:
+                reason = "timeout"
+            elif entry.cancelled is not None and entry.cancelled.is_set():
+                reason = "cancelled"
+            else:
+                continue
+            entry.fired = reason
+            self.kills[reason] += 1
+            try:
+                entry.kill()
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Watchdog could not kill a %s run: %s", reason, exc)
+
+    def shutdown(self) -> None:
+        self._stopped.set()
@@ -1,9 +1,19 @@
 import logging
-from fastapi import FastAPI
+import os
+import time
+from typing import AsyncIterator, Optional
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from executor import InferenceExecutor, Overloaded
+from exposition import PROMETHEUS_CONTENT_TYPE, render_family
+from metrics import REGISTRY, REQUEST_DURATION, REQUEST_ERRORS, REQUESTS_IN_FLIGHT
+from registry import ModelNotReady, ModelRegistry, UnknownModel
+from response_cache import ResponseCache
+from scheduler import SchedulerStopped
 from schemas import PromptRequest
 from service import ModelService
+from streaming import MEDIA_TYPES, token_frames
 
 
 logger = logging.getLogger("model-service")
@@ -27,12 +37,86 @@ app.add_middleware(
 )
 
 
-service = ModelService(model_name="Qwen/Qwen2.5-Coder-0.5B-Instruct")
+# Comma-separated; the first entry is the default model and is loaded at startup
+MODEL_NAMES = [
+    name.strip()
+    for name in os.environ.get("MODEL_NAMES", "Qwen/Qwen2.5-Coder-0.5B-Instruct").split(",")
+    if name.strip()
+]
+# Unload least recently used idle models once loaded models exceed this (0 = no limit)
+MODEL_RAM_BUDGET_MB = int(os.environ.get("MODEL_RAM_BUDGET_MB", "0"))
+MAX_BATCH_SIZE = int(os.environ.get("MODEL_MAX_BATCH_SIZE", "8"))
+MAX_QUEUE_WAIT_MS = float(os.environ.get("MODEL_MAX_QUEUE_WAIT_MS", "10"))
+PREFIX_CACHE_MB = int(os.environ.get("MODEL_PREFIX_CACHE_MB", "256"))
+RESPONSE_CACHE_SIZE = int(os.environ.get("MODEL_RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.environ.get("MODEL_RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_DIR = os.environ.get("MODEL_RESPONSE_CACHE_DIR") or None
+# Size cap of the on-disk tier; least recently used completions are removed past it (0 = unlimited)
+RESPONSE_CACHE_DISK_MB = int(os.environ.get("MODEL_RESPONSE_CACHE_DISK_MB", "256"))
+MAX_IN_FLIGHT = int(os.environ.get("MODEL_MAX_IN_FLIGHT", "16"))
+MAX_QUEUE = int(os.environ.get("MODEL_MAX_QUEUE", "32"))
+RETRY_AFTER_SECONDS = int(os.environ.get("MODEL_RETRY_AFTER_SECONDS", "2"))
+DRAFT_MODEL_NAME = os.environ.get("MODEL_DRAFT_NAME") or None
+NUM_DRAFT_TOKENS = int(os.environ.get("MODEL_NUM_DRAFT_TOKENS", "4"))
+PROMPT_LOOKUP_NGRAM = int(os.environ.get("MODEL_PROMPT_LOOKUP_NGRAM", "3"))
+# fp32, bf16, int8, optionally suffixed with +compile (e.g. "bf16+compile")
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "fp32")
+# Keep a copy of the weights converted for the backend under cache_dir for fast restarts
+MODEL_PRECONVERT = os.environ.get("MODEL_PRECONVERT", "1") == "1"
+# Concurrent identical deterministic requests (temperature 0 or cache=true) share one generation
+MODEL_COALESCE = os.environ.get("MODEL_COALESCE", "1") == "1"
+# Token ids of recent prompts kept so repeats skip templating and tokenization (0 = off)
+PROMPT_CACHE_TOKENS = int(os.environ.get("MODEL_PROMPT_CACHE_TOKENS", "262144"))
+# Framed streams: hold a token frame this long to batch more deltas into it (0 = send what is ready)
+STREAM_FLUSH_MS = float(os.environ.get("MODEL_STREAM_FLUSH_MS", "0"))
+# Framed streams: send a heartbeat frame after this many idle seconds (queueing, long prefill)
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("MODEL_STREAM_HEARTBEAT_SECONDS", "10"))
+
+response_cache = (
+    ResponseCache(
+        RESPONSE_CACHE_SIZE,
+        RESPONSE_CACHE_TTL,
+        disk_dir=RESPONSE_CACHE_DIR,
+        max_disk_bytes=RESPONSE_CACHE_DISK_MB * 1024 * 1024,
+    )
+    if RESPONSE_CACHE_SIZE > 0
+    else None
+)
+
+
+def build_service(model_name: str) -> ModelService:
+    return ModelService(
+        model_name=model_name,
+        max_batch_size=MAX_BATCH_SIZE,
+        max_queue_wait_ms=MAX_QUEUE_WAIT_MS,
+        prefix_cache_mb=PREFIX_CACHE_MB,
+        warm_system_prompts=[PromptRequest.model_fields["system_prompt"].default],
+        response_cache=response_cache,
+        draft_model_name=DRAFT_MODEL_NAME,
+        num_draft_tokens=NUM_DRAFT_TOKENS,
+        prompt_lookup_ngram=PROMPT_LOOKUP_NGRAM,
+        backend=MODEL_BACKEND,
+        preconvert=MODEL_PRECONVERT,
+        coalesce=MODEL_COALESCE,
+        prompt_cache_tokens=PROMPT_CACHE_TOKENS,
+    )
+
+
+registry = ModelRegistry(build_service, MODEL_NAMES, ram_budget_bytes=MODEL_RAM_BUDGET_MB * 1024 * 1024)
+
+executor = InferenceExecutor(MAX_IN_FLIGHT, MAX_QUEUE, retry_after_seconds=RETRY_AFTER_SECONDS)
 
 
 @app.on_event("startup")
 async def startup_load():
-    service.start_background_load()
+    registry.ensure_loading(registry.default_model)
+
+
+@app.on_event("shutdown")
+async def shutdown_executor():
+    executor.shutdown()
+    registry.shutdown()
+
 
 @app.get("/")
 async def root():
@@ -46,46 +130,361 @@ async def healthz():
 
 @app.get("/readyz")
 async def readyz():
-    return {"ready": bool(service.ready)}
+    return {"ready": bool(registry.default.ready)}
+
+
+def _state_lines() -> list[str]:
+    """Gauges and counters read from live objects at scrape time."""
+    services = registry.services()
+    loaded = [s for s in services if s.ready and s.scheduler is not None]
+    cached = [s for s in services if s.prefix_cache is not None]
+    speculative = [s for s in loaded if s.speculative is not None]
+    coalescing = [s for s in services if s.single_flight is not None]
+    tokenizing = [s for s in services if s.prompts is not None]
+    lines = []
+    lines += render_family(
+        "model_ready", "gauge", "1 if model is loaded", [({"model": s.model_name}, int(s.ready)) for s in services]
+    )
+    lines += render_family("model_registry_loads", "counter", "Models loaded since start", [({}, registry.loads)])
+    lines += render_family(
+        "model_registry_load_failures", "counter", "Model loads that failed", [({}, registry.load_failures)]
+    )
+    lines += render_family(
+        "model_registry_evictions",
+        "counter",
+        "Models unloaded to stay within the RAM budget",
+        [({}, registry.evictions)],
+    )
+    lines += render_family(
+        "model_registry_ram_budget_bytes",
+        "gauge",
+        "Configured RAM budget for loaded models (0 = unlimited)",
+        [({}, registry.ram_budget_bytes)],
+    )
+    lines += render_family(
+        "model_resident_bytes",
+        "gauge",
+        "Resident memory attributed to a loaded model (weights + prefix cache)",
+        [({"model": s.model_name, "backend": s.backend.name}, registry.resident_bytes(s)) for s in services],
+    )
+    lines += render_family(
+        "model_startup_phase_seconds",
+        "gauge",
+        "Time spent in each phase of the last load",
+        [
+            ({"model": s.model_name, "phase": phase}, round(seconds, 3))
+            for s in services
+            for phase, seconds in s.startup_phases.items()
+        ],
+    )
+    lines += render_family(
+        "model_inference_in_flight", "gauge", "Inference jobs currently running", [({}, executor.in_flight)]
+    )
+    lines += render_family(
+        "model_inference_queued", "gauge", "Inference jobs admitted and waiting for a worker", [({}, executor.queued)]
+    )
+    lines += render_family(
+        "model_inference_rejected",
+        "counter",
+        "Requests turned away because the queue was full",
+        [({}, executor.rejected)],
+    )
+    lines += render_family(
+        "model_inference_cancelled",
+        "counter",
+        "Inference jobs cancelled by client disconnect",
+        [({}, executor.cancelled)],
+    )
+    lines += render_family(
+        "model_batch_size",
+        "gauge",
+        "Requests currently decoding in the running batch",
+        [({"model": s.model_name}, s.scheduler.batch_size) for s in loaded],
+    )
+    lines += render_family(
+        "model_queue_depth",
+        "gauge",
+        "Requests waiting to join the batch",
+        [({"model": s.model_name}, s.scheduler.queue_depth) for s in loaded],
+    )
+    lines += render_family(
+        "model_prefix_cache_hits",
+        "counter",
+        "Prefills that reused a cached prompt prefix",
+        [({"model": s.model_name}, s.prefix_cache.hits) for s in cached],
+    )
+    lines += render_family(
+        "model_prefix_cache_misses",
+        "counter",
+        "Prefills that found no cached prompt prefix",
+        [({"model": s.model_name}, s.prefix_cache.misses) for s in cached],
+    )
+    lines += render_family(
+        "model_prefix_cache_bytes",
+        "gauge",
+        "Memory held by cached prefix key/values",
+        [({"model": s.model_name}, s.prefix_cache.bytes_used) for s in cached],
+    )
+    if response_cache is not None:
+        lines += render_family(
+            "model_response_cache_hits",
+            "counter",
+            "Generations served from the response cache",
+            [({}, response_cache.hits)],
+        )
+        lines += render_family(
+            "model_response_cache_disk_hits",
+            "counter",
+            "Response cache hits served from the disk tier",
+            [({}, response_cache.disk_hits)],
+        )
+        lines += render_family(
+            "model_response_cache_misses",
+            "counter",
+            "Cacheable generations that had to run the model",
+            [({}, response_cache.misses)],
+        )
+        lines += render_family(
+            "model_response_cache_disk_bytes", "gauge", "Size of the on-disk tier", [({}, response_cache.disk_bytes)]
+        )
+        lines += render_family(
+            "model_response_cache_disk_evictions",
+            "counter",
+            "Completions removed from disk to stay under MODEL_RESPONSE_CACHE_DISK_MB",
+            [({}, response_cache.disk_evictions)],
+        )
+    lines += render_family(
+        "model_prompt_cache_hits",
+        "counter",
+        "Prompts whose token ids were reused from the prompt cache",
+        [({"model": s.model_name}, s.prompts.hits) for s in tokenizing],
+    )
+    lines += render_family(
+        "model_prompt_cache_misses",
+        "counter",
+        "Prompts that had to be rendered and tokenized",
+        [({"model": s.model_name}, s.prompts.misses) for s in tokenizing],
+    )
+    lines += render_family(
+        "model_prompt_cache_tokens",
+        "gauge",
+        "Token ids held by the prompt cache",
+        [({"model": s.model_name}, s.prompts.cached_tokens) for s in tokenizing],
+    )
+    lines += render_family(
+        "model_coalesce_leaders",
+        "counter",
+        "Coalescable requests that started a generation of their own",
+        [({"model": s.model_name}, s.single_flight.leaders) for s in coalescing],
+    )
+    lines += render_family(
+        "model_coalesced_requests",
+        "counter",
+        "Requests that attached to an identical generation already in flight",
+        [({"model": s.model_name}, s.single_flight.followers) for s in coalescing],
+    )
+    lines += render_family(
+        "model_coalesce_in_flight",
+        "gauge",
+        "Shared generations currently in flight",
+        [({"model": s.model_name}, len(s.single_flight)) for s in coalescing],
+    )
+    lines += render_family(
+        "model_speculative_proposed_tokens",
+        "counter",
+        "Draft tokens proposed for verification",
+        [
+            ({"model": s.model_name, "mode": mode}, count)
+            for s in speculative
+            for mode, count in s.speculative.proposed.items()
+        ],
+    )
+    lines += render_family(
+        "model_speculative_accepted_tokens",
+        "counter",
+        "Draft tokens accepted by the main model",
+        [
+            ({"model": s.model_name, "mode": mode}, count)
+            for s in speculative
+            for mode, count in s.speculative.accepted.items()
+        ],
+    )
+    lines += render_family(
+        "model_speculative_acceptance_rate",
+        "gauge",
+        "Accepted / proposed draft tokens",
+        [
+            ({"model": s.model_name, "mode": mode}, round(s.speculative.acceptance_rate(mode), 4))
+            for s in speculative
+            for mode in s.speculative.proposed
+        ],
+    )
+    return lines
 
 
 @app.get("/metrics")
 async def metrics():
-    # Minimal Prometheus text format
-    lines = [
-        "# HELP model_ready 1 if model is loaded",
-        "# TYPE model_ready gauge",
-        f"model_ready {{}} {1 if service.ready else 0}",
-    ]
-    return "\n".join(lines) + "\n"
+    lines = _state_lines() + REGISTRY.render()
+    return PlainTextResponse("\n".join(lines) + "\n", media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def _resolve_model(request: PromptRequest) -> ModelService:
+    try:
+        service = registry.ensure_loading(request.model)
+    except UnknownModel:
+        raise HTTPException(status_code=404, detail=f"unknown model: {request.model}")
+    if request.speculative == "draft" and not service.draft_model_name:
+        raise HTTPException(status_code=400, detail="draft decoding requested but no draft model is configured")
+    return service
+
+
+def _overloaded(exc: Overloaded) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="inference queue full",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+def _not_ready() -> HTTPException:
+    return HTTPException(status_code=503, detail="model not ready", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+
+async def _track_stream(endpoint: str, chunks: AsyncIterator[str], start: float) -> AsyncIterator[str]:
+    try:
+        async for chunk in chunks:
+            yield chunk
+    except Exception:
+        REQUEST_ERRORS.inc(endpoint=endpoint, reason="error")
+        raise
+    finally:
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+
+
+def _stop_after_code_block(request: PromptRequest) -> bool:
+    # The default system prompt asks for a single code block, so nothing useful follows it
+    if request.stop_after_code_block is not None:
+        return request.stop_after_code_block
+    return request.system_prompt == PromptRequest.model_fields["system_prompt"].default
+
+
+def _error_reason(exc: HTTPException) -> str:
+    return {400: "bad_request", 404: "unknown_model", 429: "overloaded", 503: "not_ready"}.get(
+        exc.status_code, str(exc.status_code)
+    )
+
 
 @app.post("/generate_code/")
 async def generate_code(request: PromptRequest):
-    if not service.ready:
-        return {"error": "model not ready"}
-    prompt_text = service.build_prompt(request.prompt, request.system_prompt)
-    generated_text = service.generate(
-        prompt_text,
-        max_new_tokens=min(max(1, request.max_new_tokens), 1024),
-        temperature=max(0.0, request.temperature),
-        top_p=min(max(0.0, request.top_p), 1.0),
-    )
+    endpoint = "generate_code"
+    start = time.perf_counter()
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        return await _generate_code(request, endpoint)
+    except HTTPException as exc:
+        REQUEST_ERRORS.inc(endpoint=endpoint, reason=_error_reason(exc))
+        raise
+    except Exception:
+        REQUEST_ERRORS.inc(endpoint=endpoint, reason="error")
+        raise
+    finally:
+        REQUEST_DURATION.observe(time.perf_counter() - start, endpoint=endpoint)
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+
+
+async def _generate_code(request: PromptRequest, endpoint: str):
+    if not _resolve_model(request).ready:
+        raise _not_ready()
+
+    def run(cancelled):
+        with registry.use(request.model) as service:
+            prompt = service.encode_prompt(request.prompt, request.system_prompt)
+            return service.generate(
+                prompt,
+                max_new_tokens=min(max(1, request.max_new_tokens), 1024),
+                temperature=max(0.0, request.temperature),
+                top_p=min(max(0.0, request.top_p), 1.0),
+                stop=request.stop,
+                stop_after_code_block=_stop_after_code_block(request),
+                use_cache=request.cache,
+                cancelled=cancelled,
+                speculative=request.speculative,
+            )
+
+    try:
+        generated_text = await executor.run(run)
+    except Overloaded as exc:
+        raise _overloaded(exc)
+    except (ModelNotReady, SchedulerStopped):
+        # Evicted between the readiness check and the worker picking the job up, or while it ran
+        raise _not_ready()
     return {"generated_code": generated_text}
 
 
+def _stream_format(request: PromptRequest, accept: Optional[str]) -> str:
+    if request.stream_format is not None:
+        return request.stream_format
+    accept = accept or ""
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return "text"
+
+
 @app.post("/generate_code_stream")
-async def generate_code_stream(request: PromptRequest):
-    if not service.ready:
-        return {"error": "model not ready"}
-
-    def token_stream():
-        prompt_text = service.build_prompt(request.prompt, request.system_prompt)
-        for chunk in service.stream(
-            prompt_text,
-            max_new_tokens=min(max(1, request.max_new_tokens), 1024),
-            temperature=max(0.0, request.temperature),
-            top_p=min(max(0.0, request.top_p), 1.0),
-        ):
-            yield chunk
+async def generate_code_stream(request: PromptRequest, accept: Optional[str] = Header(None)):
+    """Plain text deltas by default; with stream_format (or Accept) ndjson/sse, typed frames ending in usage."""
+    endpoint = "generate_code_stream"
+    start = time.perf_counter()
+    stream_format = _stream_format(request, accept)
+    usage: dict = {"model": request.model or registry.default_model}
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        if not _resolve_model(request).ready:
+            raise _not_ready()
 
-    return StreamingResponse(token_stream(), media_type="text/plain")
+        def token_stream(cancelled):
+            with registry.use(request.model) as service:
+                prompt = service.encode_prompt(request.prompt, request.system_prompt)
+                yield from service.stream(
+                    prompt,
+                    max_new_tokens=min(max(1, request.max_new_tokens), 1024),
+                    temperature=max(0.0, request.temperature),
+                    top_p=min(max(0.0, request.top_p), 1.0),
+                    stop=request.stop,
+                    stop_after_code_block=_stop_after_code_block(request),
+                    use_cache=request.cache,
+                    cancelled=cancelled,
+                    speculative=request.speculative,
+                    usage=usage,
+                )
+
+        try:
+            chunks = executor.stream(token_stream)
+        except Overloaded as exc:
+            raise _overloaded(exc)
+    except HTTPException as exc:
+        REQUEST_ERRORS.inc(endpoint=endpoint, reason=_error_reason(exc))
+        REQUESTS_IN_FLIGHT.dec(endpoint=endpoint)
+        raise
+    if stream_format != "text":
+        flush_ms = STREAM_FLUSH_MS if request.flush_ms is None else request.flush_ms
+        chunks = token_frames(
+            chunks,
+            stream_format=stream_format,
+            usage=usage,
+            start=start,
+            flush_ms=flush_ms,
+            heartbeat_seconds=STREAM_HEARTBEAT_SECONDS,
+            # Failures become an error frame instead of a broken response; still count them
+            on_error=lambda exc: REQUEST_ERRORS.inc(endpoint=endpoint, reason="error"),
+        )
+    # Duration and in-flight accounting finish when the last chunk has been sent
+    return StreamingResponse(
+        _track_stream(endpoint, chunks, start),
+        media_type=MEDIA_TYPES[stream_format],
+        # Proxies must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,203 @@
+import logging
+import os
+import shutil
+import time
+from typing import Optional
+
+import torch
+from transformers import AutoModelForCausalLM, DynamicCache
+
+
+logger = logging.getLogger("model-service")
+
+
+def resident_memory_bytes() -> int:
+    """Current RSS of this process, 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def from_pretrained_local_first(loader, name: str, **kwargs):
+    """Load from the local cache without touching the hub, going online only on a miss."""
+    try:
+        return loader.from_pretrained(name, local_files_only=True, **kwargs)
+    except OSError:
+        return loader.from_pretrained(name, **kwargs)
+
+
+def cpu_supports_bf16() -> bool:
+    if not torch.backends.mkldnn.is_available():
+        return False
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+class Backend:
+    """How weights are loaded and prepared for CPU inference.
+
+    Subclasses override ``dtype`` and/or ``prepare``; ``warmup`` runs a short
+    prefill and decode step so lazy kernels (and torch.compile graphs) are
+    built before the service reports ready.
+    """
+
+    name = "fp32"
+    dtype: Optional[torch.dtype] = None
+
+    @property
+    def storage_dtype(self) -> torch.dtype:
+        return self.dtype or torch.float32
+
+    def converted_dir(self, model_name: str, cache_dir: str) -> str:
+        dtype = str(self.storage_dtype).replace("torch.", "")
+        return os.path.join(cache_dir, "converted", model_name.replace("/", "--") + "--" + dtype)
+
+    def load(self, model_name: str, cache_dir: str, preconvert: bool = True):
+        """Load weights, preferring a snapshot already converted to this backend's dtype.
+
+        Converted snapshots are plain safetensors, which from_pretrained memory-maps,
+        so restarts skip both the hub lookup and the dtype conversion.
+        """
+        converted = self.converted_dir(model_name, cache_dir)
+        if os.path.isfile(os.path.join(converted, "config.json")):
+            model = AutoModelForCausalLM.from_pretrained(
+                converted,
+                torch_dtype=self.storage_dtype,
+                use_safetensors=True,
+                local_files_only=True,
+                low_cpu_mem_usage=True,
+            )
+        else:
+            model = from_pretrained_local_first(
+                AutoModelForCausalLM,
+                model_name,
+                cache_dir=cache_dir,
+                torch_dtype=self.storage_dtype,
+                low_cpu_mem_usage=True,
+            )
+            if preconvert:
+                self._save_converted(model, converted)
+        model.to("cpu")
+        model.eval()
+        return self.prepare(model)
+
+    @staticmethod
+    def _save_converted(model, path: str) -> None:
+        tmp_path = path + ".tmp"
+        try:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            model.save_pretrained(tmp_path, safe_serialization=True)
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+            logger.info("Saved converted weights to %s", path)
+        except OSError as exc:
+            logger.warning("Could not save converted weights to %s: %s", path, exc)
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def prepare(self, model):
+        return model
+
+    def warmup(self, model, input_ids: list[int], steps: int = 2) -> float:
+        """Exercise the same call shapes the scheduler uses: single-row prefill, batched masked decode."""
+        start = time.time()
+        length = len(input_ids)
+        with torch.inference_mode():
+            for _ in range(steps):
+                cache = DynamicCache()
+                outputs = model(
+                    input_ids=torch.tensor([input_ids, input_ids], dtype=torch.long),
+                    past_key_values=cache,
+                    use_cache=True,
+                    logits_to_keep=1,
+                )
+                next_tokens = outputs.logits[:, -1, :].argmax(dim=-1, keepdim=True)
+                model(
+                    input_ids=next_tokens,
+                    attention_mask=torch.ones((2, length + 1), dtype=torch.long),
+                    position_ids=torch.full((2, 1), length, dtype=torch.long),
+                    past_key_values=cache,
+                    use_cache=True,
+                )
+        return time.time() - start
+
+
+class Bf16Backend(Backend):
+    name = "bf16"
+    dtype = torch.bfloat16
+
+
+class Int8Backend(Backend):
+    """Dynamic int8 quantization of every Linear layer (weights int8, activations quantized on the fly)."""
+
+    name = "int8"
+
+    def prepare(self, model):
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class _CompiledForward:
+    """torch.compile'd forward that drops back to eager if compilation fails."""
+
+    def __init__(self, forward) -> None:
+        self.eager = forward
+        # Prefill and decode shapes vary per request; dynamic avoids a recompile per length
+        self.compiled = torch.compile(forward, dynamic=True)
+        self.failed = False
+
+    def __call__(self, *args, **kwargs):
+        if not self.failed:
+            try:
+                return self.compiled(*args, **kwargs)
+            except Exception as exc:  # noqa: BLE001
+                # Compilation errors surface before the graph runs, so the cache is untouched
+                logger.warning("torch.compile failed, using eager forward: %s", str(exc).splitlines()[0])
+                self.failed = True
+        return self.eager(*args, **kwargs)
+
+
+class CompiledBackend(Backend):
+    """Wraps another backend and compiles the model's forward pass."""
+
+    def __init__(self, inner: Backend) -> None:
+        self.inner = inner
+        self.name = inner.name + "+compile"
+        self.dtype = inner.dtype
+
+    def prepare(self, model):
+        model = self.inner.prepare(model)
+        model.forward = _CompiledForward(model.forward)
+        return model
+
+    def warmup(self, model, input_ids: list[int], steps: int = 3) -> float:
+        return super().warmup(model, input_ids, steps=steps)
+
+
+BACKENDS = {
+    "fp32": Backend,
+    "bf16": Bf16Backend,
+    "int8": Int8Backend,
+}
+
+
+def get_backend(spec: str) -> Backend:
+    """Resolve a spec such as ``int8`` or ``bf16+compile``."""
+    parts = [p.strip() for p in spec.lower().split("+") if p.strip()]
+    base = parts[0] if parts and parts[0] != "compile" else "fp32"
+    if base not in BACKENDS:
+        raise ValueError(f"Unknown model backend: {base}")
+    if base == "bf16" and not cpu_supports_bf16():
+        logger.warning("CPU lacks native bf16 support; falling back to fp32")
+        base = "fp32"
+    backend = BACKENDS[base]()
+    if "compile" in parts:
+        backend = CompiledBackend(backend)
+    return backend
@@ -1,16 +1,39 @@
 import argparse
+import json
 import os
 import sys
 import requests
 
 
 def stream_generate(url: str, prompt: str) -> None:
-    resp = requests.post(url, json={"prompt": prompt}, stream=True)
+    """Print a completion as its NDJSON token frames arrive, then its usage on stderr."""
+    resp = requests.post(url, json={"prompt": prompt, "stream_format": "ndjson"}, stream=True)
+    if resp.status_code in (429, 503):
+        retry_after = resp.headers.get("Retry-After", "a few")
+        print(f"Error: model service busy or not ready ({resp.status_code}); retry in {retry_after} seconds", file=sys.stderr)
+        sys.exit(1)
     resp.raise_for_status()
-    for chunk in resp.iter_content(chunk_size=None):
-        if chunk:
-            sys.stdout.write(chunk.decode("utf-8", errors="ignore"))
+    for line in resp.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        frame = json.loads(line)
+        kind = frame.get("type")
+        if kind == "token":
+            sys.stdout.write(frame["text"])
             sys.stdout.flush()
+        elif kind == "error":
+            print(f"\nError: {frame.get('detail')}", file=sys.stderr)
+            sys.exit(1)
+        elif kind == "done":
+            sys.stdout.write("\n")
+            print(
+                f"[{frame.get('model')}] {frame.get('prompt_tokens')} prompt + "
+                f"{frame.get('completion_tokens')} completion tokens, "
+                f"first token {frame.get('ttft_ms')} ms, total {frame.get('duration_ms')} ms, "
+                f"finish: {frame.get('finish_reason')}",
+                file=sys.stderr,
+            )
+        # heartbeat frames only keep the connection alive
 
 
 def generate_code_cli(base_url: str, prompt: str, stream: bool) -> None:
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+
+from metrics import QUEUE_WAIT
+
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("inference queue is full")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Bounded worker pool for blocking inference calls, with admission control.
+
+    At most ``max_in_flight`` jobs run at once and at most ``max_queue`` more
+    may wait; anything beyond that is rejected with ``Overloaded`` so the HTTP
+    layer can answer 429 instead of piling up work. Every job receives a
+    ``threading.Event`` that is set when the caller goes away.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, retry_after_seconds: int = 1) -> None:
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.retry_after_seconds = retry_after_seconds
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="inference")
+
+    def _admit(self) -> None:
+        with self._lock:
+            if self.in_flight + self.queued >= self.max_in_flight + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.retry_after_seconds)
+            self.queued += 1
+
+    def _started(self) -> None:
+        with self._lock:
+            self.queued -= 1
+            self.in_flight += 1
+
+    def _finished(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def _submit(self, fn: Callable[[], T]):
+        submitted_at = time.perf_counter()
+
+        def job() -> T:
+            QUEUE_WAIT.observe(time.perf_counter() - submitted_at, stage="executor")
+            self._started()
+            try:
+                return fn()
+            finally:
+                self._finished()
+
+        return self._pool.submit(job)
+
+    async def run(self, fn: Callable[[threading.Event], T]) -> T:
+        """Run ``fn(cancelled)`` on the pool and await its result."""
+        self._admit()
+        cancelled = threading.Event()
+        try:
+            return await asyncio.wrap_future(self._submit(lambda: fn(cancelled)))
+        except asyncio.CancelledError:
+            cancelled.set()
+            self.cancelled += 1
+            raise
+
+    def stream(self, fn: Callable[[threading.Event], Iterator[T]]) -> AsyncIterator[T]:
+        """Drain the sync iterator ``fn(cancelled)`` on the pool, yielding items on the event loop.
+
+        Admission happens here, before the response starts, so callers can still
+        turn ``Overloaded`` into a proper status code.
+        """
+        self._admit()
+        loop = asyncio.get_running_loop()
+        items: "asyncio.Queue" = asyncio.Queue()
+        cancelled = threading.Event()
+
+        def pump() -> None:
+            try:
+                if cancelled.is_set():
+                    return
+                iterator = fn(cancelled)
+                try:
+                    for item in iterator:
+                        loop.call_soon_threadsafe(items.put_nowait, item)
+                        if cancelled.is_set():
+                            break
+                finally:
+                    close = getattr(iterator, "close", None)
+                    if close is not None:
+                        close()
+            except BaseException as exc:  # noqa: BLE001
+                loop.call_soon_threadsafe(items.put_nowait, exc)
+            finally:
+                loop.call_soon_threadsafe(items.put_nowait, _DONE)
+
+        self._submit(pump)
+
+        async def drain() -> AsyncIterator[T]:
+            done = False
+            try:
+                while True:
+                    item = await items.get()
+                    if item is _DONE:
+                        done = True
+                        return
+                    if isinstance(item, BaseException):
+                        done = True
+                        raise item
+                    yield item
+            finally:
+                # Client disconnected or the response was torn down: stop the worker
+                if not done:
+                    cancelled.set()
+                    self.cancelled += 1
+
+        return drain()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
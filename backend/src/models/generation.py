@@ -0,0 +1,165 @@
+import queue
+import threading
+import time
+from typing import Iterator, Optional
+
+import torch
+from transformers import DynamicCache
+
+from prefix_cache import PrefixCache
+from stopping import StopText
+
+
+class GenerationRequest:
+    """A single prompt travelling through the decode loop.
+
+    The scheduler appends sampled token ids and pushes decoded text deltas onto
+    ``chunks``; the HTTP side drains them with ``iter_chunks``. A request shared
+    by coalesced callers is handed a ``single_flight.Broadcast`` as ``chunks``
+    instead, and its subscribers read from that.
+    """
+
+    def __init__(
+        self,
+        input_ids: list[int],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        prefix_len: int = 0,
+        cancelled: Optional[threading.Event] = None,
+        chunks=None,
+        stop: Optional[StopText] = None,
+    ) -> None:
+        self.input_ids = input_ids
+        # Leading tokens shared with other prompts (system prompt + template header)
+        self.prefix_len = prefix_len
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.output_ids: list[int] = []
+        self.chunks: "queue.Queue[Optional[str]]" = chunks if chunks is not None else queue.Queue()
+        self.cancelled = cancelled if cancelled is not None else threading.Event()
+        # Stop sequences / code-block mode, checked on the decoded text after every token
+        self.stop = stop if stop else None
+        self.done = False
+        self.finish_reason: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        # perf_counter timestamps for latency metrics
+        self.submitted_at = time.perf_counter()
+        self.started_at: Optional[float] = None
+        self.token_times: list[float] = []
+        # Incremental detokenization offsets (decode a small window, not the whole output)
+        self._prefix_offset = 0
+        self._read_offset = 0
+
+    def add_token(self, token_id: int, tokenizer, eos_token_ids: set[int]) -> None:
+        if self.done:
+            return
+        self.token_times.append(time.perf_counter())
+        if token_id in eos_token_ids:
+            self._emit_text(tokenizer, final=True)
+            self.finish("stop")
+            return
+        self.output_ids.append(token_id)
+        if len(self.output_ids) >= self.max_new_tokens:
+            self._emit_text(tokenizer, final=True)
+            # No-op if a stop sequence ended the request on this last token
+            self.finish("length")
+        else:
+            self._emit_text(tokenizer, final=False)
+
+    def _emit_text(self, tokenizer, *, final: bool) -> None:
+        if self._read_offset >= len(self.output_ids):
+            return
+        prefix_text = tokenizer.decode(
+            self.output_ids[self._prefix_offset:self._read_offset], skip_special_tokens=True
+        )
+        new_text = tokenizer.decode(self.output_ids[self._prefix_offset:], skip_special_tokens=True)
+        # A trailing replacement char means a multi-byte character is still incomplete
+        if not final and new_text.endswith("\ufffd"):
+            return
+        if len(new_text) > len(prefix_text):
+            self._put_text(new_text[len(prefix_text):])
+            self._prefix_offset = self._read_offset
+            self._read_offset = len(self.output_ids)
+
+    def _put_text(self, text: str) -> None:
+        if self.stop is not None:
+            text = self.stop.feed(text)
+        if text:
+            self.chunks.put(text)
+        if self.stop is not None and self.stop.stopped:
+            # Ends the request here; the decode loops drop finished rows before the next step
+            self.finish("stop")
+
+    def finish(self, reason: str) -> None:
+        if self.done:
+            return
+        if self.stop is not None and reason in ("stop", "length"):
+            tail = self.stop.flush()
+            if tail:
+                self.chunks.put(tail)
+        self.done = True
+        self.finish_reason = reason
+        self.chunks.put(None)
+
+    def fail(self, exc: BaseException) -> None:
+        self.error = exc
+        self.finish("error")
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    def iter_chunks(self) -> Iterator[str]:
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+        if self.error is not None:
+            raise self.error
+
+
+def sample_next_tokens(logits: torch.Tensor, temperatures: torch.Tensor, top_ps: torch.Tensor) -> torch.Tensor:
+    """Sample one token per row; rows with temperature <= 0 decode greedily."""
+    greedy_tokens = logits.argmax(dim=-1)
+    greedy = temperatures <= 0
+    if bool(greedy.all()):
+        return greedy_tokens
+    scaled = logits.float() / temperatures.clamp(min=1e-5).unsqueeze(1)
+    probs = torch.softmax(scaled, dim=-1)
+    sorted_probs, sorted_idx = probs.sort(dim=-1, descending=True)
+    cumulative = sorted_probs.cumsum(dim=-1)
+    # Drop tokens once the mass before them already exceeds top_p (always keeps the top-1)
+    sorted_probs = sorted_probs.masked_fill((cumulative - sorted_probs) > top_ps.unsqueeze(1), 0.0)
+    choice = torch.multinomial(sorted_probs, num_samples=1)
+    sampled_tokens = sorted_idx.gather(1, choice).squeeze(1)
+    return torch.where(greedy, greedy_tokens, sampled_tokens)
+
+
+def prefill(
+    model, request: GenerationRequest, prefix_cache: Optional[PrefixCache] = None
+) -> tuple[DynamicCache, torch.Tensor]:
+    """Run the prompt through the model, starting from a cached prefix when possible.
+
+    Returns the filled cache and the logits for the first generated position.
+    """
+    request.started_at = time.perf_counter()
+    input_ids = request.input_ids
+    start = 0
+    cached = prefix_cache.lookup(input_ids) if prefix_cache is not None else None
+    if cached is not None:
+        start, kv = cached
+        cache = DynamicCache.from_legacy_cache(kv)
+    else:
+        cache = DynamicCache()
+        if prefix_cache is not None and 0 < request.prefix_len < len(input_ids):
+            # Prefill the shared prefix on its own so later requests can start from it
+            prefix = torch.tensor([input_ids[:request.prefix_len]], dtype=torch.long)
+            model(input_ids=prefix, past_key_values=cache, use_cache=True, logits_to_keep=1)
+            prefix_cache.insert(input_ids[:request.prefix_len], cache.to_legacy_cache())
+            start = request.prefix_len
+    suffix = torch.tensor([input_ids[start:]], dtype=torch.long)
+    outputs = model(input_ids=suffix, past_key_values=cache, use_cache=True, logits_to_keep=1)
+    return cache, outputs.logits[:, -1, :]
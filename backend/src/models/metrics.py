@@ -0,0 +1,194 @@
+import contextlib
+import threading
+import time
+from typing import Iterable, Iterator, Optional, Sequence
+
+import histogram
+from exposition import format_labels, format_value
+from histogram import LATENCY_BUCKETS
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list["_Metric"] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> list[str]:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return lines
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """A metric family; children are keyed by label values and created on first use."""
+
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key: tuple[str, ...]) -> str:
+        return format_labels(dict(zip(self.labelnames, key)))
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{self._labels(key)} {format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram(_Metric):
+    """A family of ``histogram.Histogram`` series, one per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        self._values: dict[tuple[str, ...], histogram.Histogram] = {}
+
+    def _child(self, key: tuple[str, ...]) -> histogram.Histogram:
+        child = self._values.get(key)
+        if child is None:
+            child = self._values[key] = histogram.Histogram(self.buckets)
+        return child
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._child(key).observe(value)
+
+    def observe_many(self, values: Iterable[float], **labels) -> None:
+        """Record a batch of observations under a single lock acquisition."""
+        key = self._key(labels)
+        values = list(values)
+        if not values:
+            return
+        with self._lock:
+            child = self._child(key)
+            for value in values:
+                child.observe(value)
+
+    @contextlib.contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        child = self._values.get(self._key(labels))
+        return child.count if child else 0
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [
+                line
+                for key, child in self._values.items()
+                for line in child.lines(self.name, dict(zip(self.labelnames, key)))
+            ]
+
+
+REQUEST_DURATION = Histogram(
+    "model_request_duration_seconds",
+    "End-to-end request latency; for streams, until the last chunk is sent",
+    ["endpoint"],
+)
+REQUESTS_IN_FLIGHT = Gauge("model_requests_in_flight", "Requests currently being handled", ["endpoint"])
+REQUEST_ERRORS = Counter("model_request_errors_total", "Requests that did not produce a completion", ["endpoint", "reason"])
+QUEUE_WAIT = Histogram(
+    "model_queue_wait_seconds",
+    "Time spent waiting for an inference worker (executor) or a batch slot (batch)",
+    ["stage"],
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "model_time_to_first_token_seconds", "From submission to the first generated token", ["model"]
+)
+INTER_TOKEN_LATENCY = Histogram(
+    "model_inter_token_latency_seconds",
+    "Gap between consecutive generated tokens",
+    ["model"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+PROMPT_TOKENS = Histogram("model_prompt_tokens", "Prompt length per request", ["model"], buckets=TOKEN_BUCKETS)
+COMPLETION_TOKENS = Histogram(
+    "model_completion_tokens", "Generated tokens per request", ["model"], buckets=TOKEN_BUCKETS
+)
+TOKENS_PER_SECOND = Histogram(
+    "model_decode_tokens_per_second", "Per-request decode throughput after the first token", ["model"],
+    buckets=RATE_BUCKETS,
+)
+TOKENIZE_DURATION = Histogram(
+    "model_tokenize_seconds",
+    "Rendering the chat template and tokenizing a prompt, by path: cached, prefix (system turn reused) or full",
+    ["model", "path"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
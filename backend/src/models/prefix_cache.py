@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+
+
+LegacyKV = tuple[tuple[torch.Tensor, torch.Tensor], ...]
+
+
+def kv_nbytes(kv: LegacyKV) -> int:
+    return sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in kv)
+
+
+class PrefixCache:
+    """LRU of prefilled key/value states for shared prompt prefixes.
+
+    Entries are keyed by the exact prefix token ids and stored in the legacy
+    per-layer ``(key, value)`` tuple form with batch size 1. The decode loop
+    never mutates cache tensors in place, so entries are handed out without
+    copying.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes_used = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple[int, ...], tuple[LegacyKV, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, input_ids: list[int]) -> Optional[tuple[int, LegacyKV]]:
+        """Return ``(prefix_len, kv)`` for the longest cached prefix of ``input_ids``.
+
+        At least one token is always left over so the caller still gets logits
+        for the next position.
+        """
+        with self._lock:
+            best: Optional[tuple[int, ...]] = None
+            for key in self._entries:
+                n = len(key)
+                if n < len(input_ids) and (best is None or n > len(best)) and tuple(input_ids[:n]) == key:
+                    best = key
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return len(best), self._entries[best][0]
+
+    def insert(self, prefix_ids: list[int], kv: LegacyKV) -> None:
+        key = tuple(prefix_ids)
+        size = kv_nbytes(kv)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = (kv, size)
+            self.bytes_used += size
+            while self.bytes_used > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes_used -= evicted
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes_used = 0
@@ -0,0 +1,142 @@
+import contextlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+from service import ModelService
+
+
+logger = logging.getLogger("model-service")
+
+
+class UnknownModel(KeyError):
+    pass
+
+
+class ModelNotReady(RuntimeError):
+    pass
+
+
+class ModelRegistry:
+    """Serves several models from one process.
+
+    Models are created up front but only loaded on first use (in a background
+    thread, like the startup load). Once the summed resident memory of loaded
+    models exceeds ``ram_budget_bytes``, the least recently used idle models are
+    unloaded; models with requests in flight are never evicted, and neither is
+    the default model, whose readiness is what /readyz reports.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], ModelService],
+        model_names: list[str],
+        *,
+        ram_budget_bytes: int = 0,
+    ) -> None:
+        if not model_names:
+            raise ValueError("at least one model name is required")
+        self.default_model = model_names[0]
+        self.ram_budget_bytes = ram_budget_bytes
+        self.loads = 0
+        self.evictions = 0
+        self.load_failures = 0
+        # Insertion order doubles as recency order (most recently used last)
+        self._services: "OrderedDict[str, ModelService]" = OrderedDict(
+            (name, factory(name)) for name in model_names
+        )
+        self._in_use: dict[str, int] = {name: 0 for name in model_names}
+        self._loading: set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def default(self) -> ModelService:
+        return self._services[self.default_model]
+
+    def services(self) -> list[ModelService]:
+        return list(self._services.values())
+
+    def get(self, name: Optional[str]) -> ModelService:
+        name = name or self.default_model
+        service = self._services.get(name)
+        if service is None:
+            raise UnknownModel(name)
+        return service
+
+    def ensure_loading(self, name: Optional[str]) -> ModelService:
+        """Return the service, kicking off a background load if it isn't loaded yet."""
+        service = self.get(name)
+        with self._lock:
+            if service.ready or service.model_name in self._loading:
+                return service
+            self._loading.add(service.model_name)
+        thread = threading.Thread(target=self._load, args=(service,), daemon=True)
+        thread.start()
+        return service
+
+    def _load(self, service: ModelService) -> None:
+        start = time.time()
+        try:
+            service.load()
+            self.loads += 1
+            logger.info("Loaded model %s in %.2fs", service.model_name, time.time() - start)
+        except Exception as exc:  # noqa: BLE001
+            self.load_failures += 1
+            logger.exception("Failed to load model %s: %s", service.model_name, exc)
+            service.ready = False
+        finally:
+            with self._lock:
+                self._loading.discard(service.model_name)
+                self._services.move_to_end(service.model_name)
+        self._enforce_budget(keep=service.model_name)
+
+    @contextlib.contextmanager
+    def use(self, name: Optional[str]) -> Iterator[ModelService]:
+        """Pin a loaded model for the duration of a request."""
+        service = self.get(name)
+        with self._lock:
+            if not service.ready:
+                raise ModelNotReady(service.model_name)
+            self._in_use[service.model_name] += 1
+            self._services.move_to_end(service.model_name)
+        try:
+            yield service
+        finally:
+            with self._lock:
+                self._in_use[service.model_name] -= 1
+
+    def resident_bytes(self, service: ModelService) -> int:
+        cache_bytes = service.prefix_cache.bytes_used if service.prefix_cache is not None else 0
+        return service.resident_bytes + cache_bytes if service.ready else 0
+
+    def _enforce_budget(self, keep: str) -> None:
+        if self.ram_budget_bytes <= 0:
+            return
+        while True:
+            with self._lock:
+                total = sum(self.resident_bytes(s) for s in self._services.values())
+                if total <= self.ram_budget_bytes:
+                    return
+                victim = next(
+                    (
+                        s
+                        for name, s in self._services.items()
+                        if s.ready and name not in (keep, self.default_model) and self._in_use[name] == 0
+                    ),
+                    None,
+                )
+                if victim is None:
+                    logger.warning("Model memory %d bytes exceeds budget but nothing is evictable", total)
+                    return
+                # Flip readiness under the lock so no new request can pin it
+                victim.ready = False
+            logger.info("Evicting model %s to stay within the RAM budget", victim.model_name)
+            victim.unload()
+            self.evictions += 1
+
+    def shutdown(self) -> None:
+        for service in self._services.values():
+            if service.ready:
+                service.unload()
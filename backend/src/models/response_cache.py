@@ -0,0 +1,40 @@
+import hashlib
+import json
+from typing import Optional
+
+from ttl_cache import TTLCache
+
+
+class ResponseCache(TTLCache):
+    """TTL + LRU cache of finished completions, with an optional size-bounded on-disk tier.
+
+    Only deterministic requests (or ones that opted in) should be stored here;
+    the key covers everything that influences the output. Entries keep the
+    finish reason and completion token count so a replay reports them as the
+    original generation did.
+    """
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        prompt_text: str,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]],
+        stop_after_code_block: bool = False,
+    ) -> str:
+        payload = json.dumps(
+            [model_name, prompt_text, max_new_tokens, temperature, top_p, stop or [], stop_after_code_block],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        """``{"text", "finish_reason", "completion_tokens"}`` of a stored completion."""
+        entry = super().get(key)
+        return dict(entry) if entry is not None else None
+
+    def put(self, key: str, text: str, *, finish_reason: str, completion_tokens: int) -> None:
+        super().put(key, {"text": text, "finish_reason": finish_reason, "completion_tokens": completion_tokens})
@@ -0,0 +1,263 @@
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+from generation import GenerationRequest, prefill, sample_next_tokens
+from prefix_cache import PrefixCache
+
+
+logger = logging.getLogger("model-service")
+
+
+def _left_pad(tensor: torch.Tensor, width: int, dim: int) -> torch.Tensor:
+    missing = width - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    # F.pad takes (left, right) pairs starting from the last dimension
+    pad = [0, 0] * (tensor.dim() - dim - 1) + [missing, 0]
+    return F.pad(tensor, pad)
+
+
+class SchedulerStopped(RuntimeError):
+    """The scheduler shut down before the request finished."""
+
+
+class BatchScheduler:
+    """Continuous batching over a shared, left-padded KV cache.
+
+    Requests are prefilled one at a time and merged into the running batch
+    between decode steps; finished or cancelled rows are dropped right away, so
+    a long generation never holds a short one hostage.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        *,
+        max_batch_size: int = 8,
+        max_queue_wait_ms: float = 10.0,
+        prefix_cache: Optional[PrefixCache] = None,
+    ) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix_cache = prefix_cache
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_queue_wait = max(0.0, max_queue_wait_ms) / 1000.0
+        self.eos_token_ids = self._eos_token_ids()
+        self._pending: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._active: list[GenerationRequest] = []
+        self._cache: Optional[DynamicCache] = None
+        self._attention_mask: Optional[torch.Tensor] = None
+        self._positions: Optional[torch.Tensor] = None
+        self._next_tokens: Optional[torch.Tensor] = None
+        self._stopping = threading.Event()
+        # Orders submit() against stop(), so nothing is queued after the final drain
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _eos_token_ids(self) -> set[int]:
+        ids = set()
+        if self.tokenizer.eos_token_id is not None:
+            ids.add(self.tokenizer.eos_token_id)
+        config_eos = getattr(getattr(self.model, "generation_config", None), "eos_token_id", None)
+        if isinstance(config_eos, int):
+            ids.add(config_eos)
+        elif config_eos:
+            ids.update(config_eos)
+        return ids
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending.qsize()
+
+    @property
+    def batch_size(self) -> int:
+        return len(self._active)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop decoding and fail every queued or running request, so no caller waits forever."""
+        with self._lock:
+            self._stopping.set()
+        self._fail_pending()
+        # Wakes the loop if it is blocked waiting for work
+        self._pending.put(None)
+
+    def submit(self, request: GenerationRequest) -> None:
+        with self._lock:
+            if not self._stopping.is_set():
+                self._pending.put(request)
+                return
+        request.fail(SchedulerStopped("scheduler stopped"))
+
+    def _fail_pending(self) -> None:
+        while True:
+            try:
+                request = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if request is not None:
+                request.fail(SchedulerStopped("scheduler stopped"))
+
+    def _run(self) -> None:
+        with torch.inference_mode():
+            while not self._stopping.is_set():
+                self._admit()
+                if not self._active:
+                    continue
+                try:
+                    self._step()
+                except Exception as exc:  # noqa: BLE001
+                    logger.exception("Decode step failed: %s", exc)
+                    for request in self._active:
+                        request.fail(exc)
+                    self._reset()
+        for request in self._active:
+            request.fail(SchedulerStopped("scheduler stopped"))
+        self._reset()
+
+    def _admit(self) -> None:
+        free = self.max_batch_size - len(self._active)
+        if free <= 0:
+            return
+        incoming: list[GenerationRequest] = []
+        if not self._active:
+            # Idle: block for the first request, then linger briefly so a burst lands in one batch
+            first = self._pending.get()
+            if first is None:
+                return
+            incoming.append(first)
+            deadline = time.monotonic() + self.max_queue_wait
+            while len(incoming) < free:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._pending.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    break
+                incoming.append(request)
+        else:
+            # Mid-flight: only pick up what is already waiting, never stall running rows
+            while len(incoming) < free:
+                try:
+                    request = self._pending.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    break
+                incoming.append(request)
+
+        for request in incoming:
+            if request.cancelled.is_set():
+                request.finish("cancelled")
+                continue
+            try:
+                self._join(request)
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Prefill failed: %s", exc)
+                request.fail(exc)
+
+    def _join(self, request: GenerationRequest) -> None:
+        cache, logits = prefill(self.model, request, self.prefix_cache)
+        token = sample_next_tokens(
+            logits,
+            torch.tensor([request.temperature]),
+            torch.tensor([request.top_p]),
+        )
+        request.add_token(int(token[0]), self.tokenizer, self.eos_token_ids)
+        if request.done:
+            return
+
+        length = len(request.input_ids)
+        attention_mask = torch.ones((1, length), dtype=torch.long)
+        positions = torch.tensor([length], dtype=torch.long)
+        if self._cache is None:
+            self._cache = cache
+            self._attention_mask = attention_mask
+            self._positions = positions
+            self._next_tokens = token
+        else:
+            width = max(self._attention_mask.shape[1], length)
+            layers = []
+            for (old_k, old_v), (new_k, new_v) in zip(self._cache.to_legacy_cache(), cache.to_legacy_cache()):
+                layers.append((
+                    torch.cat([_left_pad(old_k, width, 2), _left_pad(new_k, width, 2)]),
+                    torch.cat([_left_pad(old_v, width, 2), _left_pad(new_v, width, 2)]),
+                ))
+            self._cache = DynamicCache.from_legacy_cache(tuple(layers))
+            self._attention_mask = torch.cat(
+                [_left_pad(self._attention_mask, width, 1), _left_pad(attention_mask, width, 1)]
+            )
+            self._positions = torch.cat([self._positions, positions])
+            self._next_tokens = torch.cat([self._next_tokens, token])
+        self._active.append(request)
+
+    def _step(self) -> None:
+        self._drop_finished()
+        if not self._active:
+            return
+        batch = len(self._active)
+        self._attention_mask = torch.cat(
+            [self._attention_mask, torch.ones((batch, 1), dtype=torch.long)], dim=1
+        )
+        outputs = self.model(
+            input_ids=self._next_tokens.unsqueeze(1),
+            attention_mask=self._attention_mask,
+            position_ids=self._positions.unsqueeze(1),
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        tokens = sample_next_tokens(
+            outputs.logits[:, -1, :],
+            torch.tensor([r.temperature for r in self._active]),
+            torch.tensor([r.top_p for r in self._active]),
+        )
+        self._positions = self._positions + 1
+        self._next_tokens = tokens
+        for request, token in zip(self._active, tokens.tolist()):
+            request.add_token(token, self.tokenizer, self.eos_token_ids)
+        self._drop_finished()
+
+    def _drop_finished(self) -> None:
+        for request in self._active:
+            if request.cancelled.is_set():
+                request.finish("cancelled")
+        keep = [i for i, request in enumerate(self._active) if not request.done]
+        if len(keep) == len(self._active):
+            return
+        if not keep:
+            self._reset()
+            return
+        index = torch.tensor(keep, dtype=torch.long)
+        self._active = [self._active[i] for i in keep]
+        self._cache.batch_select_indices(index)
+        self._attention_mask = self._attention_mask[index]
+        self._positions = self._positions[index]
+        self._next_tokens = self._next_tokens[index]
+        # Trim columns that are now padding for every remaining row
+        first = int(self._attention_mask.any(dim=0).long().argmax())
+        if first > 0:
+            self._attention_mask = self._attention_mask[:, first:]
+            self._cache = DynamicCache.from_legacy_cache(
+                tuple((k[:, :, first:, :], v[:, :, first:, :]) for k, v in self._cache.to_legacy_cache())
+            )
+
+    def _reset(self) -> None:
+        self._active = []
+        self._cache = None
+        self._attention_mask = None
+        self._positions = None
+        self._next_tokens = None
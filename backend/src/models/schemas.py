@@ -1,14 +1,28 @@
-from typing import Optional
+from typing import Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class PromptRequest(BaseModel):
     prompt: str
+    # One of the served models (MODEL_NAMES); defaults to the first
+    model: Optional[str] = None
     max_new_tokens: int = 256
     temperature: float = 0.2
     top_p: float = 0.95
+    # Generation ends before the first of these (matched on text, so they may span tokens)
     stop: Optional[list[str]] = None
+    # End right after the fence closing the first ```code block```; None = on with the default system prompt
+    stop_after_code_block: Optional[bool] = None
+    # Reuse a cached completion (or share an identical one in flight) even when sampling;
+    # temperature 0 requests always are
+    cache: bool = False
+    # Decode with draft-model or prompt n-gram speculation instead of the shared batch
+    speculative: Optional[Literal["draft", "prompt_lookup"]] = None
+    # /generate_code_stream framing: raw text, or typed NDJSON / SSE frames; None = from the Accept header
+    stream_format: Optional[Literal["text", "ndjson", "sse"]] = None
+    # Framed streams: hold each token frame up to this long to batch deltas; None = server default
+    flush_ms: Optional[int] = Field(None, ge=0, le=1000)
     system_prompt: str = (
         "You are a helpful coding assistant. When returning code, output it as fenced markdown with the appropriate language tag (for example ```python ...```). Prefer concise explanations followed by a single complete code block."
     )
@@ -1,36 +1,150 @@
+import gc
 import logging
 import threading
 import time
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Union
 
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    TextIteratorStreamer,
+import torch
+from transformers import AutoTokenizer, DynamicCache
+
+from backends import from_pretrained_local_first, get_backend, resident_memory_bytes
+from generation import GenerationRequest
+from metrics import (
+    COMPLETION_TOKENS,
+    INTER_TOKEN_LATENCY,
+    PROMPT_TOKENS,
+    QUEUE_WAIT,
+    TIME_TO_FIRST_TOKEN,
+    TOKENS_PER_SECOND,
 )
+from prefix_cache import PrefixCache
+from response_cache import ResponseCache
+from scheduler import BatchScheduler
+from single_flight import SingleFlight
+from speculative import SpeculativeDecoder
+from stopping import StopText
+from tokenization import EncodedPrompt, PromptTokenizer
 
 
 logger = logging.getLogger("model-service")
 
 
 class ModelService:
-    def __init__(self, model_name: str, cache_dir: str = "./model_cache") -> None:
+    def __init__(
+        self,
+        model_name: str,
+        cache_dir: str = "./model_cache",
+        *,
+        max_batch_size: int = 8,
+        max_queue_wait_ms: float = 10.0,
+        prefix_cache_mb: int = 256,
+        warm_system_prompts: Optional[list[str]] = None,
+        response_cache: Optional[ResponseCache] = None,
+        draft_model_name: Optional[str] = None,
+        num_draft_tokens: int = 4,
+        prompt_lookup_ngram: int = 3,
+        backend: str = "fp32",
+        preconvert: bool = True,
+        coalesce: bool = True,
+        prompt_cache_tokens: int = 262144,
+    ) -> None:
         self.model_name = model_name
         self.cache_dir = cache_dir
+        self.max_batch_size = max_batch_size
+        self.max_queue_wait_ms = max_queue_wait_ms
+        self.prefix_cache = PrefixCache(prefix_cache_mb * 1024 * 1024) if prefix_cache_mb > 0 else None
+        self.warm_system_prompts = warm_system_prompts or []
+        self.response_cache = response_cache
+        # Identical deterministic requests in flight at the same time share one generation
+        self.single_flight = SingleFlight() if coalesce else None
+        self.draft_model_name = draft_model_name
+        self.num_draft_tokens = num_draft_tokens
+        self.prompt_lookup_ngram = prompt_lookup_ngram
+        self.backend = get_backend(backend)
+        self.preconvert = preconvert
+        self.prompt_cache_tokens = prompt_cache_tokens
+        self.startup_phases: dict[str, float] = {}
+        self.resident_bytes = 0
         self.tokenizer = None
+        self.prompts: Optional[PromptTokenizer] = None
         self.model = None
+        self.draft_model = None
+        self.scheduler: Optional[BatchScheduler] = None
+        self.speculative: Optional[SpeculativeDecoder] = None
+        # Speculative requests decode one at a time outside the batch, on a single lane
+        self._speculative_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="speculative")
         self.ready = False
 
     def load(self) -> None:
         start = time.time()
         logger.info("Loading tokenizer %s", self.model_name)
-        self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, cache_dir=self.cache_dir)
-        logger.info("Loading model %s", self.model_name)
-        self.model = AutoModelForCausalLM.from_pretrained(self.model_name, cache_dir=self.cache_dir)
-        self.model.to("cpu")
-        self.model.eval()
+        self.tokenizer = from_pretrained_local_first(AutoTokenizer, self.model_name, cache_dir=self.cache_dir)
+        self.prompts = PromptTokenizer(self.tokenizer, model_name=self.model_name, cache_tokens=self.prompt_cache_tokens)
+        self.startup_phases["tokenizer"] = time.time() - start
+
+        phase_start = time.time()
+        rss_before = resident_memory_bytes()
+        logger.info("Loading model %s with %s backend", self.model_name, self.backend.name)
+        self.model = self.backend.load(self.model_name, self.cache_dir, preconvert=self.preconvert)
+        if self.draft_model_name:
+            logger.info("Loading draft model %s", self.draft_model_name)
+            self.draft_model = self.backend.load(self.draft_model_name, self.cache_dir, preconvert=self.preconvert)
+        self.resident_bytes = max(0, resident_memory_bytes() - rss_before)
+        self.startup_phases["weights"] = time.time() - phase_start
+
+        phase_start = time.time()
+        self.scheduler = BatchScheduler(
+            self.model,
+            self.tokenizer,
+            max_batch_size=self.max_batch_size,
+            max_queue_wait_ms=self.max_queue_wait_ms,
+            prefix_cache=self.prefix_cache,
+        )
+        self.speculative = SpeculativeDecoder(
+            self.model,
+            self.tokenizer,
+            self.scheduler.eos_token_ids,
+            draft_model=self.draft_model,
+            num_draft_tokens=self.num_draft_tokens,
+            max_ngram=self.prompt_lookup_ngram,
+            prefix_cache=self.prefix_cache,
+        )
+        # Build kernels and fill the prefix cache before readiness flips, so the first
+        # real request doesn't pay for either
+        warmup_ids = self.tokenizer("def main():\n    print('hello')\n")["input_ids"]
+        self.backend.warmup(self.model, warmup_ids)
+        if self.draft_model is not None:
+            self.backend.warmup(self.draft_model, warmup_ids)
+        for system_prompt in self.warm_system_prompts:
+            self.warm_prefix(system_prompt)
+        self.startup_phases["warmup"] = time.time() - phase_start
+
+        self.scheduler.start()
         self.ready = True
-        logger.info("Model loaded in %.2fs", time.time() - start)
+        logger.info(
+            "Model ready in %.2fs (tokenizer %.2fs, weights %.2fs, warmup %.2fs, resident %.0f MiB)",
+            time.time() - start,
+            self.startup_phases["tokenizer"],
+            self.startup_phases["weights"],
+            self.startup_phases["warmup"],
+            self.resident_bytes / (1024 * 1024),
+        )
+
+    def unload(self) -> None:
+        """Drop the weights and caches so the memory can be reclaimed; load() brings them back."""
+        self.ready = False
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        self.scheduler = None
+        self.speculative = None
+        self.model = None
+        self.draft_model = None
+        if self.prefix_cache is not None:
+            self.prefix_cache.clear()
+        self.resident_bytes = 0
+        gc.collect()
+        logger.info("Unloaded model %s", self.model_name)
 
     def start_background_load(self) -> None:
         thread = threading.Thread(target=self._safe_load, daemon=True)
@@ -43,40 +157,312 @@ class ModelService:
             logger.exception("Failed to load model: %s", exc)
             self.ready = False
 
-    def build_prompt(self, user_prompt: str, system_prompt: str) -> str:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-
-    def generate(self, prompt_text: str, *, max_new_tokens: int, temperature: float, top_p: float) -> str:
-        inputs = self.tokenizer(prompt_text, return_tensors="pt")
-        outputs = self.model.generate(
-            input_ids=inputs["input_ids"],
+    def encode_prompt(self, user_prompt: str, system_prompt: str) -> EncodedPrompt:
+        """Render the chat template and tokenize it, reusing cached work (see PromptTokenizer)."""
+        return self.prompts.encode(user_prompt, system_prompt)
+
+    def _encoded(self, prompt: Union[str, EncodedPrompt]) -> EncodedPrompt:
+        if isinstance(prompt, EncodedPrompt):
+            return prompt
+        # Already-rendered text is tokenized as is; its system turn is not shared
+        if self.prompts is not None:
+            return self.prompts.encode_text(prompt)
+        return EncodedPrompt(prompt, self.tokenizer(prompt)["input_ids"])
+
+    def warm_prefix(self, system_prompt: str) -> None:
+        if self.prefix_cache is None:
+            return
+        prefix_ids = self.prompts.system_prefix_ids(system_prompt)
+        cache = DynamicCache()
+        with torch.inference_mode():
+            self.model(input_ids=torch.tensor([prefix_ids]), past_key_values=cache, use_cache=True, logits_to_keep=1)
+        self.prefix_cache.insert(prefix_ids, cache.to_legacy_cache())
+        logger.info("Warmed prefix cache with %d system prompt tokens", len(prefix_ids))
+
+    def _prepare(
+        self,
+        prompt: EncodedPrompt,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]] = None,
+        stop_after_code_block: bool = False,
+        cancelled: Optional[threading.Event] = None,
+        chunks=None,
+    ) -> GenerationRequest:
+        return GenerationRequest(
+            prompt.input_ids,
             max_new_tokens=max_new_tokens,
-            do_sample=True,
             temperature=temperature,
             top_p=top_p,
-            eos_token_id=self.tokenizer.eos_token_id,
+            prefix_len=prompt.prefix_len if self.prefix_cache is not None else 0,
+            cancelled=cancelled,
+            chunks=chunks,
+            stop=StopText(stop, code_block=stop_after_code_block),
         )
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
 
-    def stream(self, prompt_text: str, *, max_new_tokens: int, temperature: float, top_p: float):
-        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
-        inputs = self.tokenizer(prompt_text, return_tensors="pt")
-        kwargs = dict(
-            input_ids=inputs["input_ids"],
+    def _dispatch(self, request: GenerationRequest, speculative: Optional[str]) -> None:
+        if speculative:
+            self._speculative_pool.submit(self.speculative.run, request, speculative)
+        else:
+            self.scheduler.submit(request)
+
+    def _submit(
+        self,
+        prompt: EncodedPrompt,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]] = None,
+        stop_after_code_block: bool = False,
+        cancelled: Optional[threading.Event] = None,
+        speculative: Optional[str] = None,
+    ) -> GenerationRequest:
+        request = self._prepare(
+            prompt,
             max_new_tokens=max_new_tokens,
-            do_sample=True,
             temperature=temperature,
             top_p=top_p,
-            eos_token_id=self.tokenizer.eos_token_id,
-            streamer=streamer,
+            stop=stop,
+            stop_after_code_block=stop_after_code_block,
+            cancelled=cancelled,
         )
-        thread = threading.Thread(target=self.model.generate, kwargs=kwargs)
-        thread.start()
-        for chunk in streamer:
-            yield chunk
+        self._dispatch(request, speculative)
+        return request
 
+    def _observe(self, request: GenerationRequest) -> None:
+        model = self.model_name
+        PROMPT_TOKENS.observe(len(request.input_ids), model=model)
+        COMPLETION_TOKENS.observe(len(request.output_ids), model=model)
+        if request.started_at is not None:
+            QUEUE_WAIT.observe(request.started_at - request.submitted_at, stage="batch")
+        times = request.token_times
+        if not times:
+            return
+        TIME_TO_FIRST_TOKEN.observe(times[0] - request.submitted_at, model=model)
+        if len(times) > 1:
+            INTER_TOKEN_LATENCY.observe_many((b - a for a, b in zip(times, times[1:])), model=model)
+            TOKENS_PER_SECOND.observe((len(times) - 1) / max(times[-1] - times[0], 1e-9), model=model)
 
+    @staticmethod
+    def _report(usage: Optional[dict], request: GenerationRequest, **flags) -> None:
+        if usage is not None:
+            usage.update(
+                prompt_tokens=len(request.input_ids),
+                completion_tokens=len(request.output_ids),
+                finish_reason=request.finish_reason,
+                **flags,
+            )
+
+    def _remember(self, cache_key: Optional[str], request: GenerationRequest, text: str) -> None:
+        """Store a completion that ran to its end (not a cancelled or failed one) in the response cache."""
+        if cache_key is not None and request.finish_reason in ("stop", "length"):
+            self.response_cache.put(
+                cache_key, text, finish_reason=request.finish_reason, completion_tokens=len(request.output_ids)
+            )
+
+    def _request_key(
+        self,
+        prompt: EncodedPrompt,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]],
+        stop_after_code_block: bool,
+        use_cache: bool,
+    ) -> Optional[str]:
+        # Sampled output is only reusable (cached or shared) when the client explicitly asks for it
+        if not (temperature <= 0 or use_cache):
+            return None
+        return ResponseCache.make_key(
+            self.model_name,
+            prompt.text,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            stop_after_code_block=stop_after_code_block,
+        )
+
+    def _shared(
+        self,
+        key: str,
+        prompt: EncodedPrompt,
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]],
+        stop_after_code_block: bool,
+        cache_key: Optional[str],
+        cancelled: Optional[threading.Event],
+        speculative: Optional[str],
+        usage: Optional[dict] = None,
+    ) -> Iterator[str]:
+        """Chunks of the generation for ``key``, attaching to an identical one if it is already running."""
+        flight, leader = self.single_flight.join(key)
+        try:
+            if leader:
+                try:
+                    flight.request = self._prepare(
+                        prompt,
+                        max_new_tokens=max_new_tokens,
+                        temperature=temperature,
+                        top_p=top_p,
+                        stop=stop,
+                        stop_after_code_block=stop_after_code_block,
+                        cancelled=flight.cancelled,
+                        chunks=flight.chunks,
+                    )
+                    self._dispatch(flight.request, speculative)
+                except BaseException as exc:
+                    flight.chunks.fail(exc)
+                    raise
+            yield from flight.chunks.subscribe(cancelled)
+            if flight.request.error is not None:
+                raise flight.request.error
+            self._report(usage, flight.request, coalesced=not leader)
+        finally:
+            # The last subscriber out cancels an unfinished generation and accounts for it once
+            if self.single_flight.leave(key, flight) and flight.request is not None:
+                self._observe(flight.request)
+                self._remember(cache_key, flight.request, flight.chunks.text())
+
+    def generate(
+        self,
+        prompt: Union[str, EncodedPrompt],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]] = None,
+        stop_after_code_block: bool = False,
+        use_cache: bool = False,
+        cancelled: Optional[threading.Event] = None,
+        speculative: Optional[str] = None,
+    ) -> str:
+        prompt = self._encoded(prompt)
+        key = self._request_key(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            stop_after_code_block=stop_after_code_block,
+            use_cache=use_cache,
+        )
+        cache_key = key if self.response_cache is not None else None
+        cached = self.response_cache.get(cache_key) if cache_key is not None else None
+        completion = cached["text"] if cached is not None else None
+        if completion is None and key is not None and self.single_flight is not None:
+            completion = "".join(
+                self._shared(
+                    key,
+                    prompt,
+                    max_new_tokens=max_new_tokens,
+                    temperature=temperature,
+                    top_p=top_p,
+                    stop=stop,
+                    stop_after_code_block=stop_after_code_block,
+                    cache_key=cache_key,
+                    cancelled=cancelled,
+                    speculative=speculative,
+                )
+            )
+        elif completion is None:
+            request = self._submit(
+                prompt,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop,
+                stop_after_code_block=stop_after_code_block,
+                cancelled=cancelled,
+                speculative=speculative,
+            )
+            try:
+                completion = "".join(request.iter_chunks())
+            finally:
+                self._observe(request)
+            self._remember(cache_key, request, completion)
+        return completion
+
+    def stream(
+        self,
+        prompt: Union[str, EncodedPrompt],
+        *,
+        max_new_tokens: int,
+        temperature: float,
+        top_p: float,
+        stop: Optional[list[str]] = None,
+        stop_after_code_block: bool = False,
+        use_cache: bool = False,
+        cancelled: Optional[threading.Event] = None,
+        speculative: Optional[str] = None,
+        usage: Optional[dict] = None,
+    ):
+        """Yield the completion as text deltas; ``usage``, if given, is filled in once it ends."""
+        prompt = self._encoded(prompt)
+        key = self._request_key(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            stop_after_code_block=stop_after_code_block,
+            use_cache=use_cache,
+        )
+        cache_key = key if self.response_cache is not None else None
+        cached = self.response_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            # Replay line by line so streaming clients still render progressively
+            for line in cached["text"].splitlines(keepends=True):
+                yield line
+            if usage is not None:
+                usage.update(
+                    prompt_tokens=len(prompt.input_ids),
+                    completion_tokens=cached["completion_tokens"],
+                    finish_reason=cached["finish_reason"],
+                    cached=True,
+                )
+            return
+        if key is not None and self.single_flight is not None:
+            yield from self._shared(
+                key,
+                prompt,
+                max_new_tokens=max_new_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=stop,
+                stop_after_code_block=stop_after_code_block,
+                cache_key=cache_key,
+                cancelled=cancelled,
+                speculative=speculative,
+                usage=usage,
+            )
+            return
+
+        request = self._submit(
+            prompt,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            top_p=top_p,
+            stop=stop,
+            stop_after_code_block=stop_after_code_block,
+            cancelled=cancelled,
+            speculative=speculative,
+        )
+        parts = []
+        try:
+            for chunk in request.iter_chunks():
+                parts.append(chunk)
+                yield chunk
+        finally:
+            # Closing the generator early (client went away) frees the batch slot
+            request.cancel()
+            self._observe(request)
+        self._report(usage, request)
+        self._remember(cache_key, request, "".join(parts))
@@ -0,0 +1,107 @@
+import threading
+from typing import Iterator, Optional
+
+
+class Broadcast:
+    """Text chunks of one generation, replayed from the start to every subscriber.
+
+    Stands in for the ``queue.Queue`` a GenerationRequest writes to (``put``,
+    with None marking the end), so the decode loop publishes straight into it
+    and no thread has to copy chunks from one queue to many.
+    """
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def put(self, chunk: Optional[str]) -> None:
+        with self._cond:
+            if chunk is None:
+                self.done = True
+            else:
+                self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def fail(self, exc: BaseException) -> None:
+        with self._cond:
+            self.error = exc
+            self.done = True
+            self._cond.notify_all()
+
+    def text(self) -> str:
+        with self._cond:
+            return "".join(self.chunks)
+
+    def subscribe(self, cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+        """Everything published so far, then live chunks until the end (or until ``cancelled``)."""
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.chunks) and not self.done:
+                    if cancelled is not None and cancelled.is_set():
+                        return
+                    # Poll so a subscriber whose caller went away stops waiting promptly
+                    self._cond.wait(0.1 if cancelled is not None else None)
+                pending = self.chunks[index:]
+                index = len(self.chunks)
+                if not pending:
+                    if self.error is not None:
+                        raise self.error
+                    return
+            yield from pending
+
+
+class Flight:
+    """One generation shared by every identical request that arrives while it runs."""
+
+    def __init__(self) -> None:
+        self.chunks = Broadcast()
+        # Set once every subscriber has gone; the decode loop then drops the request
+        self.cancelled = threading.Event()
+        self.request = None
+        self.subscribers = 0
+
+
+class SingleFlight:
+    """Table of in-flight generations keyed on the normalized request parameters.
+
+    The first request for a key leads and submits the generation; requests
+    that arrive with the same key before it finishes follow, attaching to the
+    leader's output instead of decoding the same tokens again. The generation
+    is cancelled only when its last subscriber leaves.
+    """
+
+    def __init__(self) -> None:
+        self.leaders = 0
+        self.followers = 0
+        self._flights: dict[str, Flight] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def join(self, key: str) -> tuple[Flight, bool]:
+        """Attach to the flight for ``key``, starting one if needed; True when the caller leads."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.leaders += 1
+            else:
+                self.followers += 1
+            flight.subscribers += 1
+            return flight, leader
+
+    def leave(self, key: str, flight: Flight) -> bool:
+        """Detach from ``flight``; True for the last subscriber, which owns the finished request."""
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0:
+                return False
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.cancelled.set()
+        return True
@@ -0,0 +1,186 @@
+import logging
+import threading
+from typing import Optional
+
+import torch
+from transformers import DynamicCache
+
+from generation import GenerationRequest, prefill, sample_next_tokens
+from prefix_cache import PrefixCache
+
+
+logger = logging.getLogger("model-service")
+
+DRAFT = "draft"
+PROMPT_LOOKUP = "prompt_lookup"
+
+
+def _probs(logits: torch.Tensor, temperature: float, top_p: float) -> torch.Tensor:
+    """Target distribution for one position, matching sample_next_tokens."""
+    probs = torch.softmax(logits.float() / max(temperature, 1e-5), dim=-1)
+    sorted_probs, sorted_idx = probs.sort(descending=True)
+    cumulative = sorted_probs.cumsum(dim=-1)
+    sorted_probs = sorted_probs.masked_fill((cumulative - sorted_probs) > top_p, 0.0)
+    filtered = torch.zeros_like(probs).scatter_(0, sorted_idx, sorted_probs)
+    return filtered / filtered.sum()
+
+
+def prompt_lookup_candidates(context: list[int], num_tokens: int, max_ngram: int) -> list[int]:
+    """Propose the tokens that followed the most recent earlier match of the context's tail n-gram."""
+    for n in range(min(max_ngram, len(context) - 1), 0, -1):
+        tail = context[-n:]
+        for start in range(len(context) - n - 1, -1, -1):
+            if context[start:start + n] == tail:
+                follow = context[start + n:start + n + num_tokens]
+                if follow:
+                    return follow
+    return []
+
+
+class SpeculativeDecoder:
+    """Draft-then-verify decoding for a single request.
+
+    Candidates come either from a small draft model sharing the tokenizer or
+    from n-gram lookup in the prompt (cheap and very effective when the answer
+    copies from the input, as code edits do). The main model scores all
+    candidates in one forward pass; greedy requests accept the longest
+    matching run, sampled requests use the standard accept/resample rule so the
+    output distribution is unchanged.
+    """
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        eos_token_ids: set[int],
+        *,
+        draft_model=None,
+        num_draft_tokens: int = 4,
+        max_ngram: int = 3,
+        prefix_cache: Optional[PrefixCache] = None,
+    ) -> None:
+        self.model = model
+        self.tokenizer = tokenizer
+        self.eos_token_ids = eos_token_ids
+        self.draft_model = draft_model
+        self.num_draft_tokens = max(1, num_draft_tokens)
+        self.max_ngram = max(1, max_ngram)
+        self.prefix_cache = prefix_cache
+        self.proposed = {DRAFT: 0, PROMPT_LOOKUP: 0}
+        self.accepted = {DRAFT: 0, PROMPT_LOOKUP: 0}
+        self._lock = threading.Lock()
+
+    def run(self, request: GenerationRequest, mode: str) -> None:
+        try:
+            with torch.inference_mode():
+                self._run(request, mode)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Speculative decoding failed: %s", exc)
+            request.fail(exc)
+
+    def _run(self, request: GenerationRequest, mode: str) -> None:
+        if mode == DRAFT and self.draft_model is None:
+            raise ValueError("no draft model configured")
+        cache, logits = prefill(self.model, request, self.prefix_cache)
+        token = int(sample_next_tokens(logits, torch.tensor([request.temperature]), torch.tensor([request.top_p]))[0])
+        request.add_token(token, self.tokenizer, self.eos_token_ids)
+        context = list(request.input_ids) + [token]
+        draft_cache = DynamicCache() if mode == DRAFT else None
+
+        while not request.done:
+            if request.cancelled.is_set():
+                request.finish("cancelled")
+                return
+            remaining = request.max_new_tokens - len(request.output_ids)
+            budget = min(self.num_draft_tokens, max(0, remaining - 1))
+            if mode == DRAFT:
+                candidates, draft_probs = self._draft(context, draft_cache, budget, request)
+            else:
+                candidates = prompt_lookup_candidates(context, budget, self.max_ngram) if budget else []
+                draft_probs = None
+
+            # The main cache holds everything but the last emitted token; score it plus the candidates
+            committed = len(context) - 1
+            verify_ids = torch.tensor([[context[-1]] + candidates], dtype=torch.long)
+            outputs = self.model(input_ids=verify_ids, past_key_values=cache, use_cache=True)
+            emitted = self._verify(outputs.logits[0], candidates, draft_probs, request)
+            accepted = len(emitted) - 1
+            with self._lock:
+                self.proposed[mode] += len(candidates)
+                self.accepted[mode] += accepted
+
+            cache.crop(committed + 1 + accepted)
+            if draft_cache is not None:
+                draft_cache.crop(min(draft_cache.get_seq_length(), committed + 1 + accepted))
+            for token in emitted:
+                request.add_token(token, self.tokenizer, self.eos_token_ids)
+                context.append(token)
+                if request.done:
+                    break
+
+    def _draft(
+        self, context: list[int], draft_cache: DynamicCache, budget: int, request: GenerationRequest
+    ) -> tuple[list[int], list[torch.Tensor]]:
+        candidates: list[int] = []
+        draft_probs: list[torch.Tensor] = []
+        if budget == 0:
+            return candidates, draft_probs
+        pending = context[draft_cache.get_seq_length():]
+        for _ in range(budget):
+            outputs = self.draft_model(
+                input_ids=torch.tensor([pending], dtype=torch.long),
+                past_key_values=draft_cache,
+                use_cache=True,
+                logits_to_keep=1,
+            )
+            logits = outputs.logits[0, -1]
+            if request.temperature <= 0:
+                token = int(logits.argmax())
+            else:
+                probs = _probs(logits, request.temperature, request.top_p)
+                token = int(torch.multinomial(probs, 1))
+                draft_probs.append(probs)
+            candidates.append(token)
+            pending = [token]
+        return candidates, draft_probs
+
+    def _verify(
+        self,
+        logits: torch.Tensor,
+        candidates: list[int],
+        draft_probs: Optional[list[torch.Tensor]],
+        request: GenerationRequest,
+    ) -> list[int]:
+        """Return the accepted candidates followed by one token from the main model."""
+        emitted: list[int] = []
+        if request.temperature <= 0:
+            targets = logits.argmax(dim=-1).tolist()
+            for i, candidate in enumerate(candidates):
+                if targets[i] != candidate:
+                    return emitted + [targets[i]]
+                emitted.append(candidate)
+            return emitted + [targets[len(candidates)]]
+
+        for i, candidate in enumerate(candidates):
+            p = _probs(logits[i], request.temperature, request.top_p)
+            if draft_probs:
+                q = draft_probs[i]
+                vocab = min(p.shape[0], q.shape[0])
+                p, q = p[:vocab], q[:vocab]
+            else:
+                # Prompt lookup proposes deterministically: q is a point mass on the candidate
+                q = torch.zeros_like(p)
+                q[candidate] = 1.0
+            if candidate < p.shape[0] and torch.rand(()) * q[candidate] <= p[candidate]:
+                emitted.append(candidate)
+                continue
+            residual = torch.clamp(p - q, min=0.0)
+            if residual.sum() <= 0:
+                residual = p
+            return emitted + [int(torch.multinomial(residual / residual.sum(), 1))]
+        p = _probs(logits[len(candidates)], request.temperature, request.top_p)
+        return emitted + [int(torch.multinomial(p, 1))]
+
+    def acceptance_rate(self, mode: str) -> float:
+        proposed = self.proposed[mode]
+        return self.accepted[mode] / proposed if proposed else 0.0
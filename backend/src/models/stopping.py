@@ -0,0 +1,78 @@
+from typing import Optional
+
+
+FENCE = "```"
+
+
+class StopText:
+    """Text-level stopping criteria applied to a completion as it is decoded.
+
+    Stop sequences are matched on the decoded text, so they may span any
+    number of tokens; the completion ends just before the first one and the
+    sequence itself is never emitted. Text that could still turn out to be
+    the start of a stop sequence is held back until it can't. With
+    ``code_block`` the completion ends right after the fence that closes the
+    first fenced code block.
+    """
+
+    def __init__(self, stop: Optional[list[str]] = None, *, code_block: bool = False) -> None:
+        self.stop = [s for s in (stop or []) if s]
+        self.code_block = code_block
+        self.text = ""
+        self.stopped = False
+        self._emitted = 0
+        self._opening: Optional[int] = None
+        self._longest = max((len(s) for s in self.stop), default=0)
+
+    def __bool__(self) -> bool:
+        return bool(self.stop) or self.code_block
+
+    def feed(self, delta: str) -> str:
+        """Add newly decoded text; returns the part that can be sent now (check ``stopped`` after)."""
+        if self.stopped:
+            return ""
+        scanned = len(self.text)
+        self.text += delta
+        end = self._stop_at(scanned)
+        if end is not None:
+            self.stopped = True
+            return self._emit(end)
+        return self._emit(len(self.text) - self._held_back())
+
+    def flush(self) -> str:
+        """Everything still held back, for when decoding ends for another reason."""
+        return "" if self.stopped else self._emit(len(self.text))
+
+    def _emit(self, end: int) -> str:
+        text = self.text[self._emitted:end]
+        self._emitted = max(self._emitted, end)
+        return text
+
+    def _stop_at(self, scanned: int) -> Optional[int]:
+        """Where the completion ends, if a stop condition appeared in text after ``scanned``."""
+        ends = []
+        # A match can start up to len(s) - 1 characters before the new text
+        start = max(self._emitted, scanned - self._longest + 1)
+        for s in self.stop:
+            index = self.text.find(s, start)
+            if index >= 0:
+                ends.append(index)
+        if self.code_block:
+            if self._opening is None:
+                index = self.text.find(FENCE, max(0, scanned - len(FENCE) + 1))
+                if index >= 0:
+                    self._opening = index
+            if self._opening is not None:
+                index = self.text.find(FENCE, max(self._opening + len(FENCE), scanned - len(FENCE) + 1))
+                if index >= 0:
+                    ends.append(index + len(FENCE))
+        return min(ends) if ends else None
+
+    def _held_back(self) -> int:
+        """Length of the longest unsent suffix that is a proper prefix of some stop sequence."""
+        pending = len(self.text) - self._emitted
+        for size in range(min(pending, self._longest - 1), 0, -1):
+            suffix = self.text[-size:]
+            if any(s.startswith(suffix) for s in self.stop):
+                return size
+        return 0
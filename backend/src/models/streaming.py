@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Callable, Optional
+
+
+# stream_format -> media type; "text" is the raw completion with no framing
+MEDIA_TYPES = {"text": "text/plain", "ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+_END = object()
+
+
+def encode(event: dict, stream_format: str) -> str:
+    """One frame: an NDJSON line, or an SSE event named after the frame type."""
+    data = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+async def token_frames(
+    chunks: AsyncIterator[str],
+    *,
+    stream_format: str,
+    usage: dict,
+    start: float,
+    flush_ms: float = 0.0,
+    heartbeat_seconds: float = 10.0,
+    on_error: Optional[Callable[[Exception], None]] = None,
+) -> AsyncIterator[str]:
+    """Frame a completion as ``token`` deltas, ``heartbeat`` while idle, then ``done`` (or ``error``).
+
+    Deltas are coalesced: whatever text is already waiting goes out in one
+    frame, and with ``flush_ms`` a frame is held that long after its first
+    delta to collect more, trading latency for fewer, larger writes. The
+    ``done`` frame carries ``usage`` (filled in by the service) plus time to
+    first token and total duration, measured from ``start`` (perf_counter).
+    """
+    items: "asyncio.Queue" = asyncio.Queue()
+
+    async def pump() -> None:
+        try:
+            async for chunk in chunks:
+                await items.put(chunk)
+        except Exception as exc:  # noqa: BLE001
+            await items.put(exc)
+        finally:
+            await items.put(_END)
+
+    # Reading through a queue lets waits time out without cancelling the generation itself
+    task = asyncio.create_task(pump())
+    ttft_ms: Optional[int] = None
+    frames = 0
+    try:
+        ended = False
+        while not ended:
+            try:
+                item = await asyncio.wait_for(items.get(), timeout=heartbeat_seconds)
+            except asyncio.TimeoutError:
+                yield encode({"type": "heartbeat"}, stream_format)
+                continue
+            parts = []
+            error: Optional[Exception] = None
+            deadline = time.perf_counter() + flush_ms / 1000
+            while True:
+                if item is _END:
+                    ended = True
+                    break
+                if isinstance(item, Exception):
+                    error = item
+                    break
+                parts.append(item)
+                if not items.empty():
+                    item = items.get_nowait()
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(items.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            if parts:
+                if ttft_ms is None:
+                    ttft_ms = int((time.perf_counter() - start) * 1000)
+                frames += 1
+                yield encode({"type": "token", "text": "".join(parts)}, stream_format)
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+                yield encode({"type": "error", "detail": str(error) or type(error).__name__}, stream_format)
+                return
+        yield encode(
+            {
+                "type": "done",
+                **usage,
+                "ttft_ms": ttft_ms,
+                "duration_ms": int((time.perf_counter() - start) * 1000),
+                "frames": frames,
+            },
+            stream_format,
+        )
+    finally:
+        # Client gone or stream over: stopping the pump closes the generation if it still runs
+        task.cancel()
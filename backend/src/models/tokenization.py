@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from metrics import TOKENIZE_DURATION
+
+
+class EncodedPrompt:
+    """A rendered chat prompt with its token ids.
+
+    ``prefix_len`` counts the leading ids that belong to the system turn, which
+    the prefix cache can share between prompts (0 when unknown).
+    """
+
+    __slots__ = ("text", "input_ids", "prefix_len")
+
+    def __init__(self, text: str, input_ids: list[int], prefix_len: int = 0) -> None:
+        self.text = text
+        self.input_ids = input_ids
+        self.prefix_len = prefix_len
+
+
+class _SystemPrefix:
+    def __init__(self, text: str, ids: list[int]) -> None:
+        self.text = text
+        self.ids = ids
+        # Whether prefix ids + ids of the rest equal the ids of the whole prompt; None until checked
+        self.splits: Optional[bool] = None
+
+
+class PromptTokenizer:
+    """Renders chat prompts and tokenizes them in one step, reusing work across requests.
+
+    The system turn is tokenized once per system prompt, and only the rest of
+    a prompt is tokenized and appended to it. That is checked once per
+    system prompt against a full tokenization, since a template whose turns
+    could merge into one token at the boundary must not be split. Whole
+    prompts are also kept in an LRU bounded by their total token count, so
+    a repeated prompt costs a lookup.
+    """
+
+    def __init__(
+        self, tokenizer, *, model_name: str, cache_tokens: int = 262144, max_system_prompts: int = 64
+    ) -> None:
+        self.tokenizer = tokenizer
+        self.model_name = model_name
+        self.cache_tokens = cache_tokens
+        self.max_system_prompts = max_system_prompts
+        self.hits = 0
+        self.misses = 0
+        self.cached_tokens = 0
+        self._prompts: "OrderedDict[tuple[str, str], EncodedPrompt]" = OrderedDict()
+        self._prefixes: "OrderedDict[str, _SystemPrefix]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._prompts)
+
+    def encode(self, user_prompt: str, system_prompt: str) -> EncodedPrompt:
+        start = time.perf_counter()
+        key = (system_prompt, user_prompt)
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self._prompts.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if prompt is not None:
+            TOKENIZE_DURATION.observe(time.perf_counter() - start, model=self.model_name, path="cached")
+            return prompt
+        prompt, path = self._encode(user_prompt, system_prompt)
+        self._store(key, prompt)
+        TOKENIZE_DURATION.observe(time.perf_counter() - start, model=self.model_name, path=path)
+        return prompt
+
+    def encode_text(self, text: str) -> EncodedPrompt:
+        """A prompt that is already rendered, tokenized as is."""
+        start = time.perf_counter()
+        prompt = EncodedPrompt(text, self._ids(text))
+        TOKENIZE_DURATION.observe(time.perf_counter() - start, model=self.model_name, path="full")
+        return prompt
+
+    def system_prefix_ids(self, system_prompt: str) -> list[int]:
+        """Token ids of the chat template up to and including the system turn."""
+        return self._system_prefix(system_prompt).ids
+
+    def _encode(self, user_prompt: str, system_prompt: str) -> tuple[EncodedPrompt, str]:
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        text = self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        prefix = self._system_prefix(system_prompt)
+        if not text.startswith(prefix.text):
+            # A template that renders the system turn differently in context; nothing to share
+            return EncodedPrompt(text, self._ids(text)), "full"
+        if prefix.splits:
+            rest = self._ids(text[len(prefix.text):], add_special_tokens=False)
+            return EncodedPrompt(text, prefix.ids + rest, len(prefix.ids)), "prefix"
+        input_ids = self._ids(text)
+        if prefix.splits is None:
+            rest = self._ids(text[len(prefix.text):], add_special_tokens=False)
+            prefix.splits = prefix.ids + rest == input_ids
+        # Only trust the boundary if the full prompt tokenized to the same leading ids
+        prefix_len = len(prefix.ids) if input_ids[:len(prefix.ids)] == prefix.ids else 0
+        return EncodedPrompt(text, input_ids, prefix_len), "full"
+
+    def _system_prefix(self, system_prompt: str) -> _SystemPrefix:
+        with self._lock:
+            prefix = self._prefixes.get(system_prompt)
+            if prefix is not None:
+                self._prefixes.move_to_end(system_prompt)
+                return prefix
+        text = self.tokenizer.apply_chat_template(
+            [{"role": "system", "content": system_prompt}], tokenize=False, add_generation_prompt=False
+        )
+        prefix = _SystemPrefix(text, self._ids(text))
+        with self._lock:
+            self._prefixes[system_prompt] = prefix
+            while len(self._prefixes) > self.max_system_prompts:
+                self._prefixes.popitem(last=False)
+        return prefix
+
+    def _ids(self, text: str, add_special_tokens: bool = True) -> list[int]:
+        return self.tokenizer(text, add_special_tokens=add_special_tokens)["input_ids"]
+
+    def _store(self, key: tuple[str, str], prompt: EncodedPrompt) -> None:
+        size = len(prompt.input_ids)
+        if size > self.cache_tokens:
+            return
+        with self._lock:
+            old = self._prompts.pop(key, None)
+            if old is not None:
+                self.cached_tokens -= len(old.input_ids)
+            self._prompts[key] = prompt
+            self.cached_tokens += size
+            while self.cached_tokens > self.cache_tokens:
+                _, evicted = self._prompts.popitem(last=False)
+                self.cached_tokens -= len(evicted.input_ids)
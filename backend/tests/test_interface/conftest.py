@@ -0,0 +1,5 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "common"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "execution"))
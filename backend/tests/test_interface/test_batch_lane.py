@@ -0,0 +1,29 @@
+import queue
+import threading
+import types
+
+import docker
+
+from runner_service import RunnerService
+
+
+def test_failed_sandbox_creation_becomes_a_case_error(monkeypatch):
+    def refuse(**kwargs):
+        raise docker.errors.APIError("no space left on device")
+
+    client = types.SimpleNamespace(containers=types.SimpleNamespace(run=refuse, create=refuse))
+    monkeypatch.setattr(docker, "from_env", lambda: client)
+    service = RunnerService(pool_max_size=1)
+    monkeypatch.setattr(service.images, "pinned", lambda image: image)
+    cases: "queue.Queue" = queue.Queue()
+    for index in range(2):
+        cases.put((index, "print(1)", None))
+    try:
+        results = list(service.run_lane(
+            cases, language="python", timeout_seconds=5, memory_mb=256, cpu_millis=500, cancelled=threading.Event()
+        ))
+    finally:
+        service.shutdown()
+    assert [result["index"] for result in results] == [0, 1]
+    assert all("no space left on device" in result["error"] for result in results)
+    assert cases.empty() and service.pool.size(service.pool_key(language="python", memory_mb=256, cpu_millis=500)) == 0
@@ -0,0 +1,40 @@
+import pytest
+from pydantic import ValidationError
+
+import languages
+from schemas import BatchRequest, RunRequest
+
+
+def test_cases_inherit_batch_code():
+    request = BatchRequest(code="print(input())", cases=[{"stdin": "1"}, {"code": "print(2)"}])
+    assert [case.code for case in request.cases] == [None, "print(2)"]
+    assert request.max_parallel == 4 and not request.stream
+
+
+def test_case_without_any_code_is_rejected():
+    with pytest.raises(ValidationError):
+        BatchRequest(cases=[{"stdin": "1"}])
+    with pytest.raises(ValidationError):
+        BatchRequest(code="pass", cases=[])
+
+
+def test_project_files_must_be_relative_and_not_reserved():
+    assert BatchRequest(code="import pkg.util", cases=[{}], files={"pkg/util.py": "X = 1"}).files
+    for name in ("../etc/passwd", "/abs.py", "pkg//x.py", "main.py", "stdin"):
+        with pytest.raises(ValidationError):
+            RunRequest(code="pass", files={name: ""})
+
+
+def test_reserved_files_follow_the_language(monkeypatch):
+    monkeypatch.setitem(
+        languages.LANGUAGES,
+        "node",
+        languages.Language("node", image="node:20-slim", source_file="main.js", command=["node", "{source}"]),
+    )
+    # main.py is an ordinary module for a node program, but main.js is taken
+    assert RunRequest(code="1", language="node", files={"main.py": ""}).files
+    for name in ("main.js", "stdin"):
+        with pytest.raises(ValidationError):
+            RunRequest(code="1", language="node", files={name: ""})
+        with pytest.raises(ValidationError):
+            BatchRequest(code="1", language="node", cases=[{}], files={name: ""})
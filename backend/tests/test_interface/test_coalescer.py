@@ -0,0 +1,77 @@
+import asyncio
+import threading
+
+from coalescer import Coalescer
+from job_queue import JobQueue
+
+
+def _numbers(count, closed=None):
+    def fn(cancelled):
+        try:
+            for i in range(count):
+                if cancelled.wait(0.01):
+                    return
+                yield i
+        finally:
+            if closed is not None:
+                closed.set()
+
+    return fn
+
+
+def test_followers_share_the_job_and_outlive_the_leader():
+    async def scenario():
+        jobs = JobQueue(max_workers=2, max_queue=2, cpu_capacity_millis=1000, memory_capacity_mb=1024)
+        coalescer = Coalescer()
+        submitted = []
+
+        def start():
+            job = jobs.submit(_numbers(20), streaming=True)
+            submitted.append(job)
+            return job, job.iter()
+
+        leader_flight, leader = coalescer.join("k", start)
+        first = coalescer.follow("k", leader_flight)
+        assert [await first.__anext__() for _ in range(3)] == [0, 1, 2]
+        flight, follower_leads = coalescer.join("k", start)
+        second = coalescer.follow("k", flight)
+        # The leader going away does not stop a job someone still listens to
+        await first.aclose()
+        items = [item async for item in second]
+        jobs.shutdown()
+        return leader, follower_leads, flight is leader_flight, items, len(submitted), coalescer
+
+    leader, follower_leads, same, items, submitted, coalescer = asyncio.run(scenario())
+    assert leader and not follower_leads and same
+    assert items == list(range(20))
+    assert submitted == 1
+    assert (coalescer.leaders, coalescer.followers, len(coalescer)) == (1, 1, 0)
+
+
+def test_last_subscriber_leaving_cancels_the_job():
+    async def scenario():
+        jobs = JobQueue(max_workers=1, max_queue=1, cpu_capacity_millis=1000, memory_capacity_mb=1024)
+        coalescer = Coalescer()
+        closed = threading.Event()
+
+        def start():
+            job = jobs.submit(_numbers(1000, closed), streaming=True)
+            return job, job.iter()
+
+        subscribers = []
+        for _ in range(2):
+            flight, _ = coalescer.join("k", start)
+            subscribers.append(coalescer.follow("k", flight))
+        for subscriber in subscribers:
+            await subscriber.__anext__()
+        await subscribers[0].aclose()
+        assert not closed.is_set()
+        await subscribers[1].aclose()
+        stopped = await asyncio.to_thread(closed.wait, 5)
+        # A new request after that starts a fresh job
+        _, leads = coalescer.join("k", start)
+        jobs.shutdown()
+        return stopped, leads
+
+    stopped, leads = asyncio.run(scenario())
+    assert stopped and leads
@@ -0,0 +1,55 @@
+import itertools
+import time
+
+from container_pool import ContainerPool, PoolKey
+
+
+KEY = PoolKey("python:3.11-slim", 256, 500)
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def _pool(**kwargs):
+    ids = itertools.count()
+    destroyed = []
+    pool = ContainerPool(lambda key: next(ids), destroyed.append, refill_interval=0.05, **kwargs)
+    return pool, destroyed
+
+
+def test_prewarmed_containers_are_hits_and_reused():
+    pool, destroyed = _pool(min_idle=1, max_size=1, max_uses=2)
+    pool.start()
+    pool.prewarm(KEY)
+    _wait_for(lambda: pool.idle_count(KEY) == 1)
+
+    first = pool.acquire(KEY)
+    pool.release(first)
+    again = pool.acquire(KEY)
+    assert again is first
+    assert pool.hits == 2 and pool.cold_starts == 0
+    # Second use reaches max_uses: destroyed and replaced in the background
+    pool.release(again)
+    _wait_for(lambda: destroyed == [first.container])
+    _wait_for(lambda: pool.idle_count(KEY) == 1)
+    assert pool.recycled["max_uses"] == 1
+    pool.shutdown()
+    assert pool.size(KEY) == 0 and len(destroyed) == 2
+
+
+def test_cold_start_dirty_and_overflow():
+    pool, destroyed = _pool(min_idle=0, max_size=1, max_uses=10)
+    pool.start()
+    a = pool.acquire(KEY)
+    b = pool.acquire(KEY)
+    assert pool.cold_starts == 2 and a.pooled and not b.pooled
+    pool.release(b)
+    pool.release(a, dirty=True)
+    _wait_for(lambda: sorted(destroyed) == [0, 1])
+    assert pool.recycled == {"max_uses": 0, "dirty": 1, "overflow": 1}
+    assert pool.size(KEY) == 0
+    pool.shutdown()
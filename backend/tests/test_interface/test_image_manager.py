@@ -0,0 +1,69 @@
+import types
+
+import docker
+import pytest
+
+import languages
+from image_manager import ImageManager, ImageNotReady
+
+
+class FakeImages:
+    def __init__(self, local):
+        self.local = dict(local)
+        self.registry = {}
+        self.pulled = []
+
+    def get(self, name):
+        if name not in self.local:
+            raise docker.errors.ImageNotFound(name)
+        return types.SimpleNamespace(id=self.local[name], attrs={"RepoDigests": [f"{name}@sha256:d"]})
+
+    def pull(self, name):
+        self.pulled.append(name)
+        if name not in self.registry:
+            raise docker.errors.NotFound(name)
+        self.local[name] = self.registry[name]
+        return self.get(name)
+
+
+def manager(images, policy):
+    m = ImageManager(types.SimpleNamespace(images=images), pull_policy=policy)
+    m.track("py:1")
+    return m
+
+
+def test_missing_image_is_pulled_and_pinned():
+    images = FakeImages({})
+    images.registry["py:1"] = "sha256:aaa"
+    m = manager(images, "missing")
+    with pytest.raises(ImageNotReady):
+        m.pinned("py:1")
+    m.check()
+    assert m.ready and m.pinned("py:1") == "sha256:aaa"
+    m.check()
+    assert images.pulled == ["py:1"]
+
+
+def test_always_follows_the_tag():
+    images = FakeImages({"py:1": "sha256:aaa"})
+    images.registry["py:1"] = "sha256:bbb"
+    m = manager(images, "always")
+    m.check()
+    m.check()
+    assert m.pinned("py:1") == "sha256:bbb" and m.images["py:1"].updates == 0
+    images.registry["py:1"] = "sha256:ccc"
+    m.check()
+    assert m.pinned("py:1") == "sha256:ccc" and m.images["py:1"].updates == 1
+
+
+def test_never_pulls():
+    m = manager(FakeImages({}), "never")
+    m.check()
+    assert not m.ready and m.missing() == ["py:1"]
+
+
+def test_language_command_template():
+    lang = languages.Language("node", image="node:20", source_file="main.js", command=["node", "{source}"])
+    assert lang.command_for("/workspace/j1") == ["node", "/workspace/j1/main.js"]
+    with pytest.raises(ValueError):
+        languages.get("cobol")
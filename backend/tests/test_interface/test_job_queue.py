@@ -0,0 +1,87 @@
+import asyncio
+import threading
+
+import pytest
+
+from job_queue import STREAM_BUFFER, JobQueue, Overloaded
+
+
+def test_priority_order_capacity_and_admission():
+    async def scenario():
+        jobs = JobQueue(max_workers=2, max_queue=1, cpu_capacity_millis=1000, memory_capacity_mb=1024)
+        release = threading.Event()
+        order = []
+
+        def blocker(cancelled):
+            release.wait(5)
+            return "blocked"
+
+        def record(name):
+            def fn(cancelled):
+                order.append(name)
+                return name
+
+            return fn
+
+        # Takes the whole CPU budget, so the second worker stays idle and later jobs queue
+        first = jobs.submit(blocker, cpu_millis=1000, memory_mb=256)
+        await asyncio.sleep(0.05)
+        low = jobs.submit(record("low"), priority=9, cpu_millis=500)
+        high = jobs.submit(record("high"), priority=0, cpu_millis=500)
+        assert (low.position, high.position) == (0, 0)
+        # running + queued has reached max_workers + max_queue
+        with pytest.raises(Overloaded):
+            jobs.submit(record("rejected"))
+        release.set()
+        results = [await job.result() for job in (first, high, low)]
+        jobs.shutdown()
+        return results, order, jobs
+
+    results, order, jobs = asyncio.run(scenario())
+    assert results == ["blocked", "high", "low"]
+    assert order == ["high", "low"]
+    assert jobs.rejected == 1 and jobs.completed == 3
+
+
+def test_stream_cancel_stops_the_worker():
+    async def scenario():
+        jobs = JobQueue(max_workers=1, max_queue=1, cpu_capacity_millis=1000, memory_capacity_mb=1024)
+        closed = threading.Event()
+
+        def numbers(cancelled):
+            try:
+                for i in range(1000):
+                    if cancelled.wait(0.01):
+                        return
+                    yield i
+            finally:
+                closed.set()
+
+        chunks = jobs.submit(numbers, streaming=True).iter()
+        assert [await chunks.__anext__() for _ in range(3)] == [0, 1, 2]
+        await chunks.aclose()
+        assert await asyncio.to_thread(closed.wait, 5)
+        jobs.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_slow_consumer_stalls_the_producer():
+    async def scenario():
+        jobs = JobQueue(max_workers=1, max_queue=1, cpu_capacity_millis=1000, memory_capacity_mb=1024)
+        produced = []
+
+        def numbers(cancelled):
+            for i in range(10_000):
+                produced.append(i)
+                yield i
+
+        chunks = jobs.submit(numbers, streaming=True).iter()
+        await asyncio.sleep(0.3)
+        # The worker blocks once the buffer is full instead of racing ahead
+        assert len(produced) <= STREAM_BUFFER + 1
+        assert [await chunks.__anext__() for _ in range(3)] == [0, 1, 2]
+        await chunks.aclose()
+        jobs.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,21 @@
+import json
+
+from output_frames import OutputCap, collect, output_frames
+
+
+def test_frames_split_streams_and_mark_truncation():
+    output = [("stdout", b"hi "), ("stderr", b"\xe2\x82"), ("stderr", b"\xac!"), ("stdout", b"0123456789")]
+    frames = [json.loads(line) for line in output_frames(output, OutputCap(12))]
+    assert frames == [
+        {"type": "stdout", "data": "hi "},
+        {"type": "stderr", "data": "€!"},
+        {"type": "stdout", "data": "01234"},
+        {"type": "truncated", "limit_bytes": 12},
+    ]
+
+
+def test_collect_keeps_at_most_the_cap():
+    cap = OutputCap(4)
+    assert collect([("stdout", b"abcdef"), ("stderr", b"gh")], cap) == "abcd" + cap.marker()
+    assert cap.truncated and cap.total_bytes == 8
+    assert collect([("stdout", b"abcdef")], OutputCap(0)) == "abcdef"
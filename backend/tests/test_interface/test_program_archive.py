@@ -0,0 +1,16 @@
+import io
+import tarfile
+
+from runner_service import RunnerService
+
+
+def test_archive_is_root_owned_read_only_with_parent_dirs():
+    files = RunnerService._job_files("python", "import pkg.util", "42", {"pkg/util.py": "X = 1"})
+    data = RunnerService._program_archive("job", files)
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        members = {m.name: m for m in tar.getmembers()}
+        assert tar.extractfile(members["job/pkg/util.py"]).read() == b"X = 1"
+    assert list(members) == ["job", "job/pkg", "job/pkg/util.py", "job/main.py", "job/stdin"]
+    assert all(m.uid == 0 for m in members.values())
+    assert {m.mode for m in members.values() if m.isdir()} == {0o555}
+    assert {m.mode for m in members.values() if m.isfile()} == {0o444}
@@ -0,0 +1,35 @@
+import types
+
+import docker
+
+from runner_service import INSTANCE_LABEL, POOL_LABEL, RunnerService
+
+
+class Container:
+    def __init__(self, owner):
+        self.id = self.short_id = f"{owner}-sandbox"
+        self.labels = {POOL_LABEL: "1", INSTANCE_LABEL: owner}
+        self.removed = False
+
+    def remove(self, force=False, v=False):
+        self.removed = True
+
+
+def test_reaper_leaves_other_runners_sandboxes_alone(monkeypatch):
+    containers = []
+    client = types.SimpleNamespace(containers=types.SimpleNamespace(list=lambda **kwargs: containers))
+    monkeypatch.setattr(docker, "from_env", lambda: client)
+    service = RunnerService()
+    peer, leaked = Container("peer"), Container(service.instance_id)
+    containers += [peer, leaked]
+
+    service.reap()
+    # An untracked container of our own gets one more pass before it counts as leaked
+    assert not leaked.removed
+    service.reap()
+    assert leaked.removed and not peer.removed
+    assert service.reaped["container"] == 1
+
+    service.reap_foreign = True
+    service.reap()
+    assert peer.removed
@@ -0,0 +1,41 @@
+from resource_usage import UsageStats, cgroup_usage, parse_cgroup_stats
+
+
+STATS = """usage_usec 250000
+user_usec 200000
+nr_throttled 3
+throttled_usec 12000
+oom_kill 0
+memory_peak 104857600
+"""
+
+
+def test_usage_is_the_delta_since_the_last_job():
+    before = parse_cgroup_stats("usage_usec 50000\nnr_throttled 1\nthrottled_usec 2000\nmemory_peak 209715200\n")
+    usage = cgroup_usage(before, parse_cgroup_stats(STATS))
+    assert usage == {
+        "cpu_ms": 200,
+        "throttled_periods": 2,
+        "throttled_ms": 10,
+        # An earlier job set the sandbox's high-water mark
+        "peak_memory_mb": None,
+        "oom_killed": False,
+    }
+    assert cgroup_usage({}, parse_cgroup_stats(STATS))["peak_memory_mb"] == 100.0
+
+
+def test_no_cgroup_v2_means_no_usage():
+    assert parse_cgroup_stats("memory_peak -1\n") == {}
+    assert cgroup_usage({}, {}) == {}
+
+
+def test_stats_histograms():
+    stats = UsageStats()
+    usage = {"cpu_ms": 250, "run_ms": 1000, "peak_memory_mb": 128.0, "oom_killed": True, "create_ms": 5}
+    stats.observe(usage, memory_mb=256, cpu_millis=500)
+    lines = stats.metrics_lines()
+    assert 'runner_job_cpu_utilization_bucket{le="0.5"} 1' in lines
+    assert 'runner_job_memory_utilization_bucket{le="0.5"} 1' in lines
+    assert 'runner_job_phase_seconds_count{phase="create"} 1' in lines
+    assert 'runner_job_phase_seconds_count{phase="run"} 1' in lines
+    assert "runner_job_oom_kills 1" in lines
@@ -0,0 +1,68 @@
+import os
+import time
+
+from result_cache import ResultCache
+
+
+def _key(**overrides):
+    job = dict(
+        language="python", image_id="sha256:abc", stdin=None, timeout_seconds=10, memory_mb=256, cpu_millis=500
+    )
+    job.update(overrides)
+    return ResultCache.make_key("print(1)", **job)
+
+
+def test_key_covers_input_image_and_limits():
+    base = _key()
+    assert base == _key()
+    for change in ({"stdin": "x"}, {"image_id": "sha256:def"}, {"memory_mb": 512}, {"timeout_seconds": 5}):
+        assert _key(**change) != base
+
+
+def test_lru_ttl_and_disk_tier(tmp_path):
+    result = {"exit_code": 0, "logs": "1\n", "duration_ms": 120, "queue_position": 3}
+    cache = ResultCache(max_entries=1, ttl_seconds=60, disk_dir=str(tmp_path))
+    cache.put("a", result)
+    cache.put("b", result)
+    assert len(cache) == 1
+    # Evicted from memory, still on disk, and only the replayable fields are kept
+    assert cache.get("a") == {"exit_code": 0, "logs": "1\n", "duration_ms": 120}
+    assert (cache.hits, cache.disk_hits) == (1, 1)
+
+    fresh = ResultCache(max_entries=4, ttl_seconds=0.01, disk_dir=str(tmp_path))
+    time.sleep(0.02)
+    assert fresh.get("b") is None and fresh.misses == 1
+
+
+def _disk_files(path):
+    return sorted(os.path.splitext(name)[0] for _, _, names in os.walk(path) for name in names)
+
+
+def test_disk_tier_stays_under_its_byte_cap(tmp_path):
+    result = {"exit_code": 0, "logs": "x" * 100, "duration_ms": 1}
+    cache = ResultCache(max_entries=1, ttl_seconds=60, disk_dir=str(tmp_path))
+    cache.put("k1", result)
+    size = cache.disk_bytes
+    # Room for three entries, not four
+    cache.max_disk_bytes = 3 * size + size // 2
+    for key in ("k2", "k3"):
+        cache.put(key, result)
+    # A read marks k1 as recently used, so the next write evicts k2 instead
+    assert cache.get("k1") is not None
+    cache.put("k4", result)
+    assert _disk_files(tmp_path) == ["k1", "k3", "k4"]
+    assert cache.disk_bytes <= cache.max_disk_bytes and cache.disk_evictions == 1
+
+    # A restarted cache indexes what is left and applies its own, smaller cap
+    restarted = ResultCache(max_entries=1, ttl_seconds=60, disk_dir=str(tmp_path), max_disk_bytes=2 * size + size // 2)
+    assert len(_disk_files(tmp_path)) == 2 and restarted.disk_bytes <= restarted.max_disk_bytes
+
+
+def test_startup_sweeps_expired_files(tmp_path):
+    ResultCache(max_entries=4, ttl_seconds=60, disk_dir=str(tmp_path)).put("old", {"exit_code": 0})
+    stale = time.time() - 120
+    for root, _, names in os.walk(tmp_path):
+        for name in names:
+            os.utime(os.path.join(root, name), (stale, stale))
+    cache = ResultCache(max_entries=4, ttl_seconds=60, disk_dir=str(tmp_path))
+    assert _disk_files(tmp_path) == [] and cache.disk_bytes == 0
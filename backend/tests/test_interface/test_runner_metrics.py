@@ -0,0 +1,33 @@
+import importlib
+import re
+import sys
+import types
+
+import docker
+from fastapi.testclient import TestClient
+
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? [-+0-9.eInf]+$')
+
+
+def test_runner_metrics_are_prometheus_text(monkeypatch):
+    monkeypatch.setenv("RUNNER_POOL_MAX_SIZE", "0")
+    monkeypatch.setattr(docker, "from_env", lambda: types.SimpleNamespace(ping=lambda: True))
+    sys.modules.pop("runner_app", None)
+    runner_app = importlib.import_module("runner_app")
+    try:
+        runner_app.service.usage.observe({"run_ms": 100, "cpu_ms": 50}, memory_mb=256, cpu_millis=1000)
+        response = TestClient(runner_app.app).get("/metrics")
+    finally:
+        runner_app.jobs.shutdown()
+        sys.modules.pop("runner_app", None)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    lines = response.text.splitlines()
+    assert "runner_docker_up 1" in lines
+    assert "runner_jobs_queued 0" in lines
+    assert 'runner_job_cpu_seconds_bucket{le="0.05"} 1' in lines
+    assert "runner_job_cpu_seconds_count 1" in lines
+    assert 'runner_image_ready{image="python:3.11-slim"} 0' in lines
+    for line in lines:
+        assert line.startswith("# ") or SAMPLE.match(line), line
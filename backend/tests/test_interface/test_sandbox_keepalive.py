@@ -0,0 +1,60 @@
+import os
+import shutil
+import subprocess
+import time
+import types
+
+import pytest
+
+from runner_service import KEEPALIVE_COMMAND, RunnerService
+
+
+def _children(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_pooled_sandboxes_run_the_keepalive_without_docker_init():
+    created = {}
+
+    def run(**kwargs):
+        created.update(kwargs)
+        return types.SimpleNamespace(id="c1")
+
+    service = RunnerService.__new__(RunnerService)
+    service.client = types.SimpleNamespace(containers=types.SimpleNamespace(run=run))
+    service.images = types.SimpleNamespace(pinned=lambda image: image)
+    service.instance_id = "me"
+    service._live = set()
+    service._create_sandbox(types.SimpleNamespace(image="python:3.11-slim", memory_mb=256, cpu_millis=500))
+    assert created["command"] == KEEPALIVE_COMMAND and not created.get("init")
+
+
+def test_keepalive_survives_the_reset_kill():
+    """PID 1 of a fresh PID namespace, like in a sandbox, stays up through the kill -9 -1 of _reset."""
+    if not (shutil.which("unshare") and shutil.which("nsenter")):
+        pytest.skip("needs util-linux")
+    outer = subprocess.Popen(["unshare", "--pid", "--fork", "--kill-child", *KEEPALIVE_COMMAND])
+    try:
+        try:
+            _wait_for(lambda: _children(outer.pid), timeout=2.0)
+        except AssertionError:
+            pytest.skip("cannot create a PID namespace here")
+        init = _children(outer.pid)[0]
+        _wait_for(lambda: len(_children(init)) == 1)
+        sleeper = _children(init)[0]
+
+        subprocess.run(["nsenter", "-t", str(init), "-p", "--", "sh", "-c", "kill -9 -1"], check=True)
+
+        _wait_for(lambda: _children(init) and _children(init) != [sleeper])
+        assert outer.poll() is None and os.path.exists(f"/proc/{init}")
+    finally:
+        outer.kill()
+        outer.wait()
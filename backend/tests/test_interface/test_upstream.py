@@ -0,0 +1,118 @@
+import asyncio
+import importlib.util
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from upstream import UpstreamClient
+
+
+def test_reuses_one_client_and_records_latency_and_errors():
+    def handler(request):
+        if request.url.path == "/down":
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    async def scenario():
+        upstream = UpstreamClient("http://runner:5100/", max_connections=4)
+        upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        client = upstream.client
+        for _ in range(3):
+            assert (await upstream.post("/run", {"code": "1"}, timeout=5)).json() == {"ok": True}
+        async with upstream.stream("/run", {"code": "1"}) as resp:
+            assert resp.status_code == 200
+        with pytest.raises(httpx.ConnectError):
+            await upstream.post("/down", {}, timeout=5)
+        assert upstream.client is client and upstream.in_flight == 0
+        lines = upstream.metrics_lines()
+        await upstream.aclose()
+        return lines
+
+    lines = asyncio.run(scenario())
+    assert 'gateway_upstream_latency_seconds_count{runner="http://runner:5100",endpoint="/run"} 4' in lines
+    assert 'gateway_runner_errors{runner="http://runner:5100"} 1' in lines
+    assert "gateway_upstream_max_connections 4" in lines
+
+
+def test_balances_ejects_and_retries_on_another_runner():
+    calls = []
+
+    def handler(request):
+        host = request.url.host
+        calls.append((host, request.url.path))
+        if request.url.path == "/readyz":
+            if host == "c":
+                return httpx.Response(503)
+            return httpx.Response(200, json={"ready": True, "queued": 0, "free_cpu_millis": 1000})
+        if host == "a":
+            raise httpx.ConnectError("refused", request=request)
+        if host == "b":
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        return httpx.Response(200, json={"host": host})
+
+    async def scenario():
+        upstream = UpstreamClient(["http://a", "http://b", "http://c", "http://d"], max_attempts=3)
+        upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        await upstream.check_health()
+        assert [r.healthy for r in upstream.runners] == [True, True, False, True]
+        # a refuses the connection and is ejected, b is full, d takes it; c stays out
+        first = await upstream.post("/run", {"code": "1"}, timeout=5)
+        assert first.json() == {"host": "d"} and upstream.retries == 2
+        assert not upstream.runners[0].healthy
+        # Only healthy b and d are left: b refuses with 429, d answers
+        second = await upstream.post("/run", {"code": "1"}, timeout=5)
+        assert second.json() == {"host": "d"}
+        assert ("c", "/run") not in calls
+        lines = upstream.metrics_lines()
+        await upstream.aclose()
+        return lines
+
+    lines = asyncio.run(scenario())
+    assert 'gateway_runner_ejections{runner="http://a"} 1' in lines
+    assert 'gateway_runner_healthy{runner="http://c"} 0' in lines
+    assert 'gateway_runner_requests{runner="http://d"} 2' in lines
+
+
+def _gateway():
+    # Loaded by path: the model service has an app module of its own
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "src", "execution", "app.py")
+    spec = importlib.util.spec_from_file_location("gateway_app", path)
+    gateway = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gateway)
+    return gateway
+
+
+def test_gateway_metrics_are_prometheus_text():
+    gateway = _gateway()
+    response = TestClient(gateway.app).get("/metrics")
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    lines = response.text.splitlines()
+    assert "execution_gateway_up 1" in lines
+    assert "gateway_upstream_in_flight 0" in lines
+    assert not any("{}" in line for line in lines)
+
+
+def test_gateway_streams_keep_the_runner_status_and_retry_after():
+    gateway = _gateway()
+    busy = True
+
+    def handler(request):
+        if busy:
+            return httpx.Response(429, headers={"Retry-After": "3"}, text="queue full")
+        return httpx.Response(200, content=b'{"type":"stdout","data":"hi"}\n')
+
+    gateway.upstream = UpstreamClient("http://r", max_attempts=1, health_interval=0)
+    gateway.upstream.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    client = TestClient(gateway.app)
+    for endpoint, body in (
+        ("/execute_code_stream/", {"code": "print(1)"}),
+        ("/execute_batch/", {"code": "print(1)", "cases": [{}], "stream": True}),
+    ):
+        response = client.post(endpoint, json=body)
+        assert response.status_code == 429 and response.headers["Retry-After"] == "3"
+    busy = False
+    response = client.post("/execute_code_stream/", json={"code": "print(1)"})
+    assert response.status_code == 200 and response.text == '{"type":"stdout","data":"hi"}\n'
+    assert gateway.upstream.in_flight == 0
@@ -0,0 +1,42 @@
+import threading
+import time
+import types
+
+from runner_service import UNKNOWN_EXIT_CODE, RunnerService
+from watchdog import Watch, Watchdog
+
+
+def test_kills_at_deadline_and_on_cancel():
+    dog = Watchdog(grace_seconds=0.0, interval=0.01)
+    killed = []
+    cancelled = threading.Event()
+    with dog.watch(lambda: killed.append("slow"), 0.05) as slow, dog.watch(
+        lambda: killed.append("gone"), 60, cancelled
+    ) as gone, dog.watch(lambda: killed.append("fine"), 60) as fine:
+        cancelled.set()
+        time.sleep(0.3)
+    dog.shutdown()
+    assert sorted(killed) == ["gone", "slow"]
+    assert (slow.fired, gone.fired, fine.fired) == ("timeout", "cancelled", None)
+    assert dog.kills == {"timeout": 1, "cancelled": 1}
+
+
+def _service_with_exec(states):
+    service = RunnerService.__new__(RunnerService)
+    service.timeouts = 0
+    service.watchdog = Watchdog(grace_seconds=0.0)
+    calls = iter(states)
+    service.client = types.SimpleNamespace(api=types.SimpleNamespace(exec_inspect=lambda exec_id: next(calls)))
+    return service
+
+
+def test_exit_status_is_awaited_and_never_reported_as_a_timeout():
+    late = _service_with_exec([{"Running": True}] * 5 + [{"Running": False, "ExitCode": 3}])
+    assert late._exec_exit_code("e", time.time() + 5) == 3
+
+    missing = _service_with_exec(iter(lambda: {"Running": True}, None))
+    start = time.time()
+    code = missing._exec_exit_code("e", start + 0.1)
+    assert code == UNKNOWN_EXIT_CODE and time.time() - start >= 0.1
+    assert missing._outcome(code, start, 10, Watch(lambda: None, 0, None)) == (UNKNOWN_EXIT_CODE, False)
+    assert missing.timeouts == 0
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "common"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src", "models"))
+
+
+class CharTokenizer:
+    """Tokenizer stand-in: one id per character, ids 0-2 reserved (1 is EOS)."""
+
+    eos_token_id = 1
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        ids = [3 + (ord(c) % 250) for c in text]
+        if return_tensors == "pt":
+            import torch
+
+            return {"input_ids": torch.tensor([ids])}
+        return {"input_ids": ids}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(97 + (i % 26)) for i in ids if i >= 3)
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"<{m['role']}>{m['content']}</>" for m in messages)
+        return text + "<assistant>" if add_generation_prompt else text
+
+
+def build_tiny_model(seed: int = 0):
+    torch = pytest.importorskip("torch")
+    transformers = pytest.importorskip("transformers")
+    torch.manual_seed(seed)
+    config = transformers.Qwen2Config(
+        vocab_size=256,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+    )
+    return transformers.Qwen2ForCausalLM(config).eval()
+
+
+@pytest.fixture
+def char_tokenizer():
+    return CharTokenizer()
+
+
+@pytest.fixture
+def tiny_model():
+    return build_tiny_model()
+
+
+@pytest.fixture
+def make_tiny_model():
+    return build_tiny_model
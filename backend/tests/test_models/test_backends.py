@@ -0,0 +1,116 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import backends  # noqa: E402
+from backends import Backend, Bf16Backend, CompiledBackend, Int8Backend, get_backend  # noqa: E402
+from generation import GenerationRequest  # noqa: E402
+from scheduler import BatchScheduler  # noqa: E402
+
+
+@pytest.fixture
+def saved_model(tmp_path, tiny_model):
+    path = tmp_path / "tiny"
+    tiny_model.save_pretrained(str(path), safe_serialization=True)
+    return str(path)
+
+
+def _generate(model, tokenizer, prompt="def f(x):", max_new_tokens=6):
+    scheduler = BatchScheduler(model, tokenizer)
+    scheduler.start()
+    try:
+        request = GenerationRequest(
+            tokenizer(prompt)["input_ids"], max_new_tokens=max_new_tokens, temperature=0.0, top_p=1.0
+        )
+        scheduler.submit(request)
+        "".join(request.iter_chunks())
+    finally:
+        scheduler.stop()
+    return request
+
+
+@pytest.mark.parametrize(
+    "backend, dtype",
+    [(Backend(), torch.float32), (Bf16Backend(), torch.bfloat16), (Int8Backend(), torch.float32)],
+    ids=["fp32", "bf16", "int8"],
+)
+def test_each_backend_builds_a_model_that_generates(saved_model, tmp_path, char_tokenizer, backend, dtype):
+    model = backend.load(saved_model, str(tmp_path / "cache"), preconvert=False)
+    assert next(model.parameters()).dtype == dtype
+    if isinstance(backend, Int8Backend):
+        assert any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules())
+    backend.warmup(model, char_tokenizer("def main():")["input_ids"], steps=1)
+    request = _generate(model, char_tokenizer)
+    assert request.finish_reason in ("stop", "length") and request.output_ids
+
+
+def test_compile_falls_back_to_eager_when_compilation_fails(saved_model, tmp_path, char_tokenizer, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError("no compiler toolchain")
+
+    monkeypatch.setattr(torch, "compile", lambda fn, **kwargs: broken)
+    backend = get_backend("fp32+compile")
+    assert isinstance(backend, CompiledBackend) and backend.name == "fp32+compile"
+    model = backend.load(saved_model, str(tmp_path / "cache"), preconvert=False)
+    expected = _generate(Backend().load(saved_model, str(tmp_path / "cache"), preconvert=False), char_tokenizer)
+    request = _generate(model, char_tokenizer)
+    assert model.forward.failed
+    assert request.output_ids == expected.output_ids
+
+
+def test_bf16_falls_back_to_fp32_without_cpu_support(monkeypatch):
+    monkeypatch.setattr(backends, "cpu_supports_bf16", lambda: False)
+    assert type(get_backend("bf16")) is Backend
+    monkeypatch.setattr(backends, "cpu_supports_bf16", lambda: True)
+    assert type(get_backend("bf16")) is Bf16Backend
+    with pytest.raises(ValueError):
+        get_backend("fp8")
+
+
+def test_converted_weights_are_used_when_present(saved_model, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    backend = Backend()
+    converted = backend.converted_dir(saved_model, cache_dir)
+    # First load goes through the hub path and leaves a converted snapshot behind
+    first = backend.load(saved_model, cache_dir)
+    assert (tmp_path / "cache" / "converted").is_dir() and converted.endswith("--float32")
+
+    def no_hub(*args, **kwargs):
+        raise AssertionError("hub path used although a converted snapshot exists")
+
+    monkeypatch.setattr(backends, "from_pretrained_local_first", no_hub)
+    second = backend.load(saved_model, cache_dir)
+    assert second.config.name_or_path == converted
+    for a, b in zip(first.parameters(), second.parameters()):
+        assert torch.equal(a, b)
+
+
+def test_loading_falls_back_to_the_hub_path(saved_model, tmp_path, monkeypatch):
+    calls = []
+    real = backends.from_pretrained_local_first
+
+    def tracking(loader, name, **kwargs):
+        calls.append(name)
+        return real(loader, name, **kwargs)
+
+    monkeypatch.setattr(backends, "from_pretrained_local_first", tracking)
+    cache_dir = str(tmp_path / "cache")
+    Backend().load(saved_model, cache_dir, preconvert=False)
+    assert calls == [saved_model]
+    assert not (tmp_path / "cache" / "converted").exists()
+
+
+def test_local_first_goes_online_only_on_a_cache_miss():
+    calls = []
+
+    class Loader:
+        @staticmethod
+        def from_pretrained(name, **kwargs):
+            calls.append(kwargs.get("local_files_only", False))
+            if kwargs.get("local_files_only"):
+                raise OSError("not in the local cache")
+            return name
+
+    assert backends.from_pretrained_local_first(Loader, "org/model") == "org/model"
+    assert calls == [True, False]
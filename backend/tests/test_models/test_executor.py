@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import types
+
+import pytest
+from fastapi.testclient import TestClient
+
+from executor import InferenceExecutor, Overloaded
+from metrics import QUEUE_WAIT
+
+
+def _queue_wait_sum() -> float:
+    prefix = 'model_queue_wait_seconds_sum{stage="executor"} '
+    return next((float(line[len(prefix):]) for line in QUEUE_WAIT.render() if line.startswith(prefix)), 0.0)
+
+
+def test_full_executor_rejects_and_accounts_queue_wait():
+    async def scenario():
+        executor = InferenceExecutor(1, 1, retry_after_seconds=3)
+        release = threading.Event()
+        count, total = QUEUE_WAIT.count(stage="executor"), _queue_wait_sum()
+
+        def blocker(cancelled):
+            release.wait(5)
+            return "first"
+
+        first = asyncio.create_task(executor.run(blocker))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(executor.run(lambda cancelled: "second"))
+        await asyncio.sleep(0.05)
+        assert (executor.in_flight, executor.queued) == (1, 1)
+        with pytest.raises(Overloaded) as rejected:
+            await executor.run(lambda cancelled: "third")
+        assert rejected.value.retry_after == 3
+        await asyncio.sleep(0.1)
+        release.set()
+        results = [await first, await second]
+        executor.shutdown()
+        waited = _queue_wait_sum() - total
+        return results, executor, QUEUE_WAIT.count(stage="executor") - count, waited
+
+    results, executor, observed, waited = asyncio.run(scenario())
+    assert results == ["first", "second"]
+    assert executor.rejected == 1 and (executor.in_flight, executor.queued) == (0, 0)
+    # Both admitted jobs record their wait; the second sat behind the blocker for ~0.15s
+    assert observed == 2 and waited >= 0.1
+
+
+@pytest.fixture
+def model_app(monkeypatch):
+    # The execution service has app and schemas modules of its own
+    monkeypatch.syspath_prepend(os.path.join(os.path.dirname(__file__), "..", "..", "src", "models"))
+    for name in ("app", "schemas"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    import app
+
+    return app
+
+
+def test_endpoints_answer_429_and_503_with_retry_after(model_app, monkeypatch):
+    ready = types.SimpleNamespace(ready=True)
+    monkeypatch.setattr(model_app, "_resolve_model", lambda request: ready)
+    full = InferenceExecutor(1, 0, retry_after_seconds=7)
+    # One admitted job holds the only slot
+    full._admit()
+    monkeypatch.setattr(model_app, "executor", full)
+    client = TestClient(model_app.app)
+    started = time.perf_counter()
+    for endpoint in ("/generate_code/", "/generate_code_stream"):
+        response = client.post(endpoint, json={"prompt": "x"})
+        assert response.status_code == 429 and response.headers["Retry-After"] == "7"
+    # Rejection is immediate, not a queued wait
+    assert time.perf_counter() - started < 1.0
+
+    ready.ready = False
+    for endpoint in ("/generate_code/", "/generate_code_stream"):
+        response = client.post(endpoint, json={"prompt": "x"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(model_app.RETRY_AFTER_SECONDS)
@@ -0,0 +1,31 @@
+from exposition import render_family
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = Histogram("latency_seconds", "Latency", ["endpoint"], buckets=(0.1, 1.0), registry=registry)
+    histogram.observe(0.05, endpoint="a")
+    histogram.observe_many([0.5, 2.0], endpoint="a")
+
+    lines = registry.render()
+    assert lines[:2] == ["# HELP latency_seconds Latency", "# TYPE latency_seconds histogram"]
+    assert 'latency_seconds_bucket{endpoint="a",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{endpoint="a",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{endpoint="a"} 2.55' in lines
+    assert 'latency_seconds_count{endpoint="a"} 3' in lines
+
+
+def test_counter_gauge_and_label_escaping():
+    registry = Registry()
+    errors = Counter("errors_total", "Errors", ["reason"], registry=registry)
+    in_flight = Gauge("in_flight", "In flight", registry=registry)
+    errors.inc(reason='say "hi"')
+    errors.inc(2, reason='say "hi"')
+    with in_flight.track_inprogress():
+        assert in_flight.value() == 1
+    lines = registry.render()
+    assert 'errors_total{reason="say \\"hi\\""} 3' in lines
+    assert "in_flight 0" in lines
+    assert render_family("up", "gauge", "Up", [({}, 1)]) == ["# HELP up Up", "# TYPE up gauge", "up 1"]
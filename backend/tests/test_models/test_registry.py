@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("transformers")
+
+from registry import ModelNotReady, ModelRegistry, UnknownModel  # noqa: E402
+
+
+class FakeService:
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.prefix_cache = None
+        self.ready = False
+        self.resident_bytes = 0
+        self.unloads = 0
+
+    def load(self):
+        self.resident_bytes = 100
+        self.ready = True
+
+    def unload(self):
+        self.ready = False
+        self.resident_bytes = 0
+        self.unloads += 1
+
+
+def _wait_ready(service, timeout=5.0):
+    deadline = time.time() + timeout
+    while not service.ready and time.time() < deadline:
+        time.sleep(0.01)
+    assert service.ready
+
+
+def test_unknown_model_and_default():
+    registry = ModelRegistry(FakeService, ["a", "b"])
+    assert registry.get(None).model_name == "a"
+    with pytest.raises(UnknownModel):
+        registry.get("c")
+    with pytest.raises(ModelNotReady):
+        with registry.use("a"):
+            pass
+
+
+def test_evicts_least_recently_used_idle_model():
+    registry = ModelRegistry(FakeService, ["a", "b", "c"], ram_budget_bytes=250)
+    a, b, c = registry.services()
+    _wait_ready(registry.ensure_loading("a"))
+    _wait_ready(registry.ensure_loading("b"))
+    with registry.use("a"):
+        pass
+
+    # "a" is pinned by an in-flight request, so loading "c" must evict "b" even though "a" is older
+    entered, release = threading.Event(), threading.Event()
+
+    def hold_a():
+        with registry.use("a"):
+            entered.set()
+            release.wait()
+
+    holder = threading.Thread(target=hold_a)
+    holder.start()
+    entered.wait()
+    registry.ensure_loading("c")
+    _wait_ready(c)
+    deadline = time.time() + 5
+    while registry.evictions == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    holder.join()
+
+    assert a.ready and c.ready and not b.ready
+    assert registry.evictions == 1 and registry.loads == 3
+
+
+def test_default_model_is_never_evicted():
+    registry = ModelRegistry(FakeService, ["a", "b"], ram_budget_bytes=150)
+    a, b = registry.services()
+    _wait_ready(registry.ensure_loading("a"))
+    _wait_ready(registry.ensure_loading("b"))
+    # Over budget with only the default to evict: stay over rather than turn the pod unready
+    registry._enforce_budget(keep="b")
+    assert registry.default.ready and b.ready
+    assert registry.evictions == 0 and a.unloads == 0
+
+    registry = ModelRegistry(FakeService, ["a", "b", "c"], ram_budget_bytes=250)
+    a, b, c = registry.services()
+    for name in ("a", "b", "c"):
+        _wait_ready(registry.ensure_loading(name))
+    deadline = time.time() + 5
+    while registry.evictions == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    # "a" is the least recently used, but as the default it is skipped for "b"
+    assert a.ready and c.ready and not b.ready
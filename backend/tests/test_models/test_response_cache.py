@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def service(tiny_model, char_tokenizer):
+    pytest.importorskip("torch")
+    from scheduler import BatchScheduler
+    from service import ModelService
+
+    service = ModelService("tiny", prefix_cache_mb=0, response_cache=ResponseCache(16, 60), coalesce=False)
+    service.tokenizer = char_tokenizer
+    service.model = tiny_model
+    service.scheduler = BatchScheduler(tiny_model, char_tokenizer, max_batch_size=4, max_queue_wait_ms=1)
+    submitted = []
+    submit = service.scheduler.submit
+    service.scheduler.submit = lambda request: (submitted.append(request), submit(request))
+    service.submitted = submitted
+    service.scheduler.start()
+    yield service
+    service.scheduler.stop()
+
+
+PARAMS = dict(max_new_tokens=12, temperature=0.0, top_p=1.0)
+
+
+def test_repeat_is_served_from_the_cache_with_its_finish_reason(service):
+    text = service.generate("def f(x):", **PARAMS)
+    original = service.submitted[0]
+    assert service.generate("def f(x):", **PARAMS) == text
+    usage = {}
+    assert "".join(service.stream("def f(x):", usage=usage, **PARAMS)) == text
+    assert len(service.submitted) == 1
+    assert service.response_cache.hits == 2
+    assert usage["cached"] and usage["finish_reason"] == original.finish_reason
+    assert usage["completion_tokens"] == len(original.output_ids)
+
+
+def test_sampled_requests_bypass_the_cache_unless_they_opt_in(service):
+    sampled = dict(PARAMS, temperature=0.8)
+    service.generate("def f(x):", **sampled)
+    service.generate("def f(x):", **sampled)
+    assert len(service.submitted) == 2
+    assert (service.response_cache.stores, service.response_cache.misses) == (0, 0)
+    service.generate("def f(x):", use_cache=True, **sampled)
+    service.generate("def f(x):", use_cache=True, **sampled)
+    assert len(service.submitted) == 3 and service.response_cache.hits == 1
+
+
+def test_entries_expire_in_memory_and_on_disk(tmp_path):
+    cache = ResponseCache(4, ttl_seconds=0.05, disk_dir=str(tmp_path))
+    cache.put("k", "print(1)", finish_reason="stop", completion_tokens=3)
+    assert cache.get("k") == {"text": "print(1)", "finish_reason": "stop", "completion_tokens": 3}
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.disk_bytes == 0 and not list(tmp_path.rglob("*.json"))
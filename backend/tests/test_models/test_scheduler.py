@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from generation import GenerationRequest  # noqa: E402
+from prefix_cache import PrefixCache  # noqa: E402
+from scheduler import BatchScheduler, SchedulerStopped  # noqa: E402
+
+
+def test_batched_greedy_matches_sequential_generate(tiny_model, char_tokenizer):
+    model = tiny_model
+    tokenizer = char_tokenizer
+    prompts = ["hello world", "def f(x): return x", "a", "a much longer prompt so rows need left padding"]
+    expected = {}
+    for prompt in prompts:
+        input_ids = tokenizer(prompt, return_tensors="pt")["input_ids"]
+        out = model.generate(input_ids=input_ids, max_new_tokens=16, do_sample=False, eos_token_id=1, pad_token_id=0)
+        expected[prompt] = out[0, input_ids.shape[1]:].tolist()
+
+    scheduler = BatchScheduler(model, tokenizer, max_batch_size=3, max_queue_wait_ms=5)
+    scheduler.start()
+    try:
+        requests = []
+        # More requests than batch slots, with uneven lengths, so rows join and leave mid-flight
+        for i, prompt in enumerate(prompts * 3):
+            request = GenerationRequest(
+                tokenizer(prompt)["input_ids"], max_new_tokens=16 - (i % 5), temperature=0.0, top_p=1.0
+            )
+            scheduler.submit(request)
+            requests.append((prompt, request))
+        for prompt, request in requests:
+            text = "".join(request.iter_chunks())
+            want = expected[prompt][:request.max_new_tokens]
+            if 1 in want:
+                want = want[:want.index(1)]
+            assert request.output_ids == want
+            assert text == tokenizer.decode(request.output_ids)
+    finally:
+        scheduler.stop()
+
+
+def test_prefix_cache_reuse_keeps_outputs_identical(tiny_model, char_tokenizer):
+    model = tiny_model
+    tokenizer = char_tokenizer
+    system = "you are a helpful coding assistant|"
+    prompts = [system + "sort a list", system + "reverse a string", system + "x"]
+
+    def run(prefix_cache):
+        scheduler = BatchScheduler(model, tokenizer, max_batch_size=2, prefix_cache=prefix_cache)
+        scheduler.start()
+        try:
+            requests = []
+            for prompt in prompts:
+                request = GenerationRequest(
+                    tokenizer(prompt)["input_ids"],
+                    max_new_tokens=12,
+                    temperature=0.0,
+                    top_p=1.0,
+                    prefix_len=len(system),
+                )
+                scheduler.submit(request)
+                requests.append(request)
+            return ["".join(request.iter_chunks()) for request in requests]
+        finally:
+            scheduler.stop()
+
+    cache = PrefixCache(max_bytes=16 * 1024 * 1024)
+    assert run(cache) == run(None)
+    assert len(cache) == 1
+    assert cache.hits >= len(prompts) - 1
+
+
+def test_stop_fails_queued_and_running_requests(tiny_model, char_tokenizer):
+    scheduler = BatchScheduler(tiny_model, char_tokenizer, max_batch_size=1, max_queue_wait_ms=0)
+    # Never finish on their own
+    scheduler.eos_token_ids = set()
+    scheduler.start()
+    requests = [
+        GenerationRequest(char_tokenizer("def f(x):")["input_ids"], max_new_tokens=10_000, temperature=0.0, top_p=1.0)
+        for _ in range(3)
+    ]
+    for request in requests:
+        scheduler.submit(request)
+    # Wait until the first request is decoding; the others sit in the queue behind it
+    next(requests[0].iter_chunks())
+    scheduler.stop()
+    late = GenerationRequest(char_tokenizer("x")["input_ids"], max_new_tokens=4, temperature=0.0, top_p=1.0)
+    scheduler.submit(late)
+    for request in requests + [late]:
+        with pytest.raises(SchedulerStopped):
+            list(request.iter_chunks())
+        assert request.finish_reason == "error"
+    scheduler._thread.join(5)
+    assert not scheduler._thread.is_alive()
@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from scheduler import BatchScheduler  # noqa: E402
+from service import ModelService  # noqa: E402
+
+
+@pytest.fixture
+def service(tiny_model, char_tokenizer):
+    service = ModelService("tiny", prefix_cache_mb=0)
+    service.tokenizer = char_tokenizer
+    service.model = tiny_model
+    service.scheduler = BatchScheduler(tiny_model, char_tokenizer, max_batch_size=4, max_queue_wait_ms=1)
+    submitted = []
+    submit = service.scheduler.submit
+    service.scheduler.submit = lambda request: (submitted.append(request), submit(request))
+    service.submitted = submitted
+    service.scheduler.start()
+    yield service
+    service.scheduler.stop()
+
+
+PARAMS = dict(max_new_tokens=24, temperature=0.0, top_p=1.0)
+
+
+def test_identical_streams_share_one_generation_even_if_the_leader_leaves(service):
+    expected = "".join(service.stream("def f(x):", **PARAMS))
+    assert len(service.submitted) == 1
+
+    leader = service.stream("def f(x):", **PARAMS)
+    first = next(leader)
+    follower = service.stream("def f(x):", **PARAMS)
+    # The follower replays what the leader already saw, then continues live
+    assert next(follower) == first
+    leader.close()
+    assert first + "".join(follower) == expected
+    assert len(service.submitted) == 2
+    assert service.single_flight.followers == 1
+    assert len(service.single_flight) == 0
+    assert service.submitted[1].finish_reason in ("stop", "length")
+
+
+def test_sampled_requests_are_not_coalesced(service):
+    sampled = dict(PARAMS, temperature=0.8)
+    a = service.stream("def f(x):", **sampled)
+    b = service.stream("def f(x):", **sampled)
+    next(a), next(b)
+    a.close(), b.close()
+    assert len(service.submitted) == 2
+    assert service.single_flight.followers == 0
+
+
+def test_last_subscriber_leaving_cancels_the_generation(service):
+    a = service.stream("print(1)", **dict(PARAMS, max_new_tokens=1000))
+    b = service.stream("print(1)", **dict(PARAMS, max_new_tokens=1000))
+    next(a), next(b)
+    a.close()
+    assert not service.submitted[0].cancelled.is_set()
+    b.close()
+    assert service.submitted[0].cancelled.is_set()
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from generation import GenerationRequest  # noqa: E402
+from scheduler import BatchScheduler  # noqa: E402
+from speculative import DRAFT, PROMPT_LOOKUP, SpeculativeDecoder, prompt_lookup_candidates  # noqa: E402
+
+
+def test_prompt_lookup_candidates_follow_latest_match():
+    context = [5, 6, 7, 8, 9, 5, 6, 7, 10, 5, 6]
+    assert prompt_lookup_candidates(context, 2, 3) == [7, 10]
+    assert prompt_lookup_candidates([1, 2, 3], 2, 3) == []
+
+
+@pytest.mark.parametrize("mode", [DRAFT, PROMPT_LOOKUP])
+def test_greedy_speculative_output_matches_standard_decoding(tiny_model, make_tiny_model, char_tokenizer, mode):
+    decoder = SpeculativeDecoder(
+        tiny_model, char_tokenizer, {1}, draft_model=make_tiny_model(seed=7), num_draft_tokens=4
+    )
+    scheduler = BatchScheduler(tiny_model, char_tokenizer)
+    scheduler.start()
+    try:
+        for prompt in ["abcabcabc def abc", "hello world hello"]:
+            input_ids = char_tokenizer(prompt)["input_ids"]
+            baseline = GenerationRequest(input_ids, max_new_tokens=24, temperature=0.0, top_p=1.0)
+            scheduler.submit(baseline)
+            expected = "".join(baseline.iter_chunks())
+
+            request = GenerationRequest(input_ids, max_new_tokens=24, temperature=0.0, top_p=1.0)
+            decoder.run(request, mode)
+            assert "".join(request.iter_chunks()) == expected
+            assert request.output_ids == baseline.output_ids
+    finally:
+        scheduler.stop()
+    assert decoder.proposed[mode] > 0
+    assert 0.0 <= decoder.acceptance_rate(mode) <= 1.0
+
+
+class CyclingModel:
+    """Model stand-in that greedily continues the cycle 10..15, keeping its context in the KV cache."""
+
+    def __call__(self, input_ids, past_key_values, use_cache=True, logits_to_keep=0):
+        import torch
+
+        ids = input_ids[0].float().view(1, 1, -1, 1)
+        keys, _ = past_key_values.update(ids, ids, 0)
+        seq = keys[0, 0, -input_ids.shape[1]:, 0].long().tolist()
+        logits = torch.zeros(1, len(seq), 256)
+        for i, token in enumerate(seq):
+            logits[0, i, 10 + (token - 9) % 6] = 1.0
+        if logits_to_keep:
+            logits = logits[:, -logits_to_keep:]
+        return type("Outputs", (), {"logits": logits})()
+
+
+def test_prompt_lookup_accepts_candidates_copied_from_the_prompt(char_tokenizer):
+    decoder = SpeculativeDecoder(CyclingModel(), char_tokenizer, {1}, num_draft_tokens=4)
+    request = GenerationRequest(list(range(10, 16)), max_new_tokens=20, temperature=0.0, top_p=1.0)
+    decoder.run(request, PROMPT_LOOKUP)
+    assert request.output_ids == [10 + i % 6 for i in range(20)]
+    # Every proposal continues the cycle, so all of them are accepted
+    assert decoder.proposed[PROMPT_LOOKUP] > 0
+    assert decoder.acceptance_rate(PROMPT_LOOKUP) == 1.0
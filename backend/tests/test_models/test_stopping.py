@@ -0,0 +1,53 @@
+import pytest
+
+from stopping import StopText
+
+
+def _feed_all(stop: StopText, deltas) -> str:
+    out = []
+    for delta in deltas:
+        out.append(stop.feed(delta))
+        if stop.stopped:
+            break
+    return "".join(out) + stop.flush()
+
+
+def test_stop_sequence_spanning_chunks_is_cut_and_never_emitted():
+    stop = StopText(["\n\n#", "END"])
+    emitted = [stop.feed(delta) for delta in ["x = 1", "\n", "\n", "#", " more"]]
+    # "\n" and "\n\n" could be the start of the stop sequence, so they wait
+    assert emitted[:3] == ["x = 1", "", ""]
+    assert stop.stopped and "".join(emitted) == "x = 1"
+
+
+def test_held_back_text_is_released_when_it_stops_matching():
+    stop = StopText(["END"])
+    assert stop.feed("an E") == "an "
+    assert stop.feed("N") == ""
+    assert stop.feed("D?") == ""
+    assert stop.stopped
+    other = StopText(["END"])
+    assert _feed_all(other, ["an E", "Nd", "EN"]) == "an ENdEN"
+    assert not other.stopped
+
+
+def test_code_block_mode_keeps_the_closing_fence():
+    stop = StopText(code_block=True)
+    text = _feed_all(stop, ["Here:\n`", "``python\nprint(1)\n`", "``\nand more text", "```"])
+    assert stop.stopped
+    assert text == "Here:\n```python\nprint(1)\n```"
+
+
+def test_request_stops_decoding_at_a_stop_sequence(char_tokenizer):
+    pytest.importorskip("torch")
+    from generation import GenerationRequest
+
+    # CharTokenizer decodes id i to chr(97 + i % 26)
+    ids = [3 + (ord(c) - 97 - 3) % 26 for c in "hello world"]
+    request = GenerationRequest([5], max_new_tokens=50, temperature=0.0, top_p=1.0, stop=StopText(["lo"]))
+    for token_id in ids:
+        request.add_token(token_id, char_tokenizer, {1})
+    assert request.done and request.finish_reason == "stop"
+    assert "".join(request.iter_chunks()) == "hel"
+    # Nothing past the token that completed the stop sequence was kept
+    assert len(request.output_ids) == 5
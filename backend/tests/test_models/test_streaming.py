@@ -0,0 +1,52 @@
+import asyncio
+import json
+import time
+
+from streaming import encode, token_frames
+
+
+async def _deltas(items, delay=0.0, error=None):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+    if error is not None:
+        raise error
+
+
+def _frames(chunks, **kwargs):
+    async def scenario():
+        usage = kwargs.pop("usage", {})
+        frames = token_frames(chunks, stream_format="ndjson", usage=usage, start=time.perf_counter(), **kwargs)
+        return [json.loads(line) async for line in frames]
+
+    return asyncio.run(scenario())
+
+
+def test_ready_deltas_are_coalesced_and_done_carries_usage():
+    usage = {"model": "m", "prompt_tokens": 3}
+    frames = _frames(_deltas(["a", "b", "c"]), usage=usage, flush_ms=50)
+    assert [f["type"] for f in frames] == ["token", "done"]
+    assert frames[0]["text"] == "abc"
+    done = frames[-1]
+    assert done["model"] == "m" and done["prompt_tokens"] == 3 and done["frames"] == 1
+    assert done["ttft_ms"] is not None and done["duration_ms"] >= done["ttft_ms"]
+
+
+def test_idle_stream_sends_heartbeats_and_errors_end_it():
+    errors = []
+    frames = _frames(
+        _deltas(["x"], delay=0.05, error=RuntimeError("boom")),
+        heartbeat_seconds=0.01,
+        on_error=errors.append,
+    )
+    kinds = [f["type"] for f in frames]
+    assert kinds[0] == "heartbeat"
+    # Text produced before the failure is still delivered, then the error closes the stream
+    assert kinds[-2:] == ["token", "error"] and frames[-1]["detail"] == "boom"
+    assert len(errors) == 1
+
+
+def test_sse_events_are_named_after_the_frame_type():
+    assert encode({"type": "token", "text": "é"}, "sse") == 'event: token\ndata: {"type": "token", "text": "é"}\n\n'
+    assert encode({"type": "heartbeat"}, "ndjson") == '{"type": "heartbeat"}\n'
@@ -0,0 +1,52 @@
+from tokenization import PromptTokenizer
+
+
+class MergingTokenizer:
+    """Like CharTokenizer, but "><" is one token, so the chat turns can't be tokenized apart."""
+
+    def __call__(self, text, add_special_tokens=True):
+        ids = []
+        for c in text:
+            if ids and ids[-1] == 3 + ord(">") and c == "<":
+                ids[-1] = 2
+            else:
+                ids.append(3 + (ord(c) % 250))
+        return {"input_ids": ids}
+
+    def apply_chat_template(self, messages, tokenize=False, add_generation_prompt=False):
+        text = "".join(f"<{m['role']}>{m['content']}</>" for m in messages)
+        return text + "<assistant>" if add_generation_prompt else text
+
+
+def test_system_turn_is_reused_and_matches_full_tokenization(char_tokenizer):
+    prompts = PromptTokenizer(char_tokenizer, model_name="tiny")
+    first = prompts.encode("write a sort", "be brief")
+    second = prompts.encode("write a parser", "be brief")
+    system_ids = prompts.system_prefix_ids("be brief")
+    for prompt in (first, second):
+        assert prompt.input_ids == char_tokenizer(prompt.text)["input_ids"]
+        assert prompt.prefix_len == len(system_ids)
+        assert prompt.input_ids[:prompt.prefix_len] == system_ids
+    assert prompts.encode("write a sort", "be brief") is first
+    assert (prompts.hits, prompts.misses) == (1, 2)
+
+
+def test_boundary_that_merges_falls_back_to_full_tokenization():
+    tokenizer = MergingTokenizer()
+    prompts = PromptTokenizer(tokenizer, model_name="tiny")
+    for user_prompt in ("one", "two"):
+        prompt = prompts.encode(user_prompt, "sys")
+        assert prompt.input_ids == tokenizer(prompt.text)["input_ids"]
+        assert prompt.prefix_len == 0
+
+
+def test_cache_is_bounded_by_tokens(char_tokenizer):
+    prompts = PromptTokenizer(char_tokenizer, model_name="tiny", cache_tokens=100)
+    for i in range(10):
+        prompts.encode(f"prompt number {i}", "sys")
+    assert 0 < prompts.cached_tokens <= 100
+    assert len(prompts) < 10
+    # The most recent prompt is still there, the oldest is gone
+    prompts.encode("prompt number 9", "sys")
+    prompts.encode("prompt number 0", "sys")
+    assert (prompts.hits, prompts.misses) == (1, 11)
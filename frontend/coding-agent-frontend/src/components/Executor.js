@@ -2,7 +2,7 @@ import React, { useState } from 'react';
 import Button from './ui/Button';
 import Editor from '@monaco-editor/react';
 import { useSelector } from 'react-redux';
-import { streamText } from '../services/api';
+import { streamNdjson } from '../services/api';
 
 export default function Executor({ execBase }) {
   const [code, setCode] = useState('print("Hello from sandbox")');
@@ -14,8 +14,16 @@ export default function Executor({ execBase }) {
     setLoading(true);
     setOutput('');
     try {
-      for await (const chunk of await streamText(base + '/execute_code_stream', { code })) {
-        setOutput((prev) => prev + chunk);
+      for await (const event of await streamNdjson(base + '/execute_code_stream', { code })) {
+        if (event.type === 'stdout' || event.type === 'stderr' || event.type === 'output') {
+          setOutput((prev) => prev + event.data);
+        } else if (event.type === 'truncated') {
+          setOutput((prev) => prev + `\n[output truncated after ${event.limit_bytes} bytes]\n`);
+        } else if (event.type === 'exit') {
+          setOutput((prev) => prev + `\nExit code: ${event.exit_code}\n`);
+        } else if (event.type === 'error') {
+          setOutput((prev) => prev + 'Error: ' + event.detail);
+        }
       }
     } catch (e) {
       setOutput('Error: ' + e.message);
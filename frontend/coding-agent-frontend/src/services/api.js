@@ -41,3 +41,21 @@ export async function streamText(url, body) {
 }
 
 
+
+export async function streamNdjson(url, body) {
+  const chunks = await streamText(url, body);
+  return {
+    async *[Symbol.asyncIterator]() {
+      let buffer = '';
+      for await (const chunk of chunks) {
+        buffer += chunk;
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (const line of lines) {
+          if (line.trim()) yield JSON.parse(line);
+        }
+      }
+      if (buffer.trim()) yield JSON.parse(buffer);
+    },
+  };
+}